@@ -3,7 +3,6 @@ the statisically most likely pitch vectors and durations,
 based upon analysis of a corpus of works.
 """
 from midiutil.MidiFile import MIDIFile # type: ignore
-from mido import MidiFile
 
 from pprint import pprint
 
@@ -16,10 +15,8 @@ for file in os.listdir(os.path.join("case_base", "cello_suites")):
     if file.endswith("mid"):
         filename = os.path.join("case_base", "cello_suites", file)
     print(filename)
-    midi_file = MidiFile(filename)
-    for track in midi_file.tracks:
-        graph = Graph.from_midi_track(track)
-        graphs.append(graph)
+    for notes in read_midi_file(filename):
+        graphs.append(Graph.from_note_arrays(notes))
 
 print("case base contains ", len(graphs), "sequences")
 
@@ -10,11 +10,11 @@ Altering the position of the pitch wheel transposes the music +/- of the neutral
 from composerstoolkit import *
 
 pf = pitches.PitchFactory()
-init_midi()
 
 MIDI_CONTROLLER_NAME = "V61"
 
-midi_in = MidiInputBus(midi_device = get_midi_device_id(MIDI_CONTROLLER_NAME))
+midi_in = MidiInputStream(
+    get_port=lambda port_names: [n.startswith(MIDI_CONTROLLER_NAME) for n in port_names].index(True))
 
 def my_gate1(context = lambda: Context.get_context()):
     return 40 in midi_in.active_notes
@@ -55,4 +55,5 @@ mysequencer = Context.get_context().new_sequencer(bpm=80, debug=False)\
         modal_quantize(scales.mode("Ab", scales.MAJOR)),
         my_gate2))
 
-mysequencer.playback()
+with midi_in:
+    mysequencer.playback()
@@ -1,2 +1,3 @@
 from . mining import *
-from . statistical import *
\ No newline at end of file
+from . statistical import *
+from . markov import *
\ No newline at end of file
@@ -0,0 +1,206 @@
+"""Markov tables of order n, counted over the vertices of one or more
+pitch graphs (eg a corpus of MIDI files).
+"""
+from __future__ import annotations
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+import os
+from typing import Iterable, List, Optional, Tuple, Union
+
+import numpy as np
+
+from ..core import Graph, read_midi_file
+
+# the number of symbols in each alphabet
+ALPHABETS = {
+    "pitch_class": 12,
+    "pitch": 128,
+    # pitch intervals of -127...127 semitones
+    "interval": 255
+}
+
+# the largest number of possible codes that are counted with a dense bincount
+_MAX_DENSE_COUNTS = 1 << 22
+# codes of this many possible values (or more) would overflow int64
+_MAX_INT64_CODES = 1 << 63
+
+@dataclass
+class MarkovTable:
+    """Sparse transition counts for a Markov table of a given order.
+    Each context (the previous `order` symbols) and following symbol
+    is encoded as a single integer code:
+        context[0] * size ** order + ... + context[-1] * size + symbol
+    codes is sorted, and counts holds the number of times that each code was seen.
+    For the interval alphabet, symbols are the interval + 127.
+    If size ** (order + 1) does not fit in int64, codes is an array of python ints
+    (dtype object).
+    """
+    alphabet: str
+    order: int
+    codes: np.ndarray
+    counts: np.ndarray
+
+    @property
+    def size(self) -> int:
+        """The number of symbols in the alphabet.
+        """
+        return ALPHABETS[self.alphabet]
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        """The shape of the dense table (n contexts, n symbols).
+        """
+        return (self.size ** self.order, self.size)
+
+    def __add__(self, other: MarkovTable) -> MarkovTable:
+        if (self.alphabet, self.order) != (other.alphabet, other.order):
+            raise Exception("Only Markov tables with the same alphabet and order can be added")
+        codes, counts = _sum_counts(
+            np.concatenate((self.codes, other.codes)),
+            np.concatenate((self.counts, other.counts)))
+        return MarkovTable(self.alphabet, self.order, codes, counts)
+
+    def contexts(self) -> np.ndarray:
+        """Return the contexts of each code, as an array of shape (n codes, order).
+        """
+        contexts = np.zeros((len(self.codes), self.order), dtype=np.int64)
+        remainder = self.codes // self.size
+        for i in reversed(range(self.order)):
+            # (not np.divmod, which does not support codes of python ints)
+            remainder, contexts[:, i] = remainder // self.size, remainder % self.size
+        return contexts
+
+    def symbols(self) -> np.ndarray:
+        """Return the following symbol of each code.
+        """
+        return self.codes % self.size
+
+    def probabilities(self) -> np.ndarray:
+        """Return the probability of each code, given its context.
+        """
+        rows = self.codes // self.size
+        _, inverse = np.unique(rows, return_inverse=True)
+        totals = np.bincount(inverse, weights=self.counts)
+        return self.counts / totals[inverse]
+
+    def to_dense(self, probabilities: bool = False) -> np.ndarray:
+        """Return the table as a dense array of shape (n contexts, n symbols).
+        n.b. this has size ** (order + 1) entries.
+        """
+        values = self.probabilities() if probabilities else self.counts
+        table = np.zeros(self.size ** (self.order + 1), dtype=values.dtype)
+        table[self.codes] = values
+        return table.reshape(self.shape)
+
+def _sum_counts(codes: np.ndarray, counts: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    unique, inverse = np.unique(codes, return_inverse=True)
+    return unique, np.bincount(inverse, weights=counts, minlength=len(unique)).astype(np.int64)
+
+def _paths(indptr: np.ndarray, indices: np.ndarray, length: int) -> np.ndarray:
+    """Return every path of `length` edges through the graph,
+    following its vertices, as an array of shape (n paths, length).
+    """
+    degrees = np.diff(indptr)
+    paths = np.arange(len(degrees)).reshape(-1, 1)
+    for _ in range(length - 1):
+        last = paths[:, -1]
+        n_next = degrees[last]
+        paths = np.repeat(paths, n_next, axis=0)
+        # positions of each path's next edges within indices
+        steps = np.arange(len(paths)) - np.repeat(np.cumsum(n_next) - n_next, n_next)
+        following = indices[np.repeat(indptr[last], n_next) + steps]
+        paths = np.column_stack((paths, following))
+    return paths
+
+def count_transitions(
+    pitches: np.ndarray,
+    indptr: np.ndarray,
+    indices: np.ndarray,
+    order: int = 1,
+    alphabet: str = "pitch_class") -> Tuple[np.ndarray, np.ndarray]:
+    """Count the order-n transitions in a single graph, given as arrays
+    (the pitch of each edge, and its CSR adjacency - see Graph.adjacency).
+    Return (codes, counts) - see MarkovTable.
+    """
+    size = ALPHABETS[alphabet]
+    pitches = np.asarray(pitches, dtype=np.int64)
+    if alphabet == "interval":
+        paths = _paths(indptr, indices, order + 2)
+        path_pitches = pitches[paths]
+        symbols = np.diff(path_pitches, axis=1) + 127
+    else:
+        paths = _paths(indptr, indices, order + 1)
+        symbols = pitches[paths] % size
+    if size ** (order + 1) >= _MAX_INT64_CODES:
+        # the codes would overflow int64, so use python ints
+        symbols = symbols.astype(object)
+        codes = np.zeros(len(symbols), dtype=object)
+    else:
+        codes = np.zeros(len(symbols), dtype=np.int64)
+    for i in range(symbols.shape[1]):
+        codes = codes * size + symbols[:, i]
+    if size ** (order + 1) > _MAX_DENSE_COUNTS:
+        # too many possible codes to count them in a dense array
+        return np.unique(codes, return_counts=True)
+    counts = np.bincount(codes)
+    codes = np.flatnonzero(counts)
+    return codes, counts[codes]
+
+def _graph_arrays(graph: Graph) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    indptr, indices = graph.adjacency
+    return graph.pitches.astype(np.int64), indptr, indices
+
+def _count_source(source, order: int, alphabet: str) -> Tuple[np.ndarray, np.ndarray]:
+    """Count the transitions in a graph's arrays, or all tracks of a MIDI file.
+    (Run in a worker process.)
+    """
+    if isinstance(source, tuple):
+        return count_transitions(*source, order=order, alphabet=alphabet)
+    codes: List[np.ndarray] = []
+    counts: List[np.ndarray] = []
+    for notes in read_midi_file(source):
+        track_codes, track_counts = count_transitions(
+            *_graph_arrays(Graph.from_note_arrays(notes)),
+            order=order,
+            alphabet=alphabet)
+        codes.append(track_codes)
+        counts.append(track_counts)
+    if not codes:
+        return np.array([], dtype=np.int64), np.array([], dtype=np.int64)
+    return _sum_counts(np.concatenate(codes), np.concatenate(counts))
+
+def build_markov_table(
+    sources: Iterable[Union[Graph, str, os.PathLike]],
+    order: int = 1,
+    alphabet: str = "pitch_class",
+    n_workers: Optional[int] = None,
+    chunksize: int = 16) -> MarkovTable:
+    """Build a Markov table of the given order from the vertices of many graphs.
+    sources - pitch graphs, or paths of MIDI files (all tracks of which are used).
+    order - the number of previous symbols that make up each context.
+    alphabet - "pitch_class", "pitch" or "interval"
+    n_workers - the number of processes to count the sources in. Defaults to
+    counting in the current process.
+    """
+    if alphabet not in ALPHABETS:
+        raise Exception(f"Unknown alphabet {alphabet}. Expected one of {list(ALPHABETS)}")
+    if order < 1:
+        raise Exception("build_markov_table() order should be 1 or greater")
+    prepared = [_graph_arrays(s) if isinstance(s, Graph) else s for s in sources]
+    if n_workers is None or n_workers <= 1:
+        results = [_count_source(s, order, alphabet) for s in prepared]
+    else:
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            results = list(executor.map(
+                _count_source,
+                prepared,
+                [order] * len(prepared),
+                [alphabet] * len(prepared),
+                chunksize=chunksize))
+    codes = [codes for codes, _ in results]
+    counts = [counts for _, counts in results]
+    if not codes:
+        return MarkovTable(alphabet, order,
+            np.array([], dtype=np.int64), np.array([], dtype=np.int64))
+    codes, counts = _sum_counts(np.concatenate(codes), np.concatenate(counts))
+    return MarkovTable(alphabet, order, codes, counts)
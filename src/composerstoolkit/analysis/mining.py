@@ -1,12 +1,71 @@
 from collections import Counter
-import itertools
-from typing import List, Any, Tuple, Set
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import os
+from typing import Callable, Dict, List, Any, Optional, Tuple, Set
 
+import numpy as np
 from prefixspan import PrefixSpan
 
 from ..core import Graph, FiniteSequence, Sequencer, Event, Sequence
 from ..builders.transformers import *
 
+def _encode_symbols(dataset: List[Any]) -> np.ndarray:
+    """Replace each item of dataset with its rank amongst the distinct
+    items, so that comparing the codes orders them like the items themselves.
+    (Items only need to be comparable, not hashable.)
+    """
+    order = sorted(range(len(dataset)), key=lambda i: dataset[i])
+    codes = np.zeros(len(dataset), dtype=np.int64)
+    rank = 0
+    for previous, i in zip([None] + order[:-1], order):
+        if previous is not None and dataset[previous] != dataset[i]:
+            rank = rank + 1
+        codes[i] = rank
+    return codes
+
+def _suffix_array(codes: np.ndarray) -> np.ndarray:
+    """Return the start positions of the suffixes of codes,
+    in lexicographic order (prefix doubling, O(n log^2 n)).
+    """
+    n = len(codes)
+    sa = np.argsort(codes, kind="stable")
+    rank = np.zeros(n, dtype=np.int64)
+    rank[sa] = np.concatenate(([0], np.cumsum(codes[sa][1:] != codes[sa][:-1])))
+    k = 1
+    while n > 0 and rank[sa[-1]] < n - 1:
+        # rank of the suffix k positions along (-1 past the end)
+        following = np.full(n, -1, dtype=np.int64)
+        following[:n - k] = rank[k:]
+        sa = np.lexsort((following, rank))
+        is_new = (rank[sa][1:] != rank[sa][:-1]) | (following[sa][1:] != following[sa][:-1])
+        rank[sa] = np.concatenate(([0], np.cumsum(is_new)))
+        k = k * 2
+    return sa
+
+def _lcp_array(codes: np.ndarray, sa: np.ndarray) -> np.ndarray:
+    """Return the length of the longest common prefix of each suffix in sa
+    and the one before it (Kasai's algorithm, O(n)). lcp[0] is 0.
+    """
+    n = len(codes)
+    symbols = codes.tolist()
+    suffixes = sa.tolist()
+    rank = [0] * n
+    for i, suffix in enumerate(suffixes):
+        rank[suffix] = i
+    lcp = [0] * n
+    h = 0
+    for i in range(n):
+        if rank[i] == 0:
+            h = 0
+            continue
+        j = suffixes[rank[i] - 1]
+        while i + h < n and j + h < n and symbols[i + h] == symbols[j + h]:
+            h = h + 1
+        lcp[rank[i]] = h
+        if h > 0:
+            h = h - 1
+    return np.array(lcp, dtype=np.int64)
+
 def common_subsequences(
     dataset: List[Any],
     min_match_len = 3,
@@ -17,46 +76,254 @@ def common_subsequences(
     list dataset.
     Return a list of (count, subsequence), most
     frequent first.
-    """
-    results = []
-
-    def _count_occurrences(sublist, parent):
-        return sum(parent[i:i+len(sublist)]==\
-            sublist for i in range(len(parent)))
 
+    A pattern is counted from its first occurrence (which must
+    start before len(dataset) - max_match_len), along with every
+    later occurrence that starts after the first one ends.
+    Patterns are found with a suffix array, so datasets of
+    100k+ items can be searched.
+    """
     if max_match_len > len(dataset) > 1:
         raise Exception("max_match_len cannot be > len(dataset)")
+    n = len(dataset)
+    last_start = n - max_match_len
+    if last_start <= 0:
+        return []
 
-    for i1 in range(len(dataset) - max_match_len):
-        previous = None
-        for i2 in range(min_match_len, max_match_len):
-            head = dataset[i1:i1 + i2]
-            tail = dataset[i1 + i2:]
-            count = _count_occurrences(head, tail)
-            if head not in results:
-                results = results + [head for i in range(count + 1)]
-
-    results = [list(j) for i, j in itertools.groupby(sorted(results))]
-    results = [(len(seq), seq[0]) for seq in results]
-    results = filter(lambda r: r[0] > 1, results)
+    codes = _encode_symbols(dataset)
+    sa = _suffix_array(codes)
+    lcp = _lcp_array(codes, sa)
+    suffix_lengths = n - sa
+
+    found = []
+    for length in range(min_match_len, max_match_len):
+        # suffixes that share a prefix of this length are adjacent in the suffix array
+        has_pattern = suffix_lengths >= length
+        groups = np.cumsum(lcp < length)
+        group_ids, group_starts = np.unique(groups[has_pattern], return_index=True)
+        group_starts = np.flatnonzero(has_pattern)[group_starts]
+        # the first occurrence of each pattern
+        first = np.full(groups[-1] + 1, n, dtype=np.int64)
+        np.minimum.at(first, groups[has_pattern], sa[has_pattern])
+        is_later = has_pattern & (sa >= first[groups] + length)
+        counts = 1 + np.bincount(groups[is_later], minlength=len(first))
+        first = first[group_ids]
+        counts = counts[group_ids]
+        keep = (first < last_start) & (counts > 1)
+        for sa_index, start, count in zip(
+            group_starts[keep].tolist(),
+            first[keep].tolist(),
+            counts[keep].tolist()):
+            found.append((sa_index, length, count, start))
+
+    # lexicographic order of the patterns, then most frequent first
+    found.sort()
+    results = [(count, dataset[start:start + length])
+        for _, length, count, start in found]
     results = sorted(results,
         key=lambda m: m[0], reverse=True)
     return results
 
+def _mine_shard(shard: List[Any], depth: int, min_support: Optional[int]) -> List[Tuple[int, List[Any]]]:
+    """Mine the patterns of a single shard.
+    (Run in a worker process.)
+    """
+    if min_support is None:
+        return PrefixSpan(shard).topk(depth)
+    return PrefixSpan(shard).frequent(min_support)
+
+def _contains(sequence: List[Any], pattern: Tuple[Any, ...]) -> bool:
+    items = iter(sequence)
+    return all(item in items for item in pattern)
+
+def _count_shard(shard: List[Any], patterns: List[Tuple[Any, ...]]) -> List[int]:
+    """Count the number of sequences in shard that contain each pattern.
+    (Run in a worker process.)
+    """
+    return [sum(1 for sequence in shard if _contains(sequence, pattern))
+        for pattern in patterns]
+
+def _run_sharded(executor, func, tasks, progress, progress_state):
+    """Run func(*args) for the args of each task in the executor,
+    reporting progress as each finishes.
+    Return (the result of each task, or None for tasks that did not complete,
+    and whether the run was stopped by the progress callback).
+    """
+    futures = {executor.submit(func, *args): i for i, args in enumerate(tasks)}
+    results: List[Any] = [None] * len(tasks)
+    for future in as_completed(futures):
+        results[futures[future]] = future.result()
+        progress_state[0] = progress_state[0] + 1
+        if progress is not None and progress(*progress_state) is False:
+            # the pending tasks are cancelled when the executor is shut down
+            return results, True
+    return results, False
+
 def hidden_subsequences(
     dataset: List[Any],
-    depth=4):
+    depth=4,
+    n_shards: Optional[int] = None,
+    n_workers: Optional[int] = None,
+    min_support: Optional[int] = None,
+    progress: Optional[Callable[[int, int], Optional[bool]]] = None):
     """
     Catalog frequent hidden sequences within
     dataset. (A wrapper around PrefixSpan).
     Return a list of (count, subsequence), longest
     matches first.
+
+    By default the depth most frequent patterns are mined in-process.
+    If n_shards or n_workers are given, the dataset is partitioned into
+    shards which are mined in worker processes, and the candidate patterns
+    are then recounted over the whole dataset, so the counts are exact:
+    min_support - return every pattern occurring in at least min_support
+        sequences (rather than the depth most frequent)
+    progress - called with (n tasks done, n tasks) as each shard completes.
+        If it returns False, mining stops early, and the candidates found so
+        far are returned with the counts from the completed shards
+        (which may be underestimates).
+    If the support of the patterns is so low that a shard would have to
+    list every one of its subsequences, the dataset is mined in-process instead.
     """
-    ps = PrefixSpan(dataset)
-    detected = ps.topk(depth)
+    if n_shards is None and n_workers is None:
+        return _mine_in_process(dataset, depth, min_support)
+
+    if n_workers is None:
+        n_workers = os.cpu_count() or 1
+    if n_shards is None:
+        n_shards = n_workers
+    n_shards = max(1, min(n_shards, len(dataset)))
+    shard_size = -(-len(dataset) // n_shards)
+    shards = [dataset[i:i + shard_size] for i in range(0, len(dataset), shard_size)]
+    # the executor is not used as a context manager, as that would
+    # wait for any running shards if mining is stopped early
+    executor = ProcessPoolExecutor(max_workers=n_workers)
+    try:
+        return _mine_shards(executor, dataset, shards, depth, min_support, progress)
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+def _mine_shards(executor, dataset, shards, depth, min_support, progress):
+    """The sharded part of hidden_subsequences.
+    """
+    # each shard is mined, and then recounted
+    progress_state = [0, len(shards) * 2]
+
+    def local_support(shard, support):
+        # a pattern that is below this threshold in every shard
+        # cannot reach support over the whole dataset
+        return max(1, -(-support * len(shard) // len(dataset)))
+
+    threshold = min_support
+    if threshold is None:
+        # find a lower bound for the support of the top depth patterns,
+        # from the exact counts of each shard's own top patterns
+        progress_state[1] = len(shards) * 4
+        mined, stopped = _run_sharded(executor, _mine_shard,
+            [(shard, depth, None) for shard in shards], progress, progress_state)
+        if stopped:
+            return _merge_partial(mined, depth)
+        candidates = sorted({tuple(p) for found in mined for _, p in found})
+        counts, stopped = _run_sharded(executor, _count_shard,
+            [(shard, candidates) for shard in shards], progress, progress_state)
+        if stopped:
+            return _merge_partial(mined, depth)
+        totals = sorted((sum(c) for c in zip(*counts)), reverse=True)
+        threshold = totals[min(depth, len(totals)) - 1] if totals else 1
+
+    local_thresholds = [local_support(shard, threshold) for shard in shards]
+    if min(local_thresholds) <= 1:
+        # every subsequence of a shard would be a candidate, which is far
+        # slower than mining the whole dataset at once
+        return _mine_in_process(dataset, depth, min_support)
+    # every pattern with support >= threshold is frequent in at least one shard
+    mined, stopped = _run_sharded(executor, _mine_shard,
+        [(shard, depth, t) for shard, t in zip(shards, local_thresholds)],
+        progress, progress_state)
+    if stopped:
+        return _merge_partial(mined, depth if min_support is None else None)
+    candidates = sorted({tuple(p) for found in mined for _, p in found})
+    counts, stopped = _run_sharded(executor, _count_shard,
+        [(shard, candidates) for shard in shards], progress, progress_state)
+    if stopped:
+        return _merge_partial(mined, depth if min_support is None else None)
+
+    totals = [sum(c) for c in zip(*counts)]
+    detected = [(total, list(pattern)) for total, pattern in zip(totals, candidates)
+        if total >= threshold]
+    # most frequent first, ties in order of pattern
+    detected = sorted(detected, key=lambda x: x[0], reverse=True)
+    if min_support is None:
+        detected = detected[:depth]
     detected = sorted(detected, key=lambda x: len(x[1]), reverse=True)
     return detected
 
+def _mine_in_process(dataset: List[Any], depth: int, min_support: Optional[int]):
+    if min_support is not None:
+        detected = PrefixSpan(dataset).frequent(min_support)
+    else:
+        detected = PrefixSpan(dataset).topk(depth)
+    return sorted(detected, key=lambda x: len(x[1]), reverse=True)
+
+def _merge_partial(mined, depth: Optional[int]) -> List[Tuple[int, List[Any]]]:
+    """Combine the (local) counts of the shards that completed mining.
+    """
+    totals: Dict[Tuple[Any, ...], int] = {}
+    for found in mined:
+        for count, pattern in found or []:
+            totals[tuple(pattern)] = totals.get(tuple(pattern), 0) + count
+    detected = sorted(((count, list(pattern)) for pattern, count in sorted(totals.items())),
+        key=lambda x: x[0], reverse=True)
+    if depth is not None:
+        detected = detected[:depth]
+    return sorted(detected, key=lambda x: len(x[1]), reverse=True)
+
+# the number of bits set in each 12 bit pitch class mask
+_POPCOUNT = np.array([bin(i).count("1") for i in range(1 << 12)], dtype=np.int64)
+
+def _pitch_class_mask(pitches) -> int:
+    mask = 0
+    for pitch in pitches:
+        mask = mask | (1 << (pitch % 12))
+    return mask
+
+def _window_masks(seq: FiniteSequence, window_size_beats) -> np.ndarray:
+    """Return the pitch class mask of each window of the sequence,
+    up to (not including) the first window that contains no events.
+    A window [start, start + window_size_beats) contains each event that
+    starts within it, or that is still sounding at its start.
+    """
+    durations = np.array(seq.durations, dtype=np.float64)
+    ends = np.cumsum(durations)
+    onsets = ends - durations
+    event_masks = np.array([_pitch_class_mask(e.pitches) for e in seq.events], dtype=np.int64)
+    # the number of events so far that contain each pitch class
+    has_pitch_class = (event_masks[:, None] >> np.arange(12)) & 1
+    cumulative = np.vstack((np.zeros((1, 12), dtype=np.int64), np.cumsum(has_pitch_class, axis=0)))
+
+    if window_size_beats is None:
+        first = np.array([0])
+        last = np.array([len(seq)])
+    else:
+        window_starts = []
+        curr_time = 0
+        total_duration = seq.duration
+        while curr_time <= total_duration:
+            window_starts.append(curr_time)
+            curr_time = curr_time + window_size_beats
+        window_starts = np.array(window_starts, dtype=np.float64)
+        window_ends = window_starts + window_size_beats
+        first = np.minimum(
+            np.searchsorted(ends, window_starts, side="right"),
+            np.searchsorted(onsets, window_starts, side="left"))
+        last = np.searchsorted(onsets, window_ends, side="left")
+    is_empty = last <= first
+    if is_empty.any():
+        n_windows = int(np.argmax(is_empty))
+        first, last = first[:n_windows], last[:n_windows]
+    present = (cumulative[last] - cumulative[first]) > 0
+    return present @ (1 << np.arange(12))
+
 def chordal_analysis(seq: FiniteSequence,
     chord_lexicon=List[Set],
     overlap_threshold=0,
@@ -68,61 +335,49 @@ def chordal_analysis(seq: FiniteSequence,
     In the case of ambiguity, resort to
     the best voice-leading solution.
     Return a list of transposed chord voicings.
+
+    Each window, and each chord in the lexicon, is
+    represented as a 12 bit pitch class mask, so all
+    windows are matched against the lexicon at once.
     """
-    slices = []
-    # segement the source sequence, if required
-    if window_size_beats is None:
-        window_size_beats = len(seq)
-        slices = [seq]
-    else:
-        curr_time = 0
-        while curr_time <= seq.duration:
-            slices.append(seq.time_slice(
-                curr_time, curr_time +  window_size_beats))
-            curr_time = curr_time + window_size_beats
-    found_chords = []
+    window_masks = _window_masks(seq, window_size_beats)
+    if len(window_masks) == 0:
+        return []
+    chord_masks = np.array([_pitch_class_mask(chord) for chord in chord_lexicon], dtype=np.int64)
+    chord_sizes = np.array([len(chord) for chord in chord_lexicon], dtype=np.int64)
+
+    # the chord notes missing from each window (n windows, n chords)
+    n_missing = _POPCOUNT[chord_masks[None, :] & ~window_masks[:, None] & 0xFFF]
+    # provide an arbitary weighting, based on
+    # the size of the chord and the degree
+    # of ambiguity
+    metrics = np.where(n_missing <= overlap_threshold, chord_sizes + n_missing, -1)
+
+    # the voice-leading cost from a chord to each chord in the lexicon,
+    # computed once per chord as it is needed
+    chords = [Event(list(chord)) for chord in chord_lexicon]
+    movement_costs: Dict[int, np.ndarray] = {}
 
-    # find candidate pcs that best intersects the pcs of each seq
-    for i,slice in enumerate(slices):
-        if len(slice) == 0:
-            break
-
-        pcs = slice.to_pitch_class_set()
-        candidate_chords = []
-        for chord in chord_lexicon:
-            diff = chord.difference(pcs)
-
-            if len(diff) <= overlap_threshold:
-                # provide an arbitary weighting, based on
-                # the size of the chord and the degree
-                # of ambiguity
-                metric = len(chord) + len(diff)
-                candidate_chords.append((metric, chord))
-        # sorted, most likely first
-        candidate_chords = sorted(
-            candidate_chords, key=lambda c: c[0], reverse=True)
-
-        if len(candidate_chords) == 0:
+    def costs_from(i: int) -> np.ndarray:
+        if i not in movement_costs:
+            movement_costs[i] = np.array([chords[i].movement_cost_to(chord) for chord in chords]) \
+                if i < len(chords) else np.zeros(len(chords), dtype=np.int64)
+        return movement_costs[i]
+
+    found_chords = []
+    previous = len(chords)
+    for i, window_metrics in enumerate(metrics):
+        best_metric = window_metrics.max() if len(window_metrics) else -1
+        if best_metric < 0:
             # could not find a match
-            candidate_chords = [(0, set())]
-        if i == 0:
-            found_chords.append(candidate_chords[0][1])
+            previous = len(chords)
+            found_chords.append(set())
             continue
-        # Now select the best candidate based on lowest
-        # cost voice-leading
-        weighted_options = []
-        previous = found_chords[-1]
-
-        for weighting, chord in candidate_chords:
-            mov_cost = Event(list(previous))\
-                .movement_cost_to(Event(list(chord)))
-            if mov_cost > 0:
-                weighted_options.append((weighting * 1/mov_cost, chord))
-            else:
-                weighted_options.append((weighting, chord))
-
-        # the head of the list is the best choice
-        cost, chord = weighted_options[0]
-        found_chords.append(chord)
-
+        # the most likely chords, in lexicon order
+        candidates = np.flatnonzero(window_metrics == best_metric)
+        if i > 0:
+            # select the best candidate based on lowest cost voice-leading
+            candidates = candidates[np.argsort(costs_from(previous)[candidates], kind="stable")]
+        previous = int(candidates[0])
+        found_chords.append(chord_lexicon[previous])
     return found_chords
@@ -1,14 +1,263 @@
-from typing import Tuple, Set
+from collections import Counter, deque
+from time import time
+from typing import Callable, Deque, Dict, Iterable, List, Optional, Tuple, Set, Union
 
-from ..core import Graph, FiniteSequence
+import numpy as np
+
+from ..core import Graph, Event, FiniteSequence, Playback, Transformer
 
 def pitch_range(seq: FiniteSequence) -> Tuple[int, int]:
     pitches = seq.pitches
-    pitches = sorted(pitches)
-    return (pitches[0], pitches[-1])
+    return (min(pitches), max(pitches))
 
 def total_duration(seq: FiniteSequence) -> int:
     return sum(seq.durations)
 
 def duration_classes(seq: FiniteSequence) -> Set[int]:
     return set(seq.durations)
+
+def _as_graphs(graphs: Union[Graph, Iterable[Graph]]) -> List[Graph]:
+    if isinstance(graphs, Graph):
+        return [graphs]
+    return list(graphs)
+
+def pitch_class_histogram(
+    graphs: Union[Graph, Iterable[Graph]],
+    weighted: bool = False) -> np.ndarray:
+    """Return the number of edges of each pitch class, over one or more graphs,
+    as an array of 12 counts. If weighted, each edge is counted by its
+    duration (open edges are not counted).
+    """
+    histogram = np.zeros(12, dtype=np.float64 if weighted else np.int64)
+    for graph in _as_graphs(graphs):
+        if len(graph) == 0:
+            continue
+        pitch_classes = graph.pitches.astype(np.int64) % 12
+        weights = None
+        if weighted:
+            weights = np.nan_to_num(graph.end_times - graph.start_times)
+        histogram += np.bincount(pitch_classes, weights=weights, minlength=12)\
+            .astype(histogram.dtype)
+    return histogram
+
+def interval_distribution(graphs: Union[Graph, Iterable[Graph]]) -> Tuple[np.ndarray, np.ndarray]:
+    """Return the pitch intervals of every vertex, over one or more graphs,
+    as arrays (intervals, counts), in ascending order of interval.
+    """
+    deltas = [graph.get_vector_arrays()[2] for graph in _as_graphs(graphs)]
+    deltas = [d for d in deltas if len(d)]
+    if not deltas:
+        return np.array([], dtype=np.int64), np.array([], dtype=np.int64)
+    return np.unique(np.concatenate(deltas).astype(np.int64), return_counts=True)
+
+def density(graph: Graph, resolution: float = 1) -> Tuple[np.ndarray, np.ndarray]:
+    """Return the number of edges sounding at each multiple of resolution,
+    from time 0 up to the end of the graph, as arrays (times, counts).
+    An edge sounds at time t if start_time <= t < end_time. Open edges
+    sound until the end of the graph.
+    """
+    if len(graph) == 0:
+        return np.array([], dtype=np.float64), np.array([], dtype=np.int64)
+    starts = graph.start_times.astype(np.float64)
+    ends = graph.end_times
+    finite_ends = ends[~np.isnan(ends)]
+    horizon = max(starts.max(), finite_ends.max() if len(finite_ends) else 0)
+    n_times = int(np.floor(horizon / resolution)) + 1
+    # the first and last + 1 sample sounding in each edge
+    first = np.clip(np.ceil(starts / resolution), 0, n_times).astype(np.int64)
+    last = np.where(np.isnan(ends), n_times,
+        np.clip(np.ceil(np.nan_to_num(ends) / resolution), 0, n_times)).astype(np.int64)
+    sounding = first < last
+    changes = np.bincount(first[sounding], minlength=n_times + 1)\
+        - np.bincount(last[sounding], minlength=n_times + 1)
+    return np.arange(n_times) * resolution, np.cumsum(changes)[:n_times]
+
+class Accumulator:
+    """Base class for statistics that are collected one event at a time,
+    so that they can be kept up to date on an infinite Sequence
+    (see monitor and StatisticsObserver).
+    """
+
+    def update(self, event: Event):
+        """Add a single event (a note, chord or rest) to the statistics.
+        """
+        raise NotImplementedError("update")
+
+    def update_all(self, events: Iterable[Event]):
+        """Add each of events in turn. Returns self, eg
+            PitchRange().update_all(seq.events).range
+        """
+        for event in events:
+            self.update(event)
+        return self
+
+class PitchRange(Accumulator):
+    """The lowest and highest pitch seen so far.
+    Both are None until the first pitched event.
+    """
+
+    def __init__(self):
+        self.lowest: Optional[int] = None
+        self.highest: Optional[int] = None
+
+    def update(self, event: Event):
+        if not event.pitches:
+            return
+        lowest = min(event.pitches)
+        highest = max(event.pitches)
+        if self.lowest is None or lowest < self.lowest:
+            self.lowest = lowest
+        if self.highest is None or highest > self.highest:
+            self.highest = highest
+
+    @property
+    def range(self) -> Tuple[Optional[int], Optional[int]]:
+        """(lowest, highest), as for pitch_range.
+        """
+        return (self.lowest, self.highest)
+
+class DurationHistogram(Accumulator):
+    """The number of events (including rests) of each duration,
+    and their total duration.
+    """
+
+    def __init__(self):
+        self.counts: Counter = Counter()
+        self.total = 0
+
+    def update(self, event: Event):
+        self.counts[event.duration] += 1
+        self.total = self.total + event.duration
+
+    def classes(self) -> Set[int]:
+        """The distinct durations seen so far, as for duration_classes.
+        """
+        return set(self.counts)
+
+class IntervalHistogram(Accumulator):
+    """The number of times each melodic interval has been seen,
+    between the highest pitches of consecutive pitched events.
+    (The intervals within a chord are not counted.)
+    Rests are skipped over.
+    """
+
+    def __init__(self):
+        self.counts: Counter = Counter()
+        self.last_pitch: Optional[int] = None
+
+    def update(self, event: Event):
+        if not event.pitches:
+            return
+        pitch = max(event.pitches)
+        if self.last_pitch is not None:
+            self.counts[pitch - self.last_pitch] += 1
+        self.last_pitch = pitch
+
+class PitchClassDistribution(Accumulator):
+    """The number of times each pitch class has been heard.
+    If weighted, each pitch is counted by the duration of its event.
+    """
+
+    def __init__(self, weighted: bool = False):
+        self.weighted = weighted
+        self.counts: List[float] = [0] * 12
+
+    def update(self, event: Event):
+        weight = event.duration if self.weighted else 1
+        for pitch in event.pitches:
+            self.counts[pitch % 12] += weight
+
+    def distribution(self) -> List[float]:
+        """Return the counts normalised to sum to 1.
+        """
+        total = sum(self.counts)
+        if total == 0:
+            return [0] * 12
+        return [count / total for count in self.counts]
+
+@Transformer
+def monitor(seq, *accumulators: Accumulator):
+    """Pass the events of seq through unchanged, updating each
+    accumulator as the event is evaluated. eg
+        pitches = PitchRange()
+        seq = seq.transform(monitor(pitches))
+    """
+    for event in seq.events:
+        for accumulator in accumulators:
+            accumulator.update(event)
+        yield event
+
+class _Onset:
+    """The notes that started together, for StatisticsObserver.
+    """
+    __slots__ = ("time", "pitches", "n_sounding", "end_time")
+
+    def __init__(self, time_started: float):
+        self.time = time_started
+        self.pitches: List[int] = []
+        self.n_sounding = 0
+        self.end_time = time_started
+
+class StatisticsObserver(Playback):
+    """Update accumulators from the notes performed by a Scheduler
+    (see Scheduler.subscribe), eg to monitor live playback.
+    Notes that start together (within onset_tolerance) are presented to the
+    accumulators as a single chord Event, once they have all ended, with the
+    performed duration (in beats) of the longest. Chords are presented in the
+    order that they started, so a held note delays the notes that follow it.
+    Optional args:
+        track - only observe this track (defaults to all tracks)
+        bpm - int (default 120)
+        playback_rate - defaults to 1
+        clock - function returning the current time in seconds
+        onset_tolerance - the time (in seconds) between note ons of the
+        same chord (default 0.01)
+    """
+
+    def __init__(self, *accumulators: Accumulator, **kwargs):
+        super().__init__()
+        self.accumulators = accumulators
+        self.track = kwargs.get("track", None)
+        self.bpm = kwargs.get("bpm", 120)
+        self.playback_rate = kwargs.get("playback_rate", 1)
+        self.clock: Callable[[], float] = kwargs.get("clock", time)
+        self.onset_tolerance = kwargs.get("onset_tolerance", 0.01)
+        self.active_pitches: Dict[Tuple[int, int], _Onset] = {}
+        # the onsets that have not been presented yet, in order
+        self._onsets: Deque[_Onset] = deque()
+
+    def _time_to_beats(self, seconds: float) -> float:
+        return (seconds * (self.bpm / 60)) * self.playback_rate
+
+    def noteon(self, track: int, pitch: int, velocity: int):
+        if self.track is not None and track != self.track:
+            return
+        now = self.clock()
+        if (pitch, track) in self.active_pitches:
+            # retriggered without a note off
+            self._end_note(pitch, track, now)
+        if not self._onsets or now - self._onsets[-1].time > self.onset_tolerance:
+            self._onsets.append(_Onset(now))
+        onset = self._onsets[-1]
+        onset.pitches.append(pitch)
+        onset.n_sounding = onset.n_sounding + 1
+        self.active_pitches[(pitch, track)] = onset
+
+    def noteoff(self, track: int, pitch: int):
+        self._end_note(pitch, track, self.clock())
+
+    def _end_note(self, pitch: int, track: int, now: float):
+        onset = self.active_pitches.pop((pitch, track), None)
+        if onset is None:
+            return
+        onset.n_sounding = onset.n_sounding - 1
+        onset.end_time = max(onset.end_time, now)
+        while self._onsets and self._onsets[0].n_sounding == 0:
+            onset = self._onsets.popleft()
+            event = Event(sorted(onset.pitches),
+                duration=self._time_to_beats(onset.end_time - onset.time))
+            for accumulator in self.accumulators:
+                accumulator.update(event)
+
+    def control_change(self, track: int, cc: int, value: int):
+        pass
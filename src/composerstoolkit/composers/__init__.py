@@ -4,5 +4,6 @@ from . heuristics import *
 # from . randomwalk import *
 from . solvers import *
 from . cbr import *
+from . parallel import *
 # from . prediction import *
 from . clp import *
\ No newline at end of file
@@ -1,47 +1,208 @@
-from typing import List, Tuple, Optional
+import math
+import pickle
+from typing import Dict, List, Tuple, Optional
 
-from composerstoolkit.core import Event, Graph, Sequence, FiniteSequence, Constraint
+import numpy as np
+
+from composerstoolkit.core import Event, Edge, Graph, Sequence, FiniteSequence, Constraint,\
+    ConstraintCache
+from .solvers import SearchStatistics, SearchBudget
+
+Postings = Tuple[np.ndarray, np.ndarray, np.ndarray]
 
 class Corpus:
     """Allows us to store and query information
     based on a collection of normalised musical examples
+
+    The corpus holds an inverted index of every (pitch_delta, time_delta)
+    vector in its graphs. Each vector maps to a postings list of
+    (graph ids, origin edge ids, destination edge ids) arrays.
+    The index is built once, and extended as graphs are added.
     """
     def __init__(self,
-        case_base: List[Graph]):
-        self.case_base = case_base
-
-    def _search_graph(self, graph, vectors):
-        paths = []
-        arr = graph.to_vector_indexed_array()
-        route_found = False
-
-        for vector in vectors:
-            route_found = False
-
-            if vector not in arr:
-                return []
-            new_paths = arr[vector]
-
-            if paths == []:
-                paths = new_paths
-                continue
-            for path in paths:
-                for new_path in new_paths:
-                    if path[-1] == new_path[0]:
-                        path.append(new_path[-1])
-                        route_found = True
-            if not route_found:
-                return []
-        return paths
-
-    def find_matches(self, vectors = List[Tuple[int, int]]):
+        case_base: Optional[List[Graph]] = None):
+        self.case_base: List[Graph] = []
+        self._chunks: Dict[Tuple[int, int], List[Postings]] = {}
+        self._postings: Dict[Tuple[int, int], Postings] = {}
+        for graph in case_base or []:
+            self.add_graph(graph)
+
+    def add_graph(self, graph: Graph) -> int:
+        """Add a graph to the corpus, and index its vectors.
+        Return the id of the graph within the corpus.
+        """
+        graph_id = len(self.case_base)
+        self.case_base.append(graph)
+        origins, destinations, pitch_deltas, time_deltas = graph.get_vector_arrays()
+        if len(origins) == 0:
+            return graph_id
+        order = np.lexsort((time_deltas, pitch_deltas))
+        pitch_deltas = pitch_deltas[order]
+        time_deltas = time_deltas[order]
+        is_new = np.ones(len(order), dtype=bool)
+        is_new[1:] = (pitch_deltas[1:] != pitch_deltas[:-1]) | (time_deltas[1:] != time_deltas[:-1])
+        bounds = np.append(np.flatnonzero(is_new), len(order))
+        for start, end in zip(bounds[:-1].tolist(), bounds[1:].tolist()):
+            vector = (pitch_deltas[start].item(), time_deltas[start].item())
+            self._chunks.setdefault(vector, []).append((
+                np.full(end - start, graph_id, dtype=np.int64),
+                origins[order[start:end]],
+                destinations[order[start:end]]))
+            self._postings.pop(vector, None)
+        return graph_id
+
+    def postings(self, vector: Tuple[int, int]) -> Postings:
+        """Return every occurrence of a (pitch_delta, time_delta) vector in the corpus,
+        as arrays (graph ids, origin edge ids, destination edge ids).
+        """
+        try:
+            return self._postings[vector]
+        except KeyError:
+            pass
+        chunks = self._chunks.get(vector)
+        if chunks is None:
+            empty = np.array([], dtype=np.int64)
+            return empty, empty, empty
+        postings = (
+            np.concatenate([c[0] for c in chunks]),
+            np.concatenate([c[1] for c in chunks]),
+            np.concatenate([c[2] for c in chunks]))
+        self._postings[vector] = postings
+        return postings
+
+    def save(self, filename: str):
+        """Write the corpus, and its index, to disk.
+        """
+        with open(filename, "wb") as outf:
+            pickle.dump(self, outf, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @classmethod
+    def load(cls, filename: str) -> "Corpus":
+        """Load a corpus written with Corpus.save
+        """
+        with open(filename, "rb") as inf:
+            corpus = pickle.load(inf)
+        if not isinstance(corpus, cls):
+            raise Exception(f"{filename} does not contain a Corpus")
+        return corpus
+
+    def _search(self, vectors: List[Tuple[int, int]]) -> Tuple[np.ndarray, np.ndarray]:
+        """Return the paths that follow the vectors, as arrays
+        (graph ids, edge ids), where edge ids has a row of len(vectors) + 1
+        edges for each path.
+        """
+        graph_ids, origins, destinations = self.postings(vectors[0])
+        paths = np.column_stack((origins, destinations))
+        for vector in vectors[1:]:
+            if len(paths) == 0:
+                break
+            next_graph_ids, next_origins, next_destinations = self.postings(vector)
+            # join the last edge of each path onto the origins of the next vector
+            keys = (next_graph_ids << 32) | next_origins
+            order = np.argsort(keys, kind="stable")
+            keys = keys[order]
+            path_keys = (graph_ids << 32) | paths[:, -1]
+            first = np.searchsorted(keys, path_keys, side="left")
+            n_matches = np.searchsorted(keys, path_keys, side="right") - first
+            steps = np.arange(n_matches.sum()) - np.repeat(np.cumsum(n_matches) - n_matches, n_matches)
+            following = order[np.repeat(first, n_matches) + steps]
+            graph_ids = np.repeat(graph_ids, n_matches)
+            paths = np.column_stack((np.repeat(paths, n_matches, axis=0), next_destinations[following]))
+        return graph_ids, paths
+
+    def match_suffix(self, vectors: List[Tuple[int, int]]) -> Tuple[int, np.ndarray, np.ndarray, np.ndarray]:
+        """Find the longest suffix of vectors that occurs in the corpus.
+        The suffix is grown backwards from the last vector, one vector at a time,
+        keeping only the (graph, first edge, last edge) of each matching path
+        and the number of paths between them. The search stops as soon as
+        the suffix can no longer be extended, so each vector is joined at most once.
+        Return (n vectors matched, graph ids, last edge ids, n paths).
+        """
+        empty = np.array([], dtype=np.int64)
+        if len(vectors) == 0:
+            return 0, empty, empty, empty
+        graph_ids, firsts, lasts = self.postings(vectors[-1])
+        counts = np.ones(len(graph_ids), dtype=np.int64)
+        if len(graph_ids) == 0:
+            return 0, empty, empty, empty
+        n_matched = 1
+        for vector in reversed(vectors[:-1]):
+            prev_graph_ids, origins, destinations = self.postings(vector)
+            # join the destinations of the previous vector onto the first edge of each match
+            keys = (graph_ids << 32) | firsts
+            order = np.argsort(keys, kind="stable")
+            keys = keys[order]
+            prev_keys = (prev_graph_ids << 32) | destinations
+            first = np.searchsorted(keys, prev_keys, side="left")
+            n_joined = np.searchsorted(keys, prev_keys, side="right") - first
+            if n_joined.sum() == 0:
+                break
+            steps = np.arange(n_joined.sum()) - np.repeat(np.cumsum(n_joined) - n_joined, n_joined)
+            joined = order[np.repeat(first, n_joined) + steps]
+            graph_ids, firsts, lasts, counts = _sum_paths(
+                np.repeat(prev_graph_ids, n_joined),
+                np.repeat(origins, n_joined),
+                lasts[joined],
+                counts[joined])
+            n_matched = n_matched + 1
+        graph_ids, _, lasts, counts = _sum_paths(graph_ids, np.zeros_like(firsts), lasts, counts)
+        return n_matched, graph_ids, lasts, counts
+
+    def continuations(self, vectors: List[Tuple[int, int]]) -> Tuple[int, Dict[int, Dict[float, int]]]:
+        """Find the longest suffix of vectors in the corpus (see match_suffix), and count
+        the ways that each match continues from its last edge.
+        Return (n vectors matched, {pitch_delta: {duration: n occurrences}}), where
+        duration is the duration of the last edge of the match.
+        """
+        n_matched, graph_ids, lasts, counts = self.match_suffix(vectors)
+        options: Dict[int, Dict[float, int]] = {}
+        for graph_id in np.unique(graph_ids).tolist():
+            graph = self.case_base[graph_id]
+            in_graph = graph_ids == graph_id
+            edges, edge_counts = lasts[in_graph], counts[in_graph]
+            indptr, indices = graph.adjacency
+            degrees = indptr[edges + 1] - indptr[edges]
+            steps = np.arange(degrees.sum()) - np.repeat(np.cumsum(degrees) - degrees, degrees)
+            destinations = indices[np.repeat(indptr[edges], degrees) + steps]
+            origins = np.repeat(edges, degrees)
+            pitch_deltas = graph.pitches[destinations] - graph.pitches[origins]
+            durations = graph.end_times[origins] - graph.start_times[origins]
+            for pitch_delta, duration, count in zip(
+                pitch_deltas.tolist(),
+                durations.tolist(),
+                np.repeat(edge_counts, degrees).tolist()):
+                if duration == 0 or math.isnan(duration):
+                    # zero length, or open ended (nan)
+                    continue
+                durations_seen = options.setdefault(pitch_delta, {})
+                durations_seen[duration] = durations_seen.get(duration, 0) + count
+        return n_matched, options
+
+    def find_matches(self, vectors: List[Tuple[int, int]]) -> List[List[Edge]]:
         """Return all matches of the given list of vectors
-        from the corpus
+        from the corpus, as lists of connected edges.
         """
-        paths = []
-        for graph in self.case_base:
-            paths = paths + self._search_graph(graph, vectors)
-        return paths
+        if len(vectors) == 0:
+            return []
+        graph_ids, paths = self._search(vectors)
+        return [[self.case_base[graph_id].get_edge(edge_id) for edge_id in path]
+            for graph_id, path in zip(graph_ids.tolist(), paths.tolist())]
+
+def _sum_paths(graph_ids: np.ndarray,
+    firsts: np.ndarray,
+    lasts: np.ndarray,
+    counts: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Merge the paths that share a graph, first and last edge, summing their counts.
+    """
+    order = np.lexsort((lasts, firsts, graph_ids))
+    graph_ids, firsts, lasts, counts = graph_ids[order], firsts[order], lasts[order], counts[order]
+    is_new = np.ones(len(order), dtype=bool)
+    is_new[1:] = (graph_ids[1:] != graph_ids[:-1])\
+        | (firsts[1:] != firsts[:-1]) | (lasts[1:] != lasts[:-1])
+    starts = np.flatnonzero(is_new)
+    if len(starts) == 0:
+        return graph_ids, firsts, lasts, counts
+    return graph_ids[starts], firsts[starts], lasts[starts], np.add.reduceat(counts, starts)
 
 class CaseBasedSolver:
     """Brute-force solver that attempts to grow a sequence of notes
@@ -56,12 +217,23 @@ class CaseBasedSolver:
 
     The instance is iterable, yielding solutions along
     with their confidence rating.
+
+    Optional kwargs:
+    statistics - a SearchStatistics, which is updated with the work
+    done by every search (each option tried is a node).
+    timeout, max_nodes - a budget for each solution (in seconds, and nodes).
+    Once it is spent, the longest partial solution is returned.
+    progress - a callback, which is called with the SearchStatistics
+    every progress_interval seconds (Default 1).
+    cache - a ConstraintCache for the results of constraints that
+    declare a Lookback.
     """
     def __init__(self,
         source: FiniteSequence,
         corpus: Corpus,
         target_duration_beats: int,
-        constraints: Optional[List[Constraint]] = None):
+        constraints: Optional[List[Constraint]] = None,
+        **kwargs):
 
         self.source = source
         self.corpus = corpus
@@ -70,6 +242,13 @@ class CaseBasedSolver:
             constraints = []
         self.constraints = constraints
         self.paths_explored = []
+        self.options = kwargs
+        self.statistics = kwargs.get("statistics")
+        if self.statistics is None:
+            self.statistics = SearchStatistics()
+        self.cache = kwargs.get("cache")
+        if self.cache is None:
+            self.cache = ConstraintCache()
 
     def __iter__(self):
         return self
@@ -79,51 +258,50 @@ class CaseBasedSolver:
         seq = FiniteSequence(events=self.source.events[:])
 
         confidence_score = 0 # TODO
+        statistics = self.statistics
+        statistics.best_partial = None
+        statistics.update_best_partial(seq)
+        budget = SearchBudget(self.options, statistics)
+        # each event is tested as it is appended, so constraints with a
+        # Lookback can be tested against their window, once the source passes
+        use_cache = all(constraint(seq) for constraint in self.constraints)
+        def check(constraint: Constraint) -> bool:
+            if use_cache:
+                return self.cache.check(constraint, seq.events)
+            return constraint(seq)
 
         while seq.duration <= self.target_duration_beats:
-            # find instances in the corpus that match the shape of our source
+            # find instances in the corpus that match the shape of our source.
+            # If we can't match the full melody, the longest possible
+            # section from the end is matched
             vectors = seq.to_vectors()
-            intervals = [i for (i,p) in vectors]
-            matches = []
-            matches = self.corpus.find_matches(vectors)
-            while len(matches) == 0:
-                # if we can't match the full melody, try and match
-                # progressivly shorter sections from the end
-                vectors = vectors[1:]
-                if len(vectors) == 0:
-                    raise StopIteration("Could not find a longer match for vectors", self.corpus.find_matches(vectors))
-                matches = self.corpus.find_matches(vectors)
-
-            # data structure is a dict of pitch delta : List[durations]
-            options = {i:[] for i in range(-127,127)}
-            # expand the last edge of each match, to find the possible
-            # destinations from that point
-            for match in matches:
-                last_e = match[-1]
-                for vertex in last_e.vertices:
-                    pitch_delta = vertex.pitch - last_e.pitch
-                    time_delta = last_e.end_time - last_e.start_time
-                    if time_delta != 0:
-                        options[pitch_delta].append(time_delta)
-
-            # pitch options is a list of possible vectors, sorted by the 
-            # most frequent first
-            options = [(k,v) for k,v in options.items()]
-            options = sorted(options, key=lambda o: len(o[1]), reverse=True)
+            n_matched, continuations = self.corpus.continuations(vectors)
+            if n_matched == 0:
+                raise StopIteration("Could not find a longer match for vectors", [])
+
+            # the possible destinations from the last edge of each match,
+            # as a list of (pitch delta, {duration: count})
+            options = list(continuations.items())
+            # pitch options is a list of possible vectors, sorted by the
+            # most frequent first (then by ascending pitch delta)
+            options = sorted(options, key=lambda o: (-sum(o[1].values()), o[0]))
             n_options = len(options)
             # iterate over pitch options, to find the best fi
             # that matches our critera, but has not been used before
             found_next = False
             i = n_options
             while found_next == False:
+                if budget.is_active and budget.is_spent():
+                    return (statistics.best_partial, confidence_score)
                 if options == []:
                     # this route is a dead end. Chop the last events
                     # off and backtrack
+                    statistics.backtracks = statistics.backtracks + 1
                     self.paths_explored.append(FiniteSequence(seq.events[:]))
                     seq.events.pop()
                     break
 
-                if options[0][1] == []:
+                if not options[0][1]:
                     # this option is never visited in the corpus, ignore
                     options.remove(options[0])
                     i = i - 1
@@ -131,7 +309,8 @@ class CaseBasedSolver:
 
                 seq.events.append(
                     Event([seq.events[-1].pitches[-1] + options[0][0]],
-                        max(options[0][1], key=options[0][1].count)))
+                        max(options[0][1], key=options[0][1].get)))
+                statistics.nodes = statistics.nodes + 1
                 if seq in self.paths_explored:
                     seq.events.pop()
                     options.remove(options[0])
@@ -140,7 +319,8 @@ class CaseBasedSolver:
                 # check against constraints
                 passed_const_check = True
                 for constraint in self.constraints:
-                    if not constraint(seq):
+                    statistics.checks = statistics.checks + 1
+                    if not check(constraint):
                         passed_const_check = False
                         break
                 if not passed_const_check:
@@ -150,6 +330,8 @@ class CaseBasedSolver:
                     options.remove(options[0])
                     continue
                 found_next = True
+                statistics.update_best_partial(seq)
 
+        budget.update()
         self.paths_explored.append(seq)
         return (seq, confidence_score)
\ No newline at end of file
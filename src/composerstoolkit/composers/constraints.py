@@ -2,7 +2,8 @@ import itertools
 from typing import List,Set
 import random
 
-from ..core import Constraint, FiniteSequence
+from ..core import Constraint, IncrementalConstraint, Lookback, FiniteSequence,\
+    ALL_PITCHES, pitch_mask, pitch_range_mask
 
 @Constraint
 def probability_gate(
@@ -36,10 +37,29 @@ def constraint_range(sequence: FiniteSequence,
     minimum: int,
     maximum: int) -> bool:
 
-    if sequence.to_pitch_set() == {}:
-        return False
-    pitches = sorted(sequence.pitches)
-    return pitches[0] >= minimum and pitches[-1] <= maximum
+    pitches = sequence.pitches
+    if pitches == []:
+        return True
+    return min(pitches) >= minimum and max(pitches) <= maximum
+
+@constraint_range.incremental
+class _Range(IncrementalConstraint):
+    def __init__(self, minimum: int, maximum: int):
+        self.minimum = minimum
+        self.maximum = maximum
+
+    def check(self, state, event) -> bool:
+        return all(self.minimum <= pitch <= self.maximum for pitch in event.pitches)
+
+    def conflicts(self, state, event):
+        return ()
+
+    def domain(self, state):
+        return pitch_range_mask(self.minimum, self.maximum)
+
+@constraint_range.lookback
+def _range_lookback(minimum: int, maximum: int) -> Lookback:
+    return Lookback(n_events=1)
 
 @Constraint
 def constraint_in_set(sequence: FiniteSequence,
@@ -54,9 +74,56 @@ def constraint_in_set(sequence: FiniteSequence,
         sequence.duration
     ).to_pitch_set().issubset(_set)
 
+@constraint_in_set.incremental
+class _InSet(IncrementalConstraint):
+    def __init__(self, _set = range(0,128), lookback_n_beats=None):
+        self._set = _set
+        self.lookback_n_beats = lookback_n_beats
+        self._mask = None
+
+    def check(self, state, event) -> bool:
+        if self.lookback_n_beats is None:
+            return all(pitch in self._set for pitch in event.pitches)
+        # the events in the window [end - lookback_n_beats, end),
+        # selected in the same way as FiniteSequence.time_slice
+        end = state.duration + event.duration
+        window_start = end - self.lookback_n_beats
+        candidates = [(state.duration, end, event)]
+        for i in reversed(range(len(state.events))):
+            event_end = state.offsets[i]
+            event_start = event_end - state.events[i].duration
+            if event_end < window_start or (event_end == window_start and event_start < window_start):
+                break
+            candidates.append((event_start, event_end, state.events[i]))
+        for event_start, event_end, windowed in candidates:
+            if event_start >= end:
+                continue
+            if event_start >= window_start or event_end > window_start:
+                if not all(pitch in self._set for pitch in windowed.pitches):
+                    return False
+        return True
+
+    def conflicts(self, state, event):
+        if event is not None and all(pitch in self._set for pitch in event.pitches):
+            return super().conflicts(state, event)
+        return ()
+
+    def domain(self, state):
+        if self.lookback_n_beats is not None:
+            return None
+        if self._mask is None:
+            self._mask = pitch_mask(pitch for pitch in range(0, 128) if pitch in self._set)
+        return self._mask
+
+@constraint_in_set.lookback
+def _in_set_lookback(_set = range(0,128), lookback_n_beats=None) -> Lookback:
+    if lookback_n_beats is None:
+        return Lookback(n_events=1)
+    return Lookback(n_beats=lookback_n_beats)
+
 @Constraint
 def constraint_no_repeated_adjacent_notes(sequence: FiniteSequence) -> bool:
-    if len(sequence.events) > 2:
+    if len(sequence.events) < 2:
         return True
     it1,it2 = itertools.tee(sequence.events)
     next(it2, None)
@@ -65,9 +132,26 @@ def constraint_no_repeated_adjacent_notes(sequence: FiniteSequence) -> bool:
             return False
     return True
 
+@constraint_no_repeated_adjacent_notes.incremental
+class _NoRepeatedAdjacentNotes(IncrementalConstraint):
+    def check(self, state, event) -> bool:
+        return state.last is None or event.pitches != state.last.pitches
+
+    def conflicts(self, state, event):
+        return (len(state.events) - 1,)
+
+    def domain(self, state):
+        if state.last is None or len(state.last.pitches) != 1:
+            return None
+        return ALL_PITCHES & ~pitch_mask(state.last.pitches)
+
+@constraint_no_repeated_adjacent_notes.lookback
+def _no_repeated_adjacent_notes_lookback() -> Lookback:
+    return Lookback(n_events=2)
+
 @Constraint
 def constraint_limit_shared_pitches(sequence: FiniteSequence, max_shared: int=1) -> bool:
-    if len(sequence.events) > 2:
+    if len(sequence.events) < 2:
         return True
     it1,it2 = itertools.tee(sequence.events)
     next(it2, None)
@@ -77,18 +161,52 @@ def constraint_limit_shared_pitches(sequence: FiniteSequence, max_shared: int=1)
             return False
     return True
 
+@constraint_limit_shared_pitches.incremental
+class _LimitSharedPitches(IncrementalConstraint):
+    def __init__(self, max_shared: int=1):
+        self.max_shared = max_shared
+
+    def check(self, state, event) -> bool:
+        if state.last is None:
+            return True
+        return len(set(event.pitches).intersection(state.last.pitches)) <= self.max_shared
+
+    def conflicts(self, state, event):
+        return (len(state.events) - 1,)
+
+@constraint_limit_shared_pitches.lookback
+def _limit_shared_pitches_lookback(max_shared: int=1) -> Lookback:
+    return Lookback(n_events=2)
+
 @Constraint
 def constraint_enforce_shared_pitches(sequence: FiniteSequence, min_shared: int=1) -> bool:
-    if len(sequence.events) > 2:
+    if len(sequence.events) < 2:
         return True
     it1,it2 = itertools.tee(sequence.events)
     next(it2, None)
     for left, right in zip(it1,it2):
         intersection = set(right.pitches).intersection(set(left.pitches))
-        if len(intersection) <= min_shared:
+        if len(intersection) < min_shared:
             return False
     return True
 
+@constraint_enforce_shared_pitches.incremental
+class _EnforceSharedPitches(IncrementalConstraint):
+    def __init__(self, min_shared: int=1):
+        self.min_shared = min_shared
+
+    def check(self, state, event) -> bool:
+        if state.last is None:
+            return True
+        return len(set(event.pitches).intersection(state.last.pitches)) >= self.min_shared
+
+    def conflicts(self, state, event):
+        return (len(state.events) - 1,)
+
+@constraint_enforce_shared_pitches.lookback
+def _enforce_shared_pitches_lookback(min_shared: int=1) -> Lookback:
+    return Lookback(n_events=2)
+
 @Constraint
 def constraint_no_leaps_more_than(sequence: FiniteSequence, max_int: int) -> bool:
     if len(sequence.events) < 2:
@@ -103,6 +221,30 @@ def constraint_no_leaps_more_than(sequence: FiniteSequence, max_int: int) -> boo
             return False
     return True
 
+@constraint_no_leaps_more_than.incremental
+class _NoLeapsMoreThan(IncrementalConstraint):
+    def __init__(self, max_int: int):
+        self.max_int = max_int
+
+    def check(self, state, event) -> bool:
+        last = state.last
+        if last is None or last.pitches == [] or event.pitches == []:
+            return True
+        return abs(event.pitches[-1] - last.pitches[-1]) <= self.max_int
+
+    def conflicts(self, state, event):
+        return (len(state.events) - 1,)
+
+    def domain(self, state):
+        if state.last is None or state.last.pitches == []:
+            return None
+        pitch = state.last.pitches[-1]
+        return pitch_range_mask(pitch - self.max_int, pitch + self.max_int)
+
+@constraint_no_leaps_more_than.lookback
+def _no_leaps_more_than_lookback(max_int: int) -> Lookback:
+    return Lookback(n_events=2)
+
 @Constraint
 def constraint_notes_are(sequence: FiniteSequence, beat_offset: int, pitches: List[int]) -> bool:
     """Tells us if the context note on the given beat_offset
@@ -113,6 +255,23 @@ def constraint_notes_are(sequence: FiniteSequence, beat_offset: int, pitches: Li
     offset_event = sequence.event_at(beat_offset)
     return sorted(offset_event.pitches) == sorted(pitches)
 
+@constraint_notes_are.incremental
+class _NotesAre(IncrementalConstraint):
+    def __init__(self, beat_offset: int, pitches: List[int]):
+        self.beat_offset = beat_offset
+        self.pitches = sorted(pitches)
+
+    def check(self, state, event) -> bool:
+        # only the first event to end at or after beat_offset is tested
+        if state.events and state.duration >= self.beat_offset:
+            return True
+        if state.duration + event.duration < self.beat_offset:
+            return True
+        return sorted(event.pitches) == self.pitches
+
+    def conflicts(self, state, event):
+        return ()
+
 @Constraint
 def constraint_no_voice_crossing(sequence: FiniteSequence, upper_voice: FiniteSequence) -> bool:
     """Tells us if the top pitch of the context is lower than
@@ -126,6 +285,18 @@ def constraint_no_voice_crossing(sequence: FiniteSequence, upper_voice: FiniteSe
             return False
     return True
 
+@constraint_no_voice_crossing.incremental
+class _NoVoiceCrossing(IncrementalConstraint):
+    def __init__(self, upper_voice: FiniteSequence):
+        self.upper_voice = upper_voice
+
+    def check(self, state, event) -> bool:
+        upper_event = self.upper_voice.event_at(state.duration + event.duration)
+        return event.pitches[-1] <= upper_event.pitches[-1]
+
+    def conflicts(self, state, event):
+        return ()
+
 @Constraint
 def constraint_restrict_to_intervals(
     sequence: FiniteSequence,
@@ -149,6 +320,22 @@ def constraint_restrict_to_intervals(
             return False
     return True
 
+@constraint_restrict_to_intervals.incremental
+class _RestrictToIntervals(IncrementalConstraint):
+    def __init__(self, allow_intervals: Set[int], upper_voice: FiniteSequence):
+        self.allow_intervals = allow_intervals
+        self.upper_voice = upper_voice
+
+    def check(self, state, event) -> bool:
+        upper_event = self.upper_voice.event_at(state.duration + event.duration)
+        if upper_event is None or upper_event.pitches == [] or event.pitches == []:
+            return True
+        interval = abs(upper_event.pitches[-1] - event.pitches[-1]) % 12
+        return interval in self.allow_intervals
+
+    def conflicts(self, state, event):
+        return ()
+
 @Constraint
 def constraint_no_consecutives(
     sequence: FiniteSequence,
@@ -181,6 +368,30 @@ def constraint_no_consecutives(
                 return False
     return True
 
+@constraint_no_consecutives.incremental
+class _NoConsecutives(IncrementalConstraint):
+    def __init__(self, deny_intervals: Set[int], upper_voice: FiniteSequence):
+        self.deny_intervals = deny_intervals
+        self.upper_voice = upper_voice
+
+    def check(self, state, event) -> bool:
+        lwr_left = state.last
+        if lwr_left is None or lwr_left.pitches == [] or event.pitches == []:
+            return True
+        left_time = state.duration
+        upr_left = self.upper_voice.event_at(left_time)
+        upr_right = self.upper_voice.event_at(left_time + event.duration)
+        if upr_left is None or upr_right is None:
+            return True
+        if upr_left.pitches == [] or upr_right.pitches == []:
+            return True
+        int_left = abs(upr_left.pitches[-1] - lwr_left.pitches[-1])
+        int_right = abs(upr_right.pitches[-1] - event.pitches[-1])
+        return int_left != int_right or int_left not in self.deny_intervals
+
+    def conflicts(self, state, event):
+        return (len(state.events) - 1,)
+
 @Constraint
 def constraint_use_chords(
     sequence: FiniteSequence,
@@ -206,3 +417,23 @@ def constraint_use_chords(
 
             return False
     return True
+
+@constraint_use_chords.incremental
+class _UseChords(IncrementalConstraint):
+    def __init__(self, chords: List[Set], voices: List[FiniteSequence]):
+        self.chords = chords
+        self.voices = voices
+
+    def check(self, state, event) -> bool:
+        # an event is tested once it is followed by another event
+        left = state.last
+        if left is None:
+            return True
+        pcs = {*[pitch % 12 for pitch in left.pitches]}
+        for voice in self.voices:
+            evt = voice.event_at(state.duration)
+            pcs = pcs.union({*[pitch % 12 for pitch in evt.pitches]})
+        return any(pcs.difference(_set) == set() for _set in self.chords)
+
+    def conflicts(self, state, event):
+        return (len(state.events) - 1,)
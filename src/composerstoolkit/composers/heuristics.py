@@ -2,45 +2,98 @@
 Heuristic functions used to guide random generation
 (see composers.solvers.backtracking_solver)
 """
-import math
-from typing import Dict, Callable, Tuple, List
+from typing import Callable, Tuple, List
+
+import numpy as np
 
 # TODO use decimal types here to avoid floating point errors
 
-def heuristic_sine_shape(axis_pitch=60,amplitude=30,length=16, strength=1):
+class Heuristic:
+    """Base class for heuristics, which add weight to the candidate
+    pitches of a solver at each tick. The weights of several heuristics
+    are summed (on top of a weight of 1 for every pitch).
+
+    Subclasses implement weights(ticks, pitches), which should accept
+    broadcastable arrays. If the weights only depend upon the tick and pitch
+    (tick_only), a solver can compute a table of every weight once per solve.
+
+    Heuristics can also be called with the original function
+    interface: heuristic(tick, choices, weights) -> weights
+    """
+    tick_only = True
+
+    def weights(self, ticks: np.ndarray, pitches: np.ndarray) -> np.ndarray:
+        raise NotImplementedError("weights")
+
+    def table(self, n_ticks: int) -> np.ndarray:
+        """Return the weights of every pitch at every tick,
+        as an array of shape (n_ticks, 128).
+        """
+        ticks = np.arange(n_ticks).reshape(-1, 1)
+        pitches = np.arange(128).reshape(1, -1)
+        return np.broadcast_to(self.weights(ticks, pitches), (n_ticks, 128))
+
+    def __call__(self, tick, choices, weights) -> List[float]:
+        added = self.weights(np.array(tick), np.asarray(choices))
+        return (np.asarray(weights, dtype=np.float64) + added).tolist()
+
+def weight_table(heuristics: List[Heuristic], n_ticks: int) -> np.ndarray:
+    """Return the combined weights of the heuristics (plus 1 for every pitch),
+    as an array of shape (n_ticks, 128).
+    """
+    table = np.ones((n_ticks, 128))
+    for heuristic in heuristics:
+        table = table + heuristic.table(n_ticks)
+    return table
+
+class SineShape(Heuristic):
     # this will try and make the music obey the shape of a single sine wave cycle
-    def func(tick, choices, weights) -> Dict[int, float]:
-        angle = (tick+1)/length * 360
-        value = math.sin(math.radians(angle))
-        target_note = math.ceil(axis_pitch + (value * amplitude))
-        for i, note in enumerate(choices):
-            if i < axis_pitch-amplitude or i > axis_pitch+amplitude:
-                continue
-            compensating_value = 1 - (abs(note-target_note)/amplitude)
-            if compensating_value > 0:
-                weights[i] = weights[i] + math.pow(compensating_value, strength) * 100
-        return weights
-    return func
-
-def heuristic_trend_upwards(axis=60, strength=1):
-    def func(_tick, choices, weights) -> Dict[int, float]:
-        for i, note in enumerate(choices):
-            if note > axis:
-                weights[i] = weights[i] + strength
-        return weights
-    return func
-
-def heuristic_single_pitch(axis_pitch=60, slope=30, strength=1):
+    def __init__(self, axis_pitch=60, amplitude=30, length=16, strength=1):
+        self.axis_pitch = axis_pitch
+        self.amplitude = amplitude
+        self.length = length
+        self.strength = strength
+
+    def weights(self, ticks, pitches):
+        angle = (ticks + 1) / self.length * 360
+        value = np.sin(np.radians(angle))
+        target_note = np.ceil(self.axis_pitch + (value * self.amplitude))
+        compensating_value = 1 - (np.abs(pitches - target_note) / self.amplitude)
+        in_range = np.abs(pitches - self.axis_pitch) <= self.amplitude
+        return np.where(in_range & (compensating_value > 0),
+            np.power(np.maximum(compensating_value, 0), self.strength) * 100, 0)
+
+class TrendUpwards(Heuristic):
+    def __init__(self, axis=60, strength=1):
+        self.axis = axis
+        self.strength = strength
+
+    def weights(self, ticks, pitches):
+        return np.where(pitches > self.axis, self.strength, 0) + np.zeros_like(ticks)
+
+class SinglePitch(Heuristic):
     # this will try and make the music obey the shape of a single axis pitch
-    def func(_tick, choices, weights) -> Dict[int, float]:
-        for i, note in enumerate(choices):
-            compensating_value = 1 - (abs(note-axis_pitch)/slope)
-            if compensating_value > 0:
-                weights[i] = weights[i] + math.pow(compensating_value, strength) * 100
-        return weights
-    return func
+    def __init__(self, axis_pitch=60, slope=30, strength=1):
+        self.axis_pitch = axis_pitch
+        self.slope = slope
+        self.strength = strength
+
+    def weights(self, ticks, pitches):
+        compensating_value = 1 - (np.abs(pitches - self.axis_pitch) / self.slope)
+        return np.where(compensating_value > 0,
+            np.power(np.maximum(compensating_value, 0), self.strength) * 100, 0)\
+            + np.zeros_like(ticks)
+
+def heuristic_sine_shape(axis_pitch=60,amplitude=30,length=16, strength=1) -> Heuristic:
+    return SineShape(axis_pitch, amplitude, length, strength)
+
+def heuristic_trend_upwards(axis=60, strength=1) -> Heuristic:
+    return TrendUpwards(axis, strength)
+
+def heuristic_single_pitch(axis_pitch=60, slope=30, strength=1) -> Heuristic:
+    return SinglePitch(axis_pitch, slope, strength)
 
 # def minimise(metric: Callable[[Tuple[int, FiniteSequence]], int]):
     # def f(choices: List[FiniteSequence]) -> List[FiniteSequence]:
-        
+
     # return f
@@ -0,0 +1,169 @@
+"""Run several differently seeded instances of a randomized solver
+in parallel (a portfolio), and keep the first solutions found.
+The run time of the solvers varies greatly with the random seed,
+so a portfolio is often much faster than a single instance.
+"""
+from dataclasses import dataclass, field
+import multiprocessing
+import os
+from queue import Empty
+import random
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from composerstoolkit.core import FiniteSequence
+from .solvers import SearchStatistics, backtracking_solver, backtracking_markov_solver, develop
+
+# solvers that accept a statistics kwarg
+_SOLVERS_WITH_STATISTICS = {backtracking_solver, backtracking_markov_solver, develop}
+
+# how often to check for workers that have exited without a result
+_POLL_INTERVAL = 0.1
+
+@dataclass
+class WorkerReport:
+    """The outcome of one solver instance in a portfolio.
+    status - "solved", "duplicate" (solved, but the solution was already found),
+    "failed" (the solver raised an exception), "crashed", "cancelled"
+    (stopped, or never started, once enough solutions were found)
+    or "timeout".
+    elapsed - the wall time of the instance in seconds.
+    statistics - the solver's SearchStatistics, for instances that finished
+    (if the solver supports them).
+    """
+    seed: int
+    status: str
+    elapsed: float = 0
+    statistics: Optional[SearchStatistics] = None
+    error: Optional[str] = None
+
+@dataclass
+class PortfolioResult:
+    """The distinct solutions in the order that they were found,
+    and a report for each solver instance (in order of instance).
+    """
+    solutions: List[FiniteSequence] = field(default_factory=list)
+    reports: List[WorkerReport] = field(default_factory=list)
+
+    @property
+    def solution(self) -> Optional[FiniteSequence]:
+        return self.solutions[0] if self.solutions else None
+
+def _solution_key(solution: FiniteSequence):
+    return tuple((tuple(event.pitches), event.duration) for event in solution.events)
+
+def _run_instance(queue, index: int, solver: Callable, seed: int, args, kwargs):
+    """Run a single seeded solver instance, and put its outcome on queue.
+    (Run in a worker process.)
+    """
+    random.seed(seed)
+    statistics = None
+    if solver in _SOLVERS_WITH_STATISTICS and "statistics" not in kwargs:
+        statistics = SearchStatistics()
+        kwargs = dict(kwargs, statistics=statistics)
+    started = time.perf_counter()
+    try:
+        solution = solver(*args, **kwargs)
+    except Exception as e:
+        queue.put((index, None, time.perf_counter() - started, statistics, repr(e)))
+        return
+    if statistics is not None and statistics.budget_exhausted:
+        # a partial solution (see the max_nodes kwarg of the solvers)
+        queue.put((index, None, time.perf_counter() - started, statistics, "budget exhausted"))
+        return
+    queue.put((index, solution, time.perf_counter() - started, statistics, None))
+
+def run_portfolio(
+    solver: Callable,
+    *args,
+    n_instances: Optional[int] = None,
+    n_workers: Optional[int] = None,
+    n_solutions: int = 1,
+    timeout: Optional[float] = None,
+    seed: Optional[int] = None,
+    **kwargs) -> PortfolioResult:
+    """Run n_instances of solver(*args, **kwargs) across a pool of processes,
+    each with a different random seed, until n_solutions distinct
+    solutions have been found. The remaining instances are then stopped.
+    eg
+        result = run_portfolio(backtracking_solver, Event([60], 1),
+            constraints=[...], n_events=32, n_instances=8, timeout=10)
+        result.solution
+
+    n_instances - the number of instances (defaults to the number of CPUs).
+    n_workers - the number of instances that run at once (defaults to n_instances).
+    n_solutions - the number of distinct solutions to find.
+    timeout - stop all instances after this many seconds.
+    seed - seeds the random seeds given to each instance, for repeatable runs.
+
+    The solver and its arguments are sent to the worker processes, so
+    should be picklable when processes are spawned, rather than forked.
+    Returns a PortfolioResult, which holds fewer than n_solutions solutions
+    if the instances ran out, or the timeout was reached.
+    """
+    if n_instances is None:
+        n_instances = os.cpu_count() or 1
+    if n_workers is None:
+        n_workers = n_instances
+    if n_instances < 1 or n_workers < 1:
+        raise Exception("run_portfolio() n_instances and n_workers should be 1 or greater")
+    rng = random.Random(seed)
+    seeds = [rng.getrandbits(32) for _ in range(n_instances)]
+    context = multiprocessing.get_context()
+    queue = context.Queue()
+    deadline = None if timeout is None else time.monotonic() + timeout
+    result = PortfolioResult(reports=[WorkerReport(seed=s, status="cancelled") for s in seeds])
+    found = set()
+    pending = list(range(n_instances))
+    running: Dict[int, Any] = {}
+    timed_out = False
+    try:
+        while (pending or running) and len(result.solutions) < n_solutions:
+            while pending and len(running) < n_workers:
+                index = pending.pop(0)
+                process = context.Process(
+                    target=_run_instance,
+                    args=(queue, index, solver, seeds[index], args, kwargs),
+                    daemon=True)
+                process.start()
+                running[index] = (process, time.monotonic())
+            wait = _POLL_INTERVAL
+            if deadline is not None:
+                wait = min(wait, deadline - time.monotonic())
+                if wait <= 0:
+                    timed_out = True
+                    break
+            try:
+                index, solution, elapsed, statistics, error = queue.get(timeout=wait)
+            except Empty:
+                for index, (process, started) in list(running.items()):
+                    if process.exitcode not in (None, 0):
+                        del running[index]
+                        report = result.reports[index]
+                        report.status = "crashed"
+                        report.elapsed = time.monotonic() - started
+                        report.error = f"exit code {process.exitcode}"
+                continue
+            process, _ = running.pop(index)
+            process.join()
+            report = result.reports[index]
+            report.elapsed = elapsed
+            report.statistics = statistics
+            report.error = error
+            if solution is None:
+                report.status = "failed"
+            elif _solution_key(solution) in found:
+                report.status = "duplicate"
+            else:
+                report.status = "solved"
+                found.add(_solution_key(solution))
+                result.solutions.append(solution)
+    finally:
+        for index, (process, started) in running.items():
+            process.terminate()
+            process.join()
+            report = result.reports[index]
+            report.status = "timeout" if timed_out else "cancelled"
+            report.elapsed = time.monotonic() - started
+        queue.close()
+    return result
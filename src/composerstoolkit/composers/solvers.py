@@ -3,14 +3,24 @@ of contraints.
 These are not designed for on-the-fly usage.
 """
 
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
 from decimal import Decimal
+import functools
 import itertools
 import math
+import queue
 import random
-from typing import Dict, Optional, List
+import threading
+import time
+from typing import Callable, Dict, Iterator, Optional, List, Set, Tuple
 
-from composerstoolkit.core import Event, Sequence, FiniteSequence, Constraint
+import numpy as np
+
+from composerstoolkit.core import Event, Sequence, FiniteSequence, Constraint,\
+    ConstraintCache, ALL_PITCHES
 from composerstoolkit.resources import NOTE_MIN, NOTE_MAX
+from .heuristics import Heuristic, weight_table
 
 class DeadEndReached(Exception):
     """Indicates that the solver reached a dead-end
@@ -28,6 +38,245 @@ class AllRoutesExhausted(Exception):
     possibilities under the given condition.
     """
 
+@dataclass
+class SearchStatistics:
+    """Counts of the work done by a solver during a search
+    (pass an instance as the statistics kwarg).
+    nodes - the number of candidate events that were tested
+    backtracks - the number of dead ends that were reached
+    backjumps - the number of dead ends that jumped back more than one event
+    nogoods - the number of nogoods that were recorded
+    nogood_prunes - the number of candidates rejected by a recorded nogood
+    domain_prunes - the number of pitches that were never generated,
+    because they were excluded by a constraint's domain
+    checks - the number of times that a constraint was tested
+    elapsed - the time spent searching, in seconds
+    budget_exhausted - True if the search was stopped by its
+    timeout or max_nodes budget
+    best_partial - the longest sequence that passed the constraints
+    """
+    nodes: int = 0
+    backtracks: int = 0
+    backjumps: int = 0
+    nogoods: int = 0
+    nogood_prunes: int = 0
+    domain_prunes: int = 0
+    checks: int = 0
+    elapsed: float = 0
+    budget_exhausted: bool = False
+    best_partial: Optional[FiniteSequence] = None
+
+    @property
+    def nodes_per_second(self) -> float:
+        return self.nodes / self.elapsed if self.elapsed else 0.0
+
+    def update_best_partial(self, seq: FiniteSequence):
+        """Keep a copy of seq, if it is longer than the best partial solution.
+        """
+        if self.best_partial is None or len(seq.events) > len(self.best_partial.events):
+            self.best_partial = FiniteSequence(seq.events[:])
+
+class SearchBudget:
+    """Stops a search once its budget is spent, and reports its progress
+    (used by the solvers and CaseBasedSolver).
+    The budget and callback are given as solver kwargs:
+    timeout - the number of seconds that the search may run for
+    max_nodes - the number of nodes that the search may visit
+    progress - called with the SearchStatistics as the search runs
+    progress_interval - the number of seconds between calls to progress (Default 1)
+    """
+
+    def __init__(self, opts: Dict, statistics: SearchStatistics):
+        self.timeout = opts.get("timeout")
+        self.max_nodes = opts.get("max_nodes")
+        self.progress = opts.get("progress")
+        self.progress_interval = opts.get("progress_interval", 1)
+        self.statistics = statistics
+        self.started = time.perf_counter()
+        self.last_progress = self.started
+        # a budget applies from when it is created
+        self.initial_nodes = statistics.nodes
+        self.initial_elapsed = statistics.elapsed
+        # False if there is no budget or callback to check at each node
+        self.is_active = self.timeout is not None\
+            or self.max_nodes is not None or self.progress is not None
+
+    def is_spent(self) -> bool:
+        """Update the elapsed time, report progress if it is due,
+        and return True if the budget has run out.
+        """
+        now = self.update()
+        statistics = self.statistics
+        if self.progress is not None and now - self.last_progress >= self.progress_interval:
+            self.last_progress = now
+            self.progress(statistics)
+        if (self.max_nodes is not None and statistics.nodes - self.initial_nodes >= self.max_nodes)\
+            or (self.timeout is not None and now - self.started >= self.timeout):
+            statistics.budget_exhausted = True
+            return True
+        return False
+
+    def update(self) -> float:
+        """Update the elapsed time of the statistics.
+        """
+        now = time.perf_counter()
+        self.statistics.elapsed = self.initial_elapsed + now - self.started
+        return now
+
+@dataclass
+class BeamStatistics:
+    """Counts of the work done by beam_develop
+    (pass an instance as the statistics kwarg).
+    steps - the number of times that the beams were expanded
+    candidates - the number of candidate sequences that were evaluated
+    valid - the number of candidates that passed the constraints
+    elapsed - the time spent evaluating candidates, in seconds
+    """
+    steps: int = 0
+    candidates: int = 0
+    valid: int = 0
+    elapsed: float = 0
+
+    @property
+    def throughput(self) -> float:
+        """The number of candidates evaluated per second.
+        """
+        return self.candidates / self.elapsed if self.elapsed else 0.0
+
+class _ConstraintChecker:
+    """Tests events appended to a sequence against a list of constraints.
+    Constraints that have an incremental implementation are tested
+    against the new event only. Those that declare a Lookback are
+    tested against their window (through cache) - the rest are tested
+    against the whole sequence.
+    """
+
+    def __init__(self,
+        constraints: List[Constraint],
+        seq: FiniteSequence,
+        statistics: Optional[SearchStatistics] = None,
+        cache: Optional[ConstraintCache] = None):
+        self.incremental = []
+        self.constraints = []
+        self.conflicts: Set[int] = set()
+        # counts the constraint checks
+        if statistics is None:
+            statistics = SearchStatistics()
+        self.statistics = statistics
+        if cache is None:
+            cache = ConstraintCache()
+        self.cache = cache
+        for constraint in constraints:
+            checker = constraint.incremental() if hasattr(constraint, "incremental") else None
+            if checker is None:
+                self.constraints.append(constraint)
+            else:
+                self.incremental.append((checker, checker.init(seq.events)))
+
+    def append(self, seq: FiniteSequence, event: Event) -> bool:
+        """Return True if seq + event passes all constraints.
+        If it does, the event must later be removed with undo() if
+        it is not kept. If not, conflicts holds the indexes of the
+        events in seq that were implicated in the failure.
+        """
+        for i, (checker, state) in enumerate(self.incremental):
+            self.statistics.checks = self.statistics.checks + 1
+            if not checker.check_append(state, event):
+                self._undo(i)
+                self.conflicts = self.explain(event)
+                return False
+        if self.constraints:
+            # windowed constraints don't need a copy of the whole sequence
+            seq.events.append(event)
+            try:
+                is_valid = True
+                for constraint in self.constraints:
+                    self.statistics.checks = self.statistics.checks + 1
+                    if not self.cache.check(constraint, seq.events):
+                        is_valid = False
+                        break
+            finally:
+                seq.events.pop()
+            if not is_valid:
+                self.conflicts = set(range(len(seq.events)))
+                self.undo()
+                return False
+        return True
+
+    def check_extension(self, seq: FiniteSequence, events: List[Event]) -> bool:
+        """Return True if seq + events passes all constraints.
+        The events are not kept.
+        """
+        n_appended = 0
+        is_valid = True
+        for event in events:
+            for i, (checker, state) in enumerate(self.incremental):
+                self.statistics.checks = self.statistics.checks + 1
+                if not checker.check_append(state, event):
+                    self._undo(i)
+                    is_valid = False
+                    break
+            if not is_valid:
+                break
+            n_appended = n_appended + 1
+        if is_valid and self.constraints:
+            context = FiniteSequence(seq.events + events)
+            for constraint in self.constraints:
+                self.statistics.checks = self.statistics.checks + 1
+                if not constraint(context):
+                    is_valid = False
+                    break
+        for _ in range(n_appended):
+            self.undo()
+        return is_valid
+
+    def domain(self, choices: List[int]) -> Tuple[List[int], List[int]]:
+        """Filter choices (pitches) for the next event by the domains of
+        the incremental constraints. Return (remaining choices, excluded choices).
+        """
+        mask = ALL_PITCHES
+        for checker, state in self.incremental:
+            checker_mask = checker.domain(state)
+            if checker_mask is not None:
+                mask = mask & checker_mask
+        if mask == ALL_PITCHES:
+            return choices, []
+        remaining = []
+        excluded = []
+        for pitch in choices:
+            if mask >> pitch & 1:
+                remaining.append(pitch)
+            else:
+                excluded.append(pitch)
+        return remaining, excluded
+
+    def explain(self, event: Event) -> Set[int]:
+        """Return the indexes of the events implicated in event failing the
+        incremental constraints. Any failed constraint explains the failure,
+        so the conflicts that reach back the least far are returned.
+        """
+        best = None
+        for checker, state in self.incremental:
+            self.statistics.checks = self.statistics.checks + 1
+            if not checker.check(state, event):
+                conflicts = set(checker.conflicts(state, event))
+                if best is None or max(conflicts, default=-1) < max(best, default=-1):
+                    best = conflicts
+                if best == set():
+                    break
+        if best is None:
+            return set(range(len(self.incremental[0][1].events)))
+        return best
+
+    def _undo(self, n_checkers: int):
+        for checker, state in self.incremental[:n_checkers]:
+            checker.undo(state)
+
+    def undo(self):
+        """Remove the last appended event.
+        """
+        self._undo(len(self.incremental))
+
 def develop(seed: FiniteSequence, **kwargs) -> Sequence:
     """Grow a sequence from a given 'seed' (motive).
     The process does not operate in realtime, and may well
@@ -48,14 +297,27 @@ def develop(seed: FiniteSequence, **kwargs) -> Sequence:
     adjust_weights: If True, adjust the weighting of the mutators at
     each stage, so that mutators that result in passing results are
     weighted up, and vice versa.
+
+    statistics - an optional SearchStatistics (each mutation is a node).
+
+    timeout, max_nodes - a budget (in seconds, and mutations). Once it is
+    spent, the sequence developed so far is returned.
+
+    progress - a callback, which is called with the SearchStatistics
+    every progress_interval seconds (Default 1).
     """
     opts = {
         "mutators": [],
         "constraints": [],
         "adjust_weights": True,
-        "min_beats": 1
+        "min_beats": 1,
+        "statistics": None
     }
     opts.update(kwargs)
+    statistics = opts["statistics"]
+    if statistics is None:
+        statistics = SearchStatistics()
+    budget = SearchBudget(opts, statistics)
     try:
         weights = [y for (x,y) in opts["mutators"]]
         mutators = [x for (x,y) in opts["mutators"]]
@@ -63,11 +325,14 @@ def develop(seed: FiniteSequence, **kwargs) -> Sequence:
         weights = [Decimal(1) for i in range(len(opts["mutators"]))]
         mutators = opts["mutators"]
     result = FiniteSequence(seed.events)
+    statistics.update_best_partial(result)
     transformed = result.events
     while sum([evt.duration for evt in result.events]) < opts["min_beats"]:
         is_searching = True
         while is_searching:
 
+            if budget.is_active and budget.is_spent():
+                return result
             if set(weights) == {0}:
                 raise DeadEndReached(
                     "The solver ran into a dead-end. Please try again, or adjust the parameters.")
@@ -76,11 +341,13 @@ def develop(seed: FiniteSequence, **kwargs) -> Sequence:
 
             transformed = list(mutator(Sequence(transformed)))
             candidate = FiniteSequence(result.events + transformed)
+            statistics.nodes = statistics.nodes + 1
 
            # test that the whole sequence meets the given constraints
             # cycle until we have a sequence that passes checks
             is_searching = False
             for constraint in opts["constraints"]:
+                statistics.checks = statistics.checks + 1
                 if not constraint(candidate):
                     is_searching = True
                     break
@@ -93,17 +360,190 @@ def develop(seed: FiniteSequence, **kwargs) -> Sequence:
                 continue
 
             result = candidate
+            statistics.update_best_partial(result)
             # adjust weights, positive bias
             if opts["adjust_weights"] and weights[mutators.index(mutator)] < 1:
                 weights[mutators.index(mutator)] = weights[mutators.index(mutator)] + Decimal('0.1')
+    budget.update()
     return result
 
+class _PoolOptions:
+    """The options (eg the mutators, constraints and fitness function of
+    a beam_develop call) used by the tasks of a process pool.
+    The pool's initializer stores the options in each worker process, under
+    a key that is unique to the pool, and each task is given the key.
+    This means the options are only sent to a worker once, when it starts.
+    It also means that several pools can be in use in one process at once.
+    """
+    _keys = itertools.count()
+    _options: Dict[int, tuple] = {}
+
+    @classmethod
+    def new_executor(cls, n_workers: int, options: tuple) -> Tuple[ProcessPoolExecutor, int]:
+        """Start a process pool whose workers have the given options.
+        Returns the pool and its key.
+        """
+        key = next(cls._keys)
+        executor = ProcessPoolExecutor(
+            max_workers=n_workers,
+            initializer=cls.set_options,
+            initargs=(key, options))
+        return executor, key
+
+    @classmethod
+    def set_options(cls, key: int, options: tuple):
+        """Store the options of a pool (run in each worker process as it starts).
+        """
+        cls._options[key] = options
+
+    @classmethod
+    def call(cls, func: Callable, key: int, *args):
+        """Call func(*args, *options), with the options of the pool with the given key.
+        """
+        return func(*args, *cls._options[key])
+
+def _expand_beam(
+    beam: Tuple[List[Event], List[Event]],
+    mutators: List,
+    constraints: List[Constraint],
+    fitness: Callable):
+    """Apply every mutator to the last developed events of a beam.
+    Return (mutator index, transformed events, score) for each valid candidate,
+    and the number of candidates evaluated.
+    """
+    events, transformed = beam
+    seq = FiniteSequence(events)
+    checker = _ConstraintChecker(constraints, seq)
+    expanded = []
+    for i, mutator in enumerate(mutators):
+        candidate_events = list(mutator(Sequence(transformed)))
+        if not candidate_events or not checker.check_extension(seq, candidate_events):
+            continue
+        score = fitness(FiniteSequence(events + candidate_events))
+        expanded.append((i, candidate_events, score))
+    return expanded, len(mutators)
+
+def beam_develop(seed: FiniteSequence, **kwargs) -> FiniteSequence:
+    """Grow a sequence from a given 'seed' (motive), as develop(),
+    but with a beam search: at each stage every mutator is applied
+    to each of the best beam_width sequences found so far, and the
+    beam_width best candidates (as scored by the fitness function) are kept.
+    Raises DeadEndReached if none of the candidates pass the constraints.
+    The process is controlled by the following kwargs:
+
+    fitness - (required) a function that scores a candidate FiniteSequence.
+    Higher scores are better.
+
+    min_beats - controls the length of the sequence. The best candidate
+    that reaches min_beats is returned.
+
+    mutators - list of transformers (as for develop. Weights are ignored.)
+
+    constraints - list of constraints. The entire sequence must pass all
+    constraints in order to be deemed valid.
+
+    beam_width - the number of sequences kept at each stage. (Default 4)
+
+    n_workers - evaluate the candidates in this many processes
+    (defaults to evaluating them in the current process). The mutators,
+    constraints and fitness function are sent to the worker processes
+    when they are started, so should be picklable when processes are spawned,
+    rather than forked.
+
+    statistics - a BeamStatistics, updated with the number of candidates
+    evaluated and the throughput.
+    eg
+        stats = BeamStatistics()
+        seq = beam_develop(seed, mutators=[...], constraints=[...],
+            fitness=lambda seq: -len(set(seq.pitches)), min_beats=32, statistics=stats)
+        stats.throughput
+    """
+    opts = {
+        "mutators": [],
+        "constraints": [],
+        "fitness": None,
+        "min_beats": 1,
+        "beam_width": 4,
+        "n_workers": None,
+        "statistics": None
+    }
+    opts.update(kwargs)
+    if opts["fitness"] is None:
+        raise Exception("beam_develop() requires a fitness function")
+    if opts["beam_width"] < 1:
+        raise Exception("beam_develop() beam_width should be 1 or greater")
+    statistics = opts["statistics"]
+    if statistics is None:
+        statistics = BeamStatistics()
+    if sum(evt.duration for evt in seed.events) >= opts["min_beats"]:
+        return FiniteSequence(seed.events[:])
+    # each beam is (events, the last developed events)
+    beams = [(seed.events[:], seed.events[:])]
+
+    options = (
+        [m[0] if isinstance(m, tuple) else m for m in opts["mutators"]],
+        opts["constraints"],
+        opts["fitness"])
+    if opts["n_workers"] is not None and opts["n_workers"] > 1:
+        executor, key = _PoolOptions.new_executor(opts["n_workers"], options)
+        expand_beam = functools.partial(_PoolOptions.call, _expand_beam, key)
+        map_beams = executor.map
+    else:
+        executor = None
+        expand_beam = functools.partial(_expand_beam_with, options)
+        map_beams = map
+    try:
+        while True:
+            started = time.perf_counter()
+            results = list(map_beams(expand_beam, beams))
+            statistics.elapsed = statistics.elapsed + time.perf_counter() - started
+            statistics.steps = statistics.steps + 1
+            beams = _best_beams(beams, results, opts["beam_width"], statistics)
+            for events, _ in beams:
+                if sum(evt.duration for evt in events) >= opts["min_beats"]:
+                    return FiniteSequence(events)
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+
+def _expand_beam_with(options: tuple, beam: Tuple[List[Event], List[Event]]):
+    return _expand_beam(beam, *options)
+
+def _best_beams(
+    beams: List[Tuple[List[Event], List[Event]]],
+    results: List[Tuple[list, int]],
+    beam_width: int,
+    statistics: BeamStatistics) -> List[Tuple[List[Event], List[Event]]]:
+    """Return the beam_width best (distinct) candidates from expanding the beams
+    (see _expand_beam), as new beams.
+    Raises DeadEndReached if there are no valid candidates.
+    """
+    candidates = []
+    seen = set()
+    for (events, _), (expanded, n_candidates) in zip(beams, results):
+        statistics.candidates = statistics.candidates + n_candidates
+        statistics.valid = statistics.valid + len(expanded)
+        for _, transformed, score in expanded:
+            candidate = events + transformed
+            key = tuple((tuple(evt.pitches), evt.duration) for evt in candidate)
+            if key in seen:
+                continue
+            seen.add(key)
+            candidates.append((score, candidate, transformed))
+    if not candidates:
+        raise DeadEndReached(
+            "The solver ran into a dead-end. Please try again, or adjust the parameters.")
+    # sorted() is stable, so equal scores keep the order of the mutators
+    candidates = sorted(candidates, key=lambda c: c[0], reverse=True)
+    return [(candidate, transformed) for _, candidate, transformed in candidates[:beam_width]]
+
 def backtracking_markov_solver(
         starting_event: Event,
         table: Dict[int, Dict[int, int]],
         **kwargs) -> FiniteSequence:
     """Compose a melodic sequence based upon the
     domain and constraints given.
+    (See backtracking_markov_solutions, for more than one solution.)
 
     starting_event: Event dictate the starting pitch.
     All subsequent events will be of similar duration.
@@ -117,35 +557,83 @@ def backtracking_markov_solver(
 
     n_events - the number of notes of the desired target
     sequence. (Default 1)
+
+    statistics, timeout, max_nodes, progress, cache - as backtracking_solver.
+    """
+    statistics = kwargs.get("statistics")
+    if statistics is None:
+        statistics = SearchStatistics()
+    kwargs = dict(kwargs, statistics=statistics)
+    for solution in backtracking_markov_solutions(starting_event, table, **kwargs):
+        return solution
+    if statistics.budget_exhausted:
+        return statistics.best_partial
+    raise AllRoutesExhausted("Unable to solve!")
+
+def backtracking_markov_solutions(
+        starting_event: Event,
+        table: Dict[int, Dict[int, int]],
+        **kwargs) -> Iterator[FiniteSequence]:
+    """Generate distinct solutions from a single backtracking_markov_solver
+    search, in the order that they are found.
+    Takes the same kwargs as backtracking_markov_solver.
     """
     opts = {
         "constraints": [],
         "heuristics": [],
-        "n_events": 1
+        "n_events": 1,
+        "statistics": None
     }
     opts.update(kwargs)
     constraints = opts["constraints"]
     heuristics = opts["heuristics"]
     n_events = opts["n_events"]
+    statistics = opts["statistics"]
+    if statistics is None:
+        statistics = SearchStatistics()
+    budget = SearchBudget(opts, statistics)
 
     tick = 0
     seq = FiniteSequence([starting_event])
+    statistics.update_best_partial(seq)
 
     if n_events == 1:
-        return FiniteSequence(seq)
+        yield FiniteSequence(seq)
+        return
 
 
     for constraint in constraints:
         if not constraint(seq):
             raise InputViolatesConstraints("Unable to solve!")
 
-    dead_paths = []
+    checker = _ConstraintChecker(constraints, seq, statistics, opts.get("cache"))
+    solved = set()
+    # every path that has been explored is a nogood
+    dead_paths = _Nogoods(statistics)
     choices = list(range(12))
     previous_note = seq.events[-1].pitches[-1]
     previous_note_pc = previous_note % 12
     weights = list(table[previous_note_pc].values())
-    while tick < n_events-1:
+    while True:
+        if tick == n_events - 1:
+            key = tuple(event.pitches[-1] for event in seq.events)
+            if key not in solved:
+                solved.add(key)
+                budget.update()
+                yield FiniteSequence(seq.events[:])
+            # continue the search, excluding this solution
+            dead_paths.add_path(seq)
+            seq = seq[:-1]
+            checker.undo()
+            tick = tick - 1
+            previous_note = seq.events[-1].pitches[-1]
+            previous_note_pc = previous_note % 12
+            weights = list(table[previous_note_pc].values())
+            choices = list(range(12))
 
+        if budget.is_active and budget.is_spent():
+            statistics.update_best_partial(seq)
+            return
         try:
 
             pitch = random.choices(choices, weights)[0]
@@ -157,27 +645,28 @@ def backtracking_markov_solver(
 
         except IndexError:
             # this was thrown because we ran out of choices (we have reached a dead-end)
-            dead_paths.append(seq[:])
+            statistics.backtracks = statistics.backtracks + 1
+            # seq is only shortened here, so the longest partial solution is kept here
+            statistics.update_best_partial(seq)
+            if tick == 0:
+                # all routes are exhausted
+                budget.update()
+                return
+            dead_paths.add_path(seq)
             seq = seq[:-1]
+            checker.undo()
             tick = tick -1
             previous_note = seq.events[-1].pitches[-1]
             previous_note_pc = previous_note % 12
             weights = list(table[previous_note_pc].values())
             choices = list(range(12))
             # choices = list(range(NOTE_MIN, NOTE_MAX))
-            if tick == 0:
-                raise AllRoutesExhausted("Unable to solve!")
             continue
-        context = FiniteSequence(seq.events[:])
-        context.events.append(note)
-
-        results = {True}
-        for constraint in constraints:
-            results.update([constraint(context)])
-        candidate = seq[:]
-        candidate.events.append(note)
+        statistics.nodes = statistics.nodes + 1
+        is_valid = dead_paths.match(seq, len(seq.events), _pitch) is None\
+            and checker.append(seq, note)
 
-        if results == {True} and candidate not in dead_paths:
+        if is_valid:
             seq.events.append(note)
             tick = tick + 1
             choices = list(range(12))
@@ -190,13 +679,13 @@ def backtracking_markov_solver(
             i = choices.index(pitch)
             del weights[i]
             del choices[i]
-    return seq
 
 def backtracking_solver(
         starting_event: Event,
         **kwargs) -> FiniteSequence:
     """Compose a melodic sequence based upon the
     domain and constraints given.
+    (See backtracking_solutions, for more than one solution.)
 
     starting_event: Event dictate the starting pitch.
     All subsequent events will be of similar duration.
@@ -210,23 +699,67 @@ def backtracking_solver(
 
     n_events - the number of notes of the desired target
     sequence. (Default 1)
+
+    statistics - an optional SearchStatistics, which is updated
+    with the work done by the search.
+
+    timeout, max_nodes - a budget for the search (in seconds, and
+    candidate events). Once it is spent, the longest partial
+    solution is returned (and statistics.budget_exhausted is set).
+
+    progress - a callback, which is called with the SearchStatistics
+    every progress_interval seconds (Default 1).
+
+    cache - a ConstraintCache for the results of constraints that declare
+    a Lookback (so that it can be shared between searches).
+
+    On a dead-end, the solver jumps back to the most recent event
+    implicated in the failure (see IncrementalConstraint.conflicts),
+    and records the implicated pitches as a nogood, so that
+    the same combination is not tried again.
+    """
+    statistics = kwargs.get("statistics")
+    if statistics is None:
+        statistics = SearchStatistics()
+    for solution in backtracking_solutions(starting_event, **dict(kwargs, statistics=statistics)):
+        return solution
+    if statistics.budget_exhausted:
+        return statistics.best_partial
+    raise AllRoutesExhausted("Unable to solve!")
+
+def backtracking_solutions(
+        starting_event: Event,
+        **kwargs) -> Iterator[FiniteSequence]:
+    """Generate distinct solutions from a single backtracking search,
+    in the order that they are found. The search (including its nogoods)
+    is kept between solutions, so the failed branches are not re-explored.
+    Takes the same kwargs as backtracking_solver. The generator stops when
+    the search is exhausted, or its budget is spent.
+    Raises InputViolatesConstraints if starting_event violates the constraints.
+    eg
+        solutions = backtracking_solutions(Event([60], 1), constraints=[...], n_events=8)
+        first_ten = list(itertools.islice(solutions, 10))
     """
     opts = {
         "constraints": [],
         "heuristics": [],
-        "n_events": 1
+        "n_events": 1,
+        "statistics": None
     }
     opts.update(kwargs)
     constraints = opts["constraints"]
-    heuristics = opts["heuristics"]
     n_events = opts["n_events"]
+    statistics = opts["statistics"]
+    if statistics is None:
+        statistics = SearchStatistics()
+    budget = SearchBudget(opts, statistics)
 
-    tick = 0
     seq = FiniteSequence([starting_event])
-    use_weights = len(heuristics) > 0
+    statistics.update_best_partial(seq)
 
     if n_events == 1:
-        return FiniteSequence(seq)
+        yield FiniteSequence(seq)
+        return
 
     results = set()
     for constraint in constraints:
@@ -234,45 +767,313 @@ def backtracking_solver(
     if results != {True}:
         raise InputViolatesConstraints("Unable to solve!")
 
-    choices = list(range(NOTE_MIN, NOTE_MAX))
-    dead_paths = []
-    while tick < n_events-1:
+    search = _BackjumpingSearch(
+        seq,
+        _ConstraintChecker(constraints, seq, statistics, opts.get("cache")),
+        statistics,
+        starting_event.duration)
+    chooser = _PitchChooser(opts["heuristics"], n_events)
+    solved = set()
+    while True:
+        if len(seq.events) == n_events:
+            key = tuple(event.pitches[-1] for event in seq.events)
+            if key not in solved:
+                solved.add(key)
+                budget.update()
+                yield FiniteSequence(seq.events[:])
+            search.continue_from_solution()
+        position = len(seq.events)
+        choices = search.choices(position)
+        if choices == []:
+            if not search.backjump(position):
+                # all routes are exhausted
+                budget.update()
+                return
+            continue
+
+        if budget.is_active and budget.is_spent():
+            statistics.update_best_partial(seq)
+            return
+
+        pitch = chooser.choose(position, choices)
+        # this choice is tried once at this position
+        choices.remove(pitch)
+        statistics.nodes = statistics.nodes + 1
+        search.try_pitch(position, pitch)
+
+class _Nogoods:
+    """Combinations of (position, pitch) that are known not to lead to a solution.
+    Each nogood is hashed by its last (position, pitch), so a candidate is
+    only checked against the nogoods that end with it.
+    """
+
+    def __init__(self, statistics: SearchStatistics):
+        # {(position, pitch): [((position, pitch), ...) ...]}
+        self._nogoods: Dict[Tuple[int, int], List[Tuple[Tuple[int, int], ...]]] = {}
+        self.statistics = statistics
+
+    def add(self, nogood: Tuple[Tuple[int, int], ...]):
+        """Record a nogood, given in order of position.
+        """
+        self._nogoods.setdefault(nogood[-1], []).append(nogood[:-1])
+        self.statistics.nogoods = self.statistics.nogoods + 1
+
+    def add_path(self, seq: FiniteSequence):
+        """Record the pitches of every event in seq as a nogood.
+        """
+        self.add(tuple((i, event.pitches[-1]) for i, event in enumerate(seq.events)))
+
+    def match(self,
+        seq: FiniteSequence,
+        position: int,
+        pitch: int) -> Optional[Tuple[Tuple[int, int], ...]]:
+        """If placing pitch at position (after the events of seq) completes a nogood,
+        return the nogood's earlier (position, pitch) pairs. Otherwise return None.
+        """
+        for others in self._nogoods.get((position, pitch), []):
+            if all(seq.events[i].pitches[-1] == other for i, other in others):
+                self.statistics.nogood_prunes = self.statistics.nogood_prunes + 1
+                return others
+        return None
+
+class _PitchChooser:
+    """Picks the next pitch to try at a position, weighted by the heuristics
+    (or uniformly at random, if there are none).
+    The weights of heuristics that only depend upon the tick are
+    computed once, the rest at every tick.
+    """
+
+    def __init__(self, heuristics: List, n_events: int):
+        self.use_weights = len(heuristics) > 0
+        tabled = [h for h in heuristics if isinstance(h, Heuristic) and h.tick_only]
+        self.per_tick = [h for h in heuristics if h not in tabled]
+        self.table = weight_table(tabled, n_events)
+
+    def choose(self, position: int, choices: List[int]) -> int:
+        """Return one of choices, for the event at position.
+        """
+        if not self.use_weights:
+            return random.choice(choices)
+        weights = self.table[position - 1, choices]
+        if self.per_tick:
+            weights = weights.tolist()
+            for heuristic in self.per_tick:
+                weights = heuristic(position - 1, choices, weights)
+        # equivalent to random.choices(choices, weights)
+        cum_weights = np.cumsum(weights)
+        i_choice = np.searchsorted(cum_weights, random.random() * cum_weights[-1], side="right")
+        return choices[min(i_choice, len(choices) - 1)]
+
+class _BackjumpingSearch:
+    """The state of a conflict-directed backjumping search over the events of seq
+    (see backtracking_solutions).
+    For each position in seq it keeps the untried pitches (the domain),
+    the pitches excluded by the constraint domains, and the conflict set:
+    the earlier positions implicated in the failures at that position.
+    """
 
-        if use_weights:
-            weights= [1.0 for i in range(len(choices))]
-            for heuristic in heuristics:
-                weights = heuristic(tick, choices, weights)
+    def __init__(self,
+        seq: FiniteSequence,
+        checker: _ConstraintChecker,
+        statistics: SearchStatistics,
+        duration):
+        self.seq = seq
+        self.checker = checker
+        self.statistics = statistics
+        self.duration = duration
+        self.domains: Dict[int, List[int]] = {}
+        self.excluded: Dict[int, List[int]] = {}
+        self.conflict_sets: Dict[int, Set[int]] = {}
+        self.nogoods = _Nogoods(statistics)
 
+    def choices(self, position: int) -> List[int]:
+        """The untried pitches at position (the list is updated in place).
+        """
+        if position not in self.domains:
+            self.domains[position], self.excluded[position] =\
+                self.checker.domain(list(range(NOTE_MIN, NOTE_MAX)))
+            self.conflict_sets[position] = set()
+            self.statistics.domain_prunes = self.statistics.domain_prunes\
+                + len(self.excluded[position])
+        return self.domains[position]
+
+    def try_pitch(self, position: int, pitch: int) -> bool:
+        """Append pitch to seq, if it passes the nogoods and constraints.
+        Otherwise add the positions implicated in its failure to the
+        conflict set of position, and return False.
+        """
+        others = self.nogoods.match(self.seq, position, pitch)
+        if others is not None:
+            self.conflict_sets[position].update(i for i, _ in others)
+            return False
+        note = Event([pitch], self.duration)
+        if self.checker.append(self.seq, note):
+            self.seq.events.append(note)
+            return True
+        self.conflict_sets[position].update(self.checker.conflicts)
+        return False
+
+    def continue_from_solution(self):
+        """Remove the last event of a solution, so that the search can continue
+        from it. Every event is implicated in the solution, so none are jumped over.
+        """
+        last = len(self.seq.events) - 1
+        self.seq.events.pop()
+        self.checker.undo()
+        self.conflict_sets[last].update(range(last))
+
+    def backjump(self, position: int) -> bool:
+        """Handle a dead-end at position (no pitches are left to try):
+        jump back to the latest event implicated in the failure of every
+        pitch at this position, and record the implicated pitches as a nogood.
+        Returns False if all routes are exhausted.
+        """
+        conflicts = self.conflict_sets[position]
+        for pitch in self.excluded[position]:
+            conflicts.update(self.checker.explain(Event([pitch], self.duration)))
+        self.statistics.backtracks = self.statistics.backtracks + 1
+        # seq is only shortened at dead-ends, so the longest partial
+        # solution can be kept here (rather than at every event)
+        self.statistics.update_best_partial(self.seq)
+        if not conflicts or max(conflicts) == 0:
+            return False
+        target = max(conflicts)
+        self.nogoods.add(tuple((i, self.seq.events[i].pitches[-1]) for i in sorted(conflicts)))
+        if position - target > 1:
+            self.statistics.backjumps = self.statistics.backjumps + 1
+        while len(self.seq.events) > target:
+            self.seq.events.pop()
+            self.checker.undo()
+        for i in range(target + 1, position + 1):
+            del self.domains[i]
+            del self.conflict_sets[i]
+            del self.excluded[i]
+        self.conflict_sets[target].update(conflicts)
+        self.conflict_sets[target].discard(target)
+        return True
+
+_END_OF_SOLUTIONS = object()
+
+def prefetch(solutions: Iterator[FiniteSequence], n_ahead: int = 1) -> Iterator[FiniteSequence]:
+    """Find up to n_ahead solutions ahead of the consumer, on a background
+    thread, so that (for example) solution k can be played while k+1 is found.
+    Exceptions raised by the solver are re-raised to the consumer.
+    eg
+        solutions = prefetch(backtracking_solutions(Event([60], 1), n_events=8, ...))
+        melody = Sequence(events=itertools.chain.from_iterable(
+            solution.events for solution in solutions))
+        Context.get_context().new_sequencer().add_sequence(melody).playback()
+    """
+    if n_ahead < 1:
+        raise Exception("prefetch() n_ahead should be 1 or greater")
+    found: queue.Queue = queue.Queue(maxsize=n_ahead)
+    stopped = threading.Event()
+
+    def put(item) -> bool:
+        while not stopped.is_set():
+            try:
+                found.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def search():
         try:
-            if use_weights:
-                note = Event([random.choices(choices, weights)[0]], starting_event.duration)
-            else:
-                note = Event([random.choice(choices)], starting_event.duration)
-        except IndexError:
-            # this was thrown because we ran out of choices (we have reached a dead-end)
-            dead_paths.append(seq[:])
-            seq = seq[:-1]
-            tick = tick -1
-            choices = list(range(NOTE_MIN, NOTE_MAX))
-            if tick == 0:
-                raise AllRoutesExhausted("Unable to solve!")
-            continue
-        context = FiniteSequence(seq.events[:])
-        context.events.append(note)
+            for solution in solutions:
+                if not put(solution):
+                    return
+        except Exception as e:
+            put(e)
+            return
+        put(_END_OF_SOLUTIONS)
 
-        results = set()
-        for constraint in constraints:
-            results.update([constraint(context)])
-        candidate = seq[:]
-        candidate.events.append(note)
-        if results == {True} and candidate not in dead_paths:
-            seq.events.append(note)
-            tick = tick + 1
-            choices = list(range(NOTE_MIN, NOTE_MAX))
-        else:
-            #this choice was bad, so we must exclude it
-            choices.remove(note.pitches[-1])
-    return seq
+    threading.Thread(target=search, daemon=True).start()
+    try:
+        while True:
+            item = found.get()
+            if item is _END_OF_SOLUTIONS:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        # stop the search once the consumer has finished
+        stopped.set()
+
+def _canon_specs(phrase: FiniteSequence) -> Iterator[Tuple[int, Optional[int], bool]]:
+    """Generate the (interval, displacement in beats or None, is retrograde)
+    of every canon of phrase, skipping those that are equivalent to one
+    already generated (ie the same apart from zero-length events).
+    """
+    displacements = [None] + [i2 for i2 in range(0, int(phrase.duration)) if i2 != 0]
+    is_palindrome = [(e.pitches, e.duration) for e in phrase.events]\
+        == [(e.pitches, e.duration) for e in reversed(phrase.events)]
+    # transpositions of a phrase of rests are all the same
+    intervals = range(0,12) if phrase.pitches else [0]
+    for i1 in intervals:
+        for i2 in displacements:
+            yield (i1, i2, False)
+            if not is_palindrome:
+                yield (i1, i2, True)
+
+def _build_canon(phrase: FiniteSequence, spec: Tuple[int, Optional[int], bool]) -> FiniteSequence:
+    i1, i2, is_retrograde = spec
+    events = phrase.events[::-1] if is_retrograde else phrase.events
+    events = [e.extend(pitches=[p+i1 for p in e.pitches]) for e in events]
+    description = f"canon at {i1} semitones"
+    if is_retrograde:
+        description = "retrograde " + description
+    if i2 is not None:
+        events = [Event(duration=i2)] + events
+        description = description + f", {i2} beats"
+    return phrase.extend(events=events, meta={"canon": description})
+
+def _passes_constraints(constraints: List[Constraint], seq: FiniteSequence) -> bool:
+    # all() stops at the first failing constraint
+    return all(constraint(seq) for constraint in constraints)
+
+def _check_canon(spec: Tuple[int, Optional[int], bool],
+    phrase: FiniteSequence,
+    constraints: List[Constraint]) -> bool:
+    return _passes_constraints(constraints, _build_canon(phrase, spec))
+
+def iter_canons(
+    phrase: FiniteSequence,
+    constraints: Optional[List[Constraint]] = None,
+    n_workers: Optional[int] = None,
+    chunksize: int = 16) -> Iterator[FiniteSequence]:
+    """Generate the canons of a given phrase that obey the constraints,
+    building and testing each candidate on demand:
+    canon at any given interval (and displacement in beats)
+    retrograde canon (at any given interval and displacement)
+    Equivalent canons are only generated once.
+
+    n_workers - test the candidates in this many processes, which is
+    worthwhile for long phrases (defaults to testing them in the current process).
+    Candidates are tested in batches of n_workers * chunksize.
+    """
+    if constraints is None:
+        constraints = []
+    specs = _canon_specs(phrase)
+    if n_workers is None or n_workers <= 1:
+        for spec in specs:
+            canon = _build_canon(phrase, spec)
+            if _passes_constraints(constraints, canon):
+                yield canon
+        return
+    # only the specs of the candidates are sent to the workers
+    executor, key = _PoolOptions.new_executor(n_workers, (phrase, constraints))
+    check_canon = functools.partial(_PoolOptions.call, _check_canon, key)
+    with executor:
+        while True:
+            batch = list(itertools.islice(specs, n_workers * chunksize))
+            if not batch:
+                return
+            results = executor.map(check_canon, batch, chunksize=chunksize)
+            for spec, is_valid in zip(batch, results):
+                if is_valid:
+                    yield _build_canon(phrase, spec)
 
 def canon_finder(
     phrase: FiniteSequence,
@@ -282,26 +1083,6 @@ def canon_finder(
     canon at any given interval that obeys constraints
     retrograde canon
     inversion canon
+    (See iter_canons, to generate the canons on demand.)
     """
-    canons = []
-    for i1 in range(0,12):
-        interval_canon = phrase.extend(
-            events=[e.extend(pitches=[p+i1 for p in e.pitches]) for e in phrase.events],
-            meta={"canon":f"canon at {i1} semitones"})
-        canons.append(interval_canon)
-        canons.append(interval_canon.retrograde().extend(meta={"canon":f"retrograde canon at {i1} semitones"}))
-        for i2 in range(0, int(phrase.duration)):
-            displacement_canon = interval_canon.extend(
-                events=[Event(duration=i2)] + interval_canon.events,
-                meta={"canon":f"canon at {i1} semitones, {i2} beats"})
-            canons.append(displacement_canon)
-            canons.append(displacement_canon.retrograde().extend(
-                meta={"canon":f"retrograde canon at {i1} semitones, {i2} beats"}))
-    keepers = []
-    for canon in canons:
-        results = set()
-        for constraint in constraints:
-            results.update([constraint(canon)])
-        if results == {True}:
-            keepers.append(canon)
-    return keepers
+    return list(iter_canons(phrase, constraints))
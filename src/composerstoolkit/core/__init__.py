@@ -1,8 +1,10 @@
 from . sequence import *
 from . graph import *
+from . interval_index import *
 from . sequencer import *
 from . annotations import *
 from . synth import *
 from . midi import *
+from . smf import *
 from . dynamic_properties import *
 from . hot_reloader import init_reloader
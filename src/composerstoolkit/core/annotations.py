@@ -4,7 +4,7 @@ import os
 from time import sleep
 import signal
 import sys
-from typing import Any, Dict, List, Optional, Callable, Iterator, Set
+from typing import Any, Dict, Iterable, List, Optional, Callable, Iterator, Set
 from threading import Thread
 
 import itertools
@@ -13,6 +13,8 @@ import functools
 from midiutil.MidiFile import MIDIFile # type: ignore
 from mido import MidiTrack, Message # type: ignore
 
+from . sequence import FiniteSequence
+
 class ReprWrapper:
     """helper to override __repr__ for a function for debugging purposes
     see https://stackoverflow.com/questions/10875442/possible-to-change-a-functions-repr-in-python
@@ -56,6 +58,190 @@ class Transformer():
     def __str__(self):
         return "<Transformer : {}>".format(self._functor.__name__)
 
+# a bitmask with a bit set for every MIDI pitch (see IncrementalConstraint.domain)
+ALL_PITCHES = (1 << 128) - 1
+
+def pitch_mask(pitches: Iterable[int]) -> int:
+    """Return a bitmask with the bit of each (MIDI) pitch set.
+    """
+    mask = 0
+    for pitch in pitches:
+        if 0 <= pitch < 128:
+            mask = mask | (1 << pitch)
+    return mask
+
+def pitch_range_mask(lowest: int, highest: int) -> int:
+    """Return a bitmask of the pitches lowest...highest (inclusive).
+    """
+    lowest = max(lowest, 0)
+    highest = min(highest, 127)
+    if highest < lowest:
+        return 0
+    return ((1 << (highest - lowest + 1)) - 1) << lowest
+
+class ConstraintState:
+    """The events that have been accepted by an IncrementalConstraint,
+    with the offset that each event ends at.
+    """
+    __slots__ = ("events", "offsets")
+
+    def __init__(self):
+        self.events = []
+        self.offsets = []
+
+    @property
+    def duration(self):
+        return self.offsets[-1] if self.offsets else 0
+
+    @property
+    def last(self):
+        return self.events[-1] if self.events else None
+
+    def push(self, event):
+        self.offsets.append(self.duration + event.duration)
+        self.events.append(event)
+
+    def pop(self):
+        self.offsets.pop()
+        return self.events.pop()
+
+class IncrementalConstraint:
+    """Optional interface that lets a solver test a constraint one
+    event at a time, rather than re-testing the whole sequence
+    every time that an event is appended.
+    Implementations are registered with @constraint_x.incremental, and
+    are constructed with the same arguments as the constraint.
+    check(state, event) should return the same result as the constraint
+    would for the state's events plus event, given that the
+    state's events already pass.
+    """
+
+    def init(self, events=()) -> ConstraintState:
+        """Return a new state, containing events (which are not tested).
+        """
+        state = ConstraintState()
+        for event in events:
+            state.push(event)
+        return state
+
+    def check(self, state: ConstraintState, event) -> bool:
+        raise NotImplementedError("check")
+
+    def check_append(self, state: ConstraintState, event) -> bool:
+        """Test event against the constraint. If it passes,
+        append it to state.
+        """
+        if not self.check(state, event):
+            return False
+        state.push(event)
+        return True
+
+    def undo(self, state: ConstraintState):
+        """Remove the last event appended to state.
+        """
+        state.pop()
+
+    def conflicts(self, state: ConstraintState, event) -> Iterable[int]:
+        """Return the indexes of the events in state whose pitches
+        caused event to fail check(). Defaults to every event.
+        event is None for the pitches excluded by domain().
+        """
+        return range(len(state.events))
+
+    def domain(self, state: ConstraintState) -> Optional[int]:
+        """Return a bitmask (see pitch_mask) of the pitches that a
+        single pitch event could have and still pass check(), or None
+        if the constraint does not restrict them. Solvers don't
+        generate the excluded pitches.
+        The mask may include pitches that fail, but must not exclude
+        any that pass.
+        """
+        return None
+
+@dataclass(frozen=True)
+class Lookback:
+    """Declares the bounded suffix of a sequence (the window) that a
+    constraint depends upon: a sequence whose events (apart from the last)
+    pass the constraint passes if, and only if, its window passes.
+    n_events - the window is the last n_events events
+    n_beats - the window is the events that sound within the last n_beats beats
+    Declared with @constraint_x.lookback (see Constraint).
+    """
+    n_events: Optional[int] = None
+    n_beats: Optional[float] = None
+
+    def window(self, events: List, end: Optional[int] = None) -> List:
+        """Return the window of events[:end].
+        """
+        if end is None:
+            end = len(events)
+        if self.n_events is not None:
+            return events[max(end - self.n_events, 0):end]
+        # the events that end after, or start at, the start of the window
+        # (the same events as FiniteSequence.time_slice)
+        start = end
+        remaining = self.n_beats
+        while start > 0:
+            duration = events[start - 1].duration
+            if remaining <= 0 and (duration > 0 or remaining < 0):
+                break
+            remaining = remaining - duration
+            start = start - 1
+        return events[start:end]
+
+class ConstraintCache:
+    """Memoizes the results of constraints that declare a Lookback, keyed
+    upon the constraint and the pitches and durations of its window.
+    Constraints are evaluated against the window only, rather than the
+    whole sequence. Results are only valid for sequences whose events
+    (apart from the last) are already known to pass, as in a
+    step-wise solver.
+    The cache is emptied once it holds max_size results.
+    """
+
+    def __init__(self, max_size: int = 100000):
+        self.max_size = max_size
+        self.results: Dict = {}
+        self.hits = 0
+        self.misses = 0
+        self._lookbacks: Dict = {}
+
+    def lookback(self, constraint) -> Optional[Lookback]:
+        """Return the Lookback of a constraint (or None), once per constraint.
+        """
+        try:
+            return self._lookbacks[constraint]
+        except KeyError:
+            pass
+        lookback = constraint.lookback() if hasattr(constraint, "lookback") else None
+        self._lookbacks[constraint] = lookback
+        return lookback
+
+    def check(self, constraint, events: List, end: Optional[int] = None) -> bool:
+        """Test events[:end] against constraint, given that
+        events[:end - 1] pass.
+        """
+        lookback = self.lookback(constraint)
+        if lookback is None:
+            return constraint(FiniteSequence(events[:end]))
+        window = lookback.window(events, end)
+        key = (constraint, tuple((tuple(e.pitches), e.duration) for e in window))
+        try:
+            result = self.results[key]
+            self.hits = self.hits + 1
+            return result
+        except KeyError:
+            pass
+        self.misses = self.misses + 1
+        result = constraint(FiniteSequence(window))
+        if len(self.results) >= self.max_size:
+            self.results.clear()
+        self.results[key] = result
+        return result
+
+def _make_konstraint(constraint: Constraint, args, kwargs) -> Constraint.Konstraint:
+    return constraint(*args, **kwargs)
+
 class Constraint():
     """Wrapper class for constraint functions.
     Can be used as a decorator, making it easy to
@@ -66,21 +252,73 @@ class Constraint():
             self.args = args
             self.kwargs = kwargs
             self.functor = functor
+            self.incremental_type = None
+            self.lookback_type = None
+            self.constraint = None
+        def lookback(self) -> Optional[Lookback]:
+            """Return the Lookback of the constraint,
+            or None if it depends upon the whole sequence.
+            """
+            if self.lookback_type is None:
+                return None
+            return self.lookback_type(*self.args, **self.kwargs)
+        def incremental(self) -> Optional[IncrementalConstraint]:
+            """Return an incremental implementation of the constraint,
+            or None if it does not have one.
+            """
+            if self.incremental_type is None:
+                return None
+            return self.incremental_type(*self.args, **self.kwargs)
         def __call__(self, context: Context) -> bool:
             _kwargs = self.kwargs
             _args = [context] + list(self.args)
             return self.functor(*_args, **_kwargs)
         def __or__(self, other):
             return lambda c: self(c) | other(c)
+        def __reduce__(self):
+            # pickled by reference to the module level Constraint,
+            # so that constraints can be sent to other processes
+            if self.constraint is None:
+                raise TypeError(f"cannot pickle {self!r}")
+            return (_make_konstraint, (self.constraint, self.args, self.kwargs))
         def __repr__(self):
             return "<Constraint: {}{}>".format(
             self.functor.__name__, self.args + tuple(self.kwargs.items()))
 
     def __init__(self, functor):
         self._functor = functor
+        self._incremental = None
+        self._lookback = None
+        self.__module__ = functor.__module__
+        self.__qualname__ = functor.__qualname__
+
+    def __reduce__(self):
+        return self.__qualname__
+
+    def incremental(self, cls):
+        """Decorator that registers an IncrementalConstraint
+        implementation of the constraint.
+        """
+        self._incremental = cls
+        return cls
+
+    def lookback(self, func):
+        """Decorator that registers a function, which is called with
+        the same arguments as the constraint, and returns its Lookback.
+        eg
+            @constraint_x.lookback
+            def _(max_int):
+                return Lookback(n_events=2)
+        """
+        self._lookback = func
+        return func
 
     def __call__(self, *args, **kwargs):
-        return Constraint.Konstraint(self._functor, *args, **kwargs)
+        konstraint = Constraint.Konstraint(self._functor, *args, **kwargs)
+        konstraint.incremental_type = self._incremental
+        konstraint.lookback_type = self._lookback
+        konstraint.constraint = self
+        return konstraint
 
     def __str__(self):
         return "<Constraint : {}>".format(self._functor.__name__)
@@ -1,13 +1,14 @@
 from __future__ import annotations
-from dataclasses import dataclass, field
-from decimal import Decimal
+from dataclasses import dataclass
 import os
 from time import sleep
 import signal
 import sys
-from typing import Any, Dict, List, Optional, Callable, Iterator, Set
+from typing import Any, Dict, Iterable, List, Optional, Callable, Iterator, Set, Tuple
 from threading import Thread
+from collections.abc import MutableSequence
 
+import heapq
 import itertools
 import functools
 
@@ -16,21 +17,126 @@ from mido import MidiTrack, Message # type: ignore
 import numpy
 import pandas as pd
 
-@dataclass
+from . interval_index import IntervalIndex
+from . smf import NoteArrays, notes_from_messages, read_midi_file
+
 class Edge:
     """Represents a pitch event in a Pitch graph
+    Once added to a Graph, an Edge is a view onto the graph's columnar
+    storage: its attributes and vertices are read from (and written to)
+    the graph. An edge can only belong to one graph.
     """
-    pitch: int
-    start_time: int
-    end_time: Optional[int] = None
-    vertices: List[Edge] = field(
-        repr = False,
-        default_factory = lambda: []
-    )
-    src_event: Optional[Message] = field(
-        repr = False,
-        default_factory = lambda: None
-    )
+    __slots__ = ("_graph", "_id", "_values", "_vertices")
+
+    def __init__(self,
+        pitch: int,
+        start_time: int,
+        end_time: Optional[int] = None,
+        vertices: Optional[List[Edge]] = None,
+        src_event: Optional[Message] = None):
+        self._graph: Optional[Graph] = None
+        self._id: Optional[int] = None
+        self._values: Dict[str, Any] = {
+            "pitch": pitch,
+            "start_time": start_time,
+            "end_time": end_time,
+            "src_event": src_event
+        }
+        self._vertices: List[Edge] = [] if vertices is None else vertices
+
+    def _bind(self, graph: Graph, edge_id: int):
+        """Make the edge a view onto the given edge id of graph.
+        """
+        self._graph = graph
+        self._id = edge_id
+        self._values = {}
+        self._vertices = []
+
+    def _get(self, column: str):
+        if self._graph is None:
+            return self._values[column]
+        return self._graph.get_value(self._id, column)
+
+    def _set(self, column: str, value):
+        if self._graph is None:
+            self._values[column] = value
+        else:
+            self._graph.set_value(self._id, column, value)
+
+    @property
+    def pitch(self) -> int:
+        """The MIDI pitch of the edge.
+        """
+        return self._get("pitch")
+
+    @pitch.setter
+    def pitch(self, value: int):
+        self._set("pitch", value)
+
+    @property
+    def start_time(self) -> int:
+        """The time (in beats) at which the edge starts.
+        """
+        return self._get("start_time")
+
+    @start_time.setter
+    def start_time(self, value: int):
+        self._set("start_time", value)
+
+    @property
+    def end_time(self) -> Optional[int]:
+        """The time (in beats) at which the edge ends (None if it is open).
+        """
+        return self._get("end_time")
+
+    @end_time.setter
+    def end_time(self, value: Optional[int]):
+        self._set("end_time", value)
+
+    @property
+    def src_event(self) -> Optional[Message]:
+        """The message that the edge was parsed from, if any.
+        """
+        return self._get("src_event")
+
+    @src_event.setter
+    def src_event(self, value: Optional[Message]):
+        self._set("src_event", value)
+
+    @property
+    def vertices(self) -> MutableSequence[Edge]:
+        """The edges that this edge is connected to.
+        For an edge in a graph, changes to the list are written to the graph.
+        """
+        if self._graph is None:
+            return self._vertices
+        return self._graph.get_vertices(self._id)
+
+    @property
+    def graph(self) -> Optional[Graph]:
+        """The graph that the edge belongs to (None if it has not been added to one).
+        """
+        return self._graph
+
+    @property
+    def edge_id(self) -> Optional[int]:
+        """The id of the edge in its graph.
+        """
+        return self._id
+
+    def __eq__(self, other: object) -> bool:
+        if other is self:
+            return True
+        if not isinstance(other, Edge):
+            return False
+        return (self.pitch, self.start_time, self.end_time, list(self.vertices), self.src_event) ==\
+            (other.pitch, other.start_time, other.end_time, list(other.vertices), other.src_event)
+
+    __hash__ = None # type: ignore
+
+    def __repr__(self):
+        return "Edge(pitch={!r}, start_time={!r}, end_time={!r})".format(
+            self.pitch, self.start_time, self.end_time)
 
 class MidiTrackParser:
     """Parse a Midi track into a pitch graph
@@ -53,71 +159,21 @@ class MidiTrackParser:
         """
         self.graph = graph
         self._midi_track = track
-        self._open_notes: List[Edge] = []
-        self._closed_notes: List[Edge] = []
-        self._cummulative_time: int = 0
         self.ticks_per_beat = ticks_per_beat
 
     def parse(self):
         """Parse the track and return the resulting graph.
         """
-        note_events = list(
-            filter(lambda x: x.is_meta is False, self._midi_track))
-        for evt in note_events:
-            if evt.time > 0:
-                self._join_verticals()
-                self._join_horizontals()
-                self._cummulative_time = self._cummulative_time +\
-                    (evt.time/self.ticks_per_beat)
-            if evt.type == "note_on":
-                if evt.velocity == 0:
-                    self._on_note_end(evt)
-                    continue
-                self._on_note_start(evt)
-            if evt.type == "note_off":
-                self._on_note_end(evt)
-        return self.graph
-
-    def _on_note_start(self, msg: Message):
-        edge = Edge(
-                pitch = msg.note,
-                start_time = self._cummulative_time,
-                src_event = msg
-            )
-        self.graph.add_edge(edge)
-        self._open_notes.append(edge)
-
-    def _on_note_end(self, msg: Message):
-        for note in self._open_notes:
-            if note.pitch != msg.note:
+        messages = []
+        tick = 0
+        for msg in self._midi_track:
+            tick = tick + msg.time
+            if msg.is_meta:
                 continue
-            note.end_time = self._cummulative_time
-            self._closed_notes.append(note)
-            self._open_notes.remove(note)
-
-    def _join_verticals(self):
-        to_connect = list(filter(
-            lambda e: e.start_time == self._cummulative_time,
-            self._open_notes))
-        to_connect.sort(key=lambda n: n.pitch, reverse=True)
-        for i in range(len(to_connect) - 1):
-            self.graph.add_vertex(to_connect[i], to_connect[i+1])
-
-    def _join_horizontals(self):
-        right_chord = list(filter(
-            lambda e: e.start_time == self._cummulative_time,
-            self._open_notes))
-        left_chord = self._closed_notes
-        left_chord.sort(key=lambda n: n.pitch, reverse=True)
-        right_chord.sort(key=lambda n: n.pitch, reverse=True)
-        # very basic for now, just using order of notes and assuming same no voices
-        for i, left in enumerate(left_chord):
-            try:
-                right = right_chord[i]
-                self.graph.add_vertex(left, right)
-            except IndexError:
-                pass
-        self._closed_notes = []
+            data = msg.bytes() + [0, 0]
+            messages.append((tick, data[0], data[1], data[2]))
+        notes = notes_from_messages(messages, self.ticks_per_beat)
+        return self.graph.add_note_arrays(notes)
 
 @dataclass
 class Vector:
@@ -138,69 +194,518 @@ class Vector:
         return other.time_delta == self.time_delta\
             and other.pitch_delta == self.pitch_delta
 
-@dataclass
+class _EdgeList(list):
+    """The list of a graph's edges. Changes to the order of
+    the list mark the graph as needing to be sorted by time.
+    """
+    def __init__(self, edges: Iterable[Edge], on_change: Callable[[], None]):
+        super().__init__(edges)
+        self._on_change = on_change
+
+    def sort(self, *args, **kwargs):
+        self._on_change()
+        super().sort(*args, **kwargs)
+
+    def reverse(self):
+        self._on_change()
+        super().reverse()
+
+    def append(self, edge: Edge):
+        self._on_change()
+        super().append(edge)
+
+    def extend(self, edges: Iterable[Edge]):
+        self._on_change()
+        super().extend(edges)
+
+    def insert(self, index, edge: Edge):
+        self._on_change()
+        super().insert(index, edge)
+
+    def pop(self, index=-1) -> Edge:
+        self._on_change()
+        return super().pop(index)
+
+    def remove(self, edge: Edge):
+        self._on_change()
+        super().remove(edge)
+
+    def clear(self):
+        self._on_change()
+        super().clear()
+
+    def __setitem__(self, index, value):
+        self._on_change()
+        super().__setitem__(index, value)
+
+    def __delitem__(self, index):
+        self._on_change()
+        super().__delitem__(index)
+
+    def __iadd__(self, edges: Iterable[Edge]):
+        self._on_change()
+        return super().__iadd__(edges)
+
+    def __reduce__(self):
+        return (list, (list(self),))
+
+class _VertexList(MutableSequence):
+    """The vertices of an edge in a graph, as a list of the edges that it
+    is connected to. The list is a view onto the graph's list of destination
+    edge ids for the edge, so changes are written to the graph (any edges
+    that are not yet in the graph are added to it).
+    """
+    def __init__(self,
+        destinations: List[int],
+        get_edge: Callable[[int], Edge],
+        insert_edge: Callable[[Edge], int],
+        on_change: Callable[[], None]):
+        self._destinations = destinations
+        self._get_edge = get_edge
+        self._insert_edge = insert_edge
+        self._on_change = on_change
+
+    def __len__(self):
+        return len(self._destinations)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._get_edge(i) for i in self._destinations[index]]
+        return self._get_edge(self._destinations[index])
+
+    def __setitem__(self, index, value):
+        if isinstance(index, slice):
+            self._destinations[index] = [self._insert_edge(edge) for edge in value]
+        else:
+            self._destinations[index] = self._insert_edge(value)
+        self._on_change()
+
+    def __delitem__(self, index):
+        del self._destinations[index]
+        self._on_change()
+
+    def insert(self, index, value: Edge):
+        self._destinations.insert(index, self._insert_edge(value))
+        self._on_change()
+
+    def append(self, value: Edge):
+        self._destinations.append(self._insert_edge(value))
+        self._on_change()
+
+    def sort(self, key: Callable[[Edge], Any], reverse: bool = False):
+        """Sort the vertices in place (edges are not orderable, so a key is required).
+        """
+        order = sorted(range(len(self)), key=lambda i: key(self[i]), reverse=reverse)
+        self._destinations[:] = [self._destinations[i] for i in order]
+        self._on_change()
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, (list, _VertexList)):
+            return NotImplemented
+        return list(self) == list(other)
+
+    __hash__ = None # type: ignore
+
+    def __repr__(self):
+        return repr(list(self))
+
+    def __reduce__(self):
+        return (list, (list(self),))
+
 class Graph:
     """A representation of a musical structure used for analysis purposes.
+
+    Edges are identified by integer ids (their insertion order). Their
+    pitches and start/end times are stored as columns, and the vertices
+    from each edge as a list of destination edge ids, which are compressed
+    into CSR (compressed sparse row) adjacency arrays when read.
+    The Edge objects returned by the graph are views onto this storage.
     """
-    edges: List[Edge] = field(
-        default_factory= lambda: []
-    )
+    def __init__(self, edges: Optional[List[Edge]] = None):
+        self._columns: Dict[str, List[Any]] = {
+            "pitch": [],
+            "start_time": [],
+            "end_time": []
+        }
+        self._src_events: Dict[int, Message] = {}
+        self._views: List[Optional[Edge]] = []
+        self._edge_list: Optional[List[Edge]] = None
+        # whether the edges list is known to be in order of start time
+        self._is_sorted = True
+        # the destination edge ids of the vertices from each edge, in insertion order
+        self._destinations: List[List[int]] = []
+        self._arrays: Dict[str, numpy.ndarray] = {}
+        self._adjacency: Optional[Tuple[numpy.ndarray, numpy.ndarray]] = None
+        self._interval_index: Optional[IntervalIndex] = None
+        for edge in edges or []:
+            self.add_edge(edge)
+
+    def __len__(self):
+        return len(self._views)
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, Graph):
+            return False
+        return self.edges == other.edges
+
+    __hash__ = None # type: ignore
+
+    def __repr__(self):
+        return "Graph(edges={!r})".format(self.edges)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_views"] = [None] * len(self._views)
+        state["_edge_list"] = None
+        if self._edge_list is not None:
+            state["_edge_order"] = [edge.edge_id for edge in self._edge_list]
+        state["_arrays"] = {}
+        state["_adjacency"] = None
+        state["_interval_index"] = None
+        return state
+
+    def __setstate__(self, state):
+        edge_order = state.pop("_edge_order", None)
+        self.__dict__.update(state)
+        if edge_order is not None:
+            self._edge_list = _EdgeList([self._view(i) for i in edge_order], self._mark_unsorted)
+
+    @property
+    def edges(self) -> List[Edge]:
+        """A list of the edges in the graph.
+        The list is created on first access and can be re-ordered in place
+        (this does not change the edge ids).
+        """
+        if self._edge_list is None:
+            self._edge_list = _EdgeList(
+                [self._view(i) for i in range(len(self._views))],
+                self._mark_unsorted)
+        return self._edge_list
+
+    def _mark_unsorted(self):
+        self._is_sorted = False
+
+    def get_edge(self, edge_id: int) -> Edge:
+        """Return the edge with the given id (its position in the order
+        that edges were added to the graph).
+        """
+        return self._view(edge_id)
+
+    def _view(self, edge_id: int) -> Edge:
+        view = self._views[edge_id]
+        if view is None:
+            view = Edge(None, None)
+            view._bind(self, edge_id) # pylint: disable=protected-access
+            self._views[edge_id] = view
+        return view
+
+    def get_value(self, edge_id: int, column: str):
+        """Return the value of column (pitch, start_time, end_time or src_event)
+        for the given edge id.
+        """
+        if column == "src_event":
+            return self._src_events.get(edge_id)
+        return self._columns[column][edge_id]
+
+    def set_value(self, edge_id: int, column: str, value):
+        """Set the value of column (pitch, start_time, end_time or src_event)
+        for the given edge id.
+        """
+        if column == "src_event":
+            self._src_events[edge_id] = value
+            return
+        self._columns[column][edge_id] = value
+        self._arrays.pop(column, None)
+        if column == "start_time":
+            self._is_sorted = False
+        if column != "pitch":
+            self._interval_index = None
+
+    def get_vertices(self, edge_id: int) -> MutableSequence[Edge]:
+        """Return the edges that the given edge id is connected to.
+        Changes to the returned list are written to the graph.
+        """
+        return _VertexList(self._destinations[edge_id],
+            self._view, self._insert_edge, self._vertices_changed)
+
+    def _vertices_changed(self):
+        self._adjacency = None
+
+    def _last_start_time(self):
+        if self._edge_list is not None:
+            return self._edge_list[-1].start_time if self._edge_list else None
+        start_times = self._columns["start_time"]
+        return start_times[-1] if start_times else None
+
+    def _add_edges(self, pitches, start_times, end_times) -> range:
+        """Bulk insert edges given as columns, returning the new edge ids.
+        """
+        first = len(self._views)
+        start_times = list(start_times)
+        last_start = self._last_start_time()
+        if last_start is not None:
+            start_times_in_order = [last_start] + start_times
+        else:
+            start_times_in_order = start_times
+        if any(b < a for a, b in zip(start_times_in_order, start_times_in_order[1:])):
+            self._is_sorted = False
+        self._columns["pitch"].extend(pitches)
+        self._columns["start_time"].extend(start_times)
+        self._columns["end_time"].extend(end_times)
+        n_edges = len(self._columns["pitch"])
+        self._views.extend([None] * (n_edges - first))
+        self._destinations.extend([] for _ in range(n_edges - first))
+        if self._edge_list is not None:
+            list.extend(self._edge_list, (self._view(i) for i in range(first, n_edges)))
+        self._arrays = {}
+        self._adjacency = None
+        self._interval_index = None
+        return range(first, n_edges)
+
+    def _add_vertices(self, origins, destinations):
+        """Bulk insert vertices, given as arrays of edge ids.
+        """
+        for origin, destination in zip(origins.tolist(), destinations.tolist()):
+            self._destinations[origin].append(destination)
+        self._adjacency = None
+
+    def add_note_arrays(self, notes: NoteArrays) -> Graph:
+        """Add the given notes (see composerstoolkit.core.smf.read_midi_file) as edges.
+        Notes that start together are linked vertically (from the highest
+        pitch downwards). Notes that end at the same time point as others start
+        are linked horizontally, pairing the voices in order of pitch.
+        Time points are only linked if there are subsequent messages in the track.
+        """
+        pitch, onset, offset = notes.pitch, notes.onset, notes.offset
+        edge_ids = numpy.array(self._add_edges(
+            pitch.tolist(),
+            onset.tolist(),
+            [None if numpy.isnan(end_time) else end_time for end_time in offset.tolist()]),
+            dtype=numpy.int64)
+
+        # notes that are sounding at a linked time point, ordered by time, then highest pitch first
+        starting = numpy.flatnonzero(~(offset <= onset) & (onset < notes.length))
+        starting = starting[numpy.lexsort((-pitch[starting], onset[starting]))]
+        is_chord = onset[starting[1:]] == onset[starting[:-1]]
+        self._add_vertices(
+            edge_ids[starting[:-1][is_chord]],
+            edge_ids[starting[1:][is_chord]])
+
+        right_chords = {time: list(group) for time, group in\
+            itertools.groupby(starting.tolist(), key=lambda i: onset[i])}
+        ending = numpy.flatnonzero(offset < notes.length)
+        ending = ending[numpy.lexsort((-pitch[ending], offset[ending]))]
+        pairs = []
+        for time, left_chord in itertools.groupby(ending.tolist(), key=lambda i: offset[i]):
+            # very basic for now, just using order of notes and assuming same no voices
+            pairs.extend(zip(left_chord, right_chords.get(time, [])))
+        pairs_array = numpy.array(pairs, dtype=numpy.int64).reshape(-1, 2)
+        self._add_vertices(edge_ids[pairs_array[:, 0]], edge_ids[pairs_array[:, 1]])
+        return self
+
+    def _edge_id(self, edge: Edge) -> int:
+        if edge.graph is self:
+            return edge.edge_id
+        for i in range(len(self._views)):
+            if self._view(i) == edge:
+                return i
+        raise ValueError("{!r} is not in graph".format(edge))
 
     def add_edge(self, edge: Edge):
-        """Add an edge to the graph
+        """Add an edge to the graph.
+        The edge becomes a view onto the graph. Any edges in its vertices
+        list are also added to the graph.
+        Raises ValueError if the edge (or an edge in its vertices)
+        already belongs to another graph.
         """
-        self.edges.append(edge)
+        self._insert_edge(edge)
+
+    def _insert_edge(self, edge: Edge) -> int:
+        """Add an edge (see add_edge), returning its edge id.
+        """
+        if edge.graph is self:
+            return edge.edge_id
+        # find the new edges first, so nothing is added if any belong to another graph
+        new_edges: List[Edge] = []
+        seen: Set[int] = set()
+        stack = [edge]
+        while stack:
+            new_edge = stack.pop()
+            if new_edge.graph is self or id(new_edge) in seen:
+                continue
+            if new_edge.graph is not None:
+                raise ValueError("{!r} already belongs to another graph".format(new_edge))
+            seen.add(id(new_edge))
+            new_edges.append(new_edge)
+            stack.extend(reversed(new_edge.vertices))
+        vertices = [list(new_edge.vertices) for new_edge in new_edges]
+        last_start = self._last_start_time()
+        for new_edge in new_edges:
+            edge_id = len(self._views)
+            if last_start is not None and new_edge.start_time < last_start:
+                self._is_sorted = False
+            last_start = new_edge.start_time
+            for column, values in self._columns.items():
+                values.append(getattr(new_edge, column))
+            if new_edge.src_event is not None:
+                self._src_events[edge_id] = new_edge.src_event
+            self._views.append(new_edge)
+            self._destinations.append([])
+            if self._edge_list is not None:
+                list.append(self._edge_list, new_edge)
+            new_edge._bind(self, edge_id) # pylint: disable=protected-access
+        for new_edge, destinations in zip(new_edges, vertices):
+            self._destinations[new_edge.edge_id].extend(
+                destination.edge_id for destination in destinations)
+        self._arrays = {}
+        self._adjacency = None
+        self._interval_index = None
+        return edge.edge_id
 
     def add_vertex(self, edge1: Edge, edge2: Edge):
-        """Add a vertex (implied connection) between two
-        edges already in the graph.
+        """Add a vertex (implied connection) from edge1, which must
+        already be in the graph, to edge2. If edge2 is not in the graph
+        it is added (see add_edge).
+        """
+        self._destinations[self._edge_id(edge1)].append(self._insert_edge(edge2))
+        self._adjacency = None
+
+
+    def _array(self, column: str) -> numpy.ndarray:
+        try:
+            return self._arrays[column]
+        except KeyError:
+            pass
+        values = self._columns[column]
+        if column == "end_time":
+            values = [numpy.nan if v is None else v for v in values]
+            array = numpy.array(values, dtype=numpy.float64)
+        else:
+            array = numpy.asarray(values)
+        self._arrays[column] = array
+        return array
+
+    @property
+    def pitches(self) -> numpy.ndarray:
+        """The pitch of each edge, indexed by edge id.
         """
-        index = self.edges.index(edge1)
-        self.edges[index].vertices.append(edge2)
+        return self._array("pitch")
+
+    @property
+    def start_times(self) -> numpy.ndarray:
+        """The start time of each edge, indexed by edge id.
+        """
+        return self._array("start_time")
+
+    @property
+    def end_times(self) -> numpy.ndarray:
+        """The end time of each edge (nan for open edges), indexed by edge id.
+        """
+        return self._array("end_time")
+
+    @property
+    def adjacency(self) -> Tuple[numpy.ndarray, numpy.ndarray]:
+        """The vertices of the graph as CSR arrays (indptr, indices):
+        the destinations of edge i are indices[indptr[i]:indptr[i + 1]],
+        in the order that they were added.
+        """
+        if self._adjacency is None:
+            counts = numpy.fromiter((len(d) for d in self._destinations),
+                dtype=numpy.int64, count=len(self._destinations))
+            indptr = numpy.zeros(len(self._views) + 1, dtype=numpy.int64)
+            numpy.cumsum(counts, out=indptr[1:])
+            indices = numpy.fromiter(itertools.chain.from_iterable(self._destinations),
+                dtype=numpy.int64, count=int(indptr[-1]))
+            self._adjacency = (indptr, indices)
+        return self._adjacency
+
+    def get_vector_arrays(self) -> Tuple[
+        numpy.ndarray, numpy.ndarray, numpy.ndarray, numpy.ndarray]:
+        """Return every vertex in the graph as arrays
+        (origins, destinations, pitch_deltas, time_deltas),
+        where origins and destinations are edge ids,
+        ordered by origin edge id.
+        """
+        indptr, destinations = self.adjacency
+        origins = numpy.repeat(numpy.arange(len(self._views)), numpy.diff(indptr))
+        pitches = self.pitches
+        start_times = self.start_times
+        if len(destinations) == 0:
+            empty = numpy.array([], dtype=numpy.int64)
+            return origins, destinations, empty, empty
+        pitch_deltas = pitches[destinations] - pitches[origins]
+        time_deltas = start_times[destinations] - start_times[origins]
+        return origins, destinations, pitch_deltas, time_deltas
 
     def get_vector_list(self) -> List[Vector]:
         """Return a list of (Vectors) that describes all routes
         between edges in the graph in terms of their relative pitch/time
         vectors.
         """
-        vector_list = []
-        for edge in self.edges:
-            vertices = edge.vertices
-            for vertex in vertices:
-                vector_list.append(
-                    Vector(
-                        time_delta = vertex.start_time - edge.start_time,
-                        pitch_delta = vertex.pitch - edge.pitch,
-                        origin = edge,
-                        destination = vertex
-                    )
-                )
-        vector_list.sort(key = lambda v : v.origin.start_time)
-        return vector_list
+        origins, destinations, pitch_deltas, time_deltas = self.get_vector_arrays()
+        order = numpy.argsort(self.start_times[origins], kind="stable") if len(origins) else origins
+        return [Vector(
+                time_delta = time_delta,
+                pitch_delta = pitch_delta,
+                origin = self._view(origin),
+                destination = self._view(destination)
+            ) for origin, destination, pitch_delta, time_delta in zip(
+                origins[order].tolist(),
+                destinations[order].tolist(),
+                pitch_deltas[order].tolist(),
+                time_deltas[order].tolist())]
+
+    def to_arrays(self) -> Dict[str, numpy.ndarray]:
+        """Return the edges of the graph as columns, indexed by edge id:
+        pitch, start_time, end_time and duration (nan for open edges).
+        The columns are the graph's cached arrays, so should not be modified.
+        """
+        start_times = self.start_times
+        end_times = self.end_times
+        return {
+            "pitch": self.pitches,
+            "start_time": start_times,
+            "end_time": end_times,
+            "duration": end_times - start_times
+        }
 
     def to_pandas_dataframe(self):
-        pitches = []
-        times = []
-        for edge in self.edges:
-            pitches.append(edge.pitch)
-            times.append(edge.start_time)
+        """Return a dataframe with one row per edge (indexed by edge id),
+        with columns pitch, time (the start time), end_time and duration.
+        """
+        arrays = self.to_arrays()
+        dataframe = pd.DataFrame(data={
+            'pitch': arrays["pitch"],
+            'time': arrays["start_time"],
+            'end_time': arrays["end_time"],
+            'duration': arrays["duration"]})
+        return dataframe
+
+    def to_vertices_dataframe(self):
+        """Return a dataframe with one row per vertex, with columns
+        origin and destination (edge ids, as in to_pandas_dataframe),
+        pitch_delta and time_delta.
+        """
+        origins, destinations, pitch_deltas, time_deltas = self.get_vector_arrays()
         dataframe = pd.DataFrame(data={
-            'pitch': numpy.array(pitches),
-            'time': numpy.array(times)})
+            'origin': origins,
+            'destination': destinations,
+            'pitch_delta': pitch_deltas,
+            'time_delta': time_deltas})
         return dataframe
 
     def to_vector_indexed_array(self):
-        arr = {}
-        for edge in self.edges:
-            vertices = edge.vertices
-            for vertex in vertices:
-                time_delta = vertex.start_time - edge.start_time
-                pitch_delta = vertex.pitch - edge.pitch
-                index = (pitch_delta, time_delta)
-                try:
-                    arr[index].append([edge, vertex])
-                except KeyError:
-                    arr[index] = [[edge, vertex]]
+        arr: Dict[Tuple[Any, Any], List[List[Edge]]] = {}
+        origins, destinations, pitch_deltas, time_deltas = self.get_vector_arrays()
+        for origin, destination, index in zip(
+            origins.tolist(),
+            destinations.tolist(),
+            zip(pitch_deltas.tolist(), time_deltas.tolist())):
+            pair = [self._view(origin), self._view(destination)]
+            try:
+                arr[index].append(pair)
+            except KeyError:
+                arr[index] = [pair]
         return arr
 
     def to_markov_table(self) -> Dict[int, Dict[int, int]]:
@@ -210,25 +715,29 @@ class Graph:
         
         {from_pitch_class: {to_pitch_class: probability...} ...}
         """
-        result = {i:{i:0 for i in range(12)} for i in range(12)}
-        for edge in self.edges:
-            from_pitch_class = edge.pitch % 12
-            for vertex in edge.vertices:
-                to_pitch_class = vertex.pitch % 12
-                count = result[from_pitch_class][to_pitch_class]
-                result[from_pitch_class][to_pitch_class] = count + 1
-        for from_pitch_class, probabilities in result.items():
-            total = sum(probabilities.values())
-            if total == 0:
-                continue
-            for to_pitch_class, probability in probabilities.items():
-                result[from_pitch_class][to_pitch_class] =\
-                    float(Decimal(str(probability)) / Decimal(str(total)))
+        origins, destinations, _, _ = self.get_vector_arrays()
+        pitch_classes = self.pitches.astype(numpy.int64) % 12 if len(self)\
+            else numpy.array([], dtype=numpy.int64)
+        counts = numpy.bincount(
+            pitch_classes[origins] * 12 + pitch_classes[destinations],
+            minlength=144).reshape(12, 12)
+        totals = counts.sum(axis=1, keepdims=True)
+        probabilities = numpy.divide(counts, totals,
+            out=numpy.zeros((12, 12)), where=totals > 0)
+        result: Dict[int, Dict[int, float]] = {}
+        for from_pitch_class in range(12):
+            if totals[from_pitch_class, 0] == 0:
+                result[from_pitch_class] = {i: 0 for i in range(12)}
+            else:
+                result[from_pitch_class] = dict(enumerate(probabilities[from_pitch_class].tolist()))
         return result
 
     def __iter__(self):
-        self.edges.sort(key=lambda e: e.start_time)
-        for edge in self.edges:
+        edges = self.edges
+        if not self._is_sorted:
+            list.sort(edges, key=lambda e: e.start_time)
+            self._is_sorted = True
+        for edge in edges:
             yield edge
 
     @classmethod
@@ -237,30 +746,136 @@ class Graph:
         """
         return MidiTrackParser(track, cls()).parse()
 
-    def intersections(self, other_graph) -> List[Edge]:
+    @classmethod
+    def from_note_arrays(cls, notes: NoteArrays) -> Graph:
+        """Build a pitch graph from the columnar notes of a MIDI track
+        (see composerstoolkit.core.smf.read_midi_file).
+        """
+        return cls().add_note_arrays(notes)
+
+    @classmethod
+    def from_midi_file(cls, filename, track_no: int = 0) -> Graph:
+        """Parse the given track of a MIDI file (path or binary file object)
+        into a pitch graph, without going through mido.
+        """
+        return cls.from_note_arrays(read_midi_file(filename)[track_no])
+
+    def intersections(self, other_graph: Graph) -> List[Tuple[Edge, Edge]]:
         """Return a list of all possible intersections
-        between other_graph and this graph.
+        between other_graph and this graph, as pairs of
+        (edge in this graph, edge in other_graph) that sound at the same time.
+        Edges are treated as the time interval [start_time, end_time).
+        The pairs are ordered by the time at which they begin to intersect.
         """
-        raise NotImplementedError("Graph.intersections")
+        graphs = (self, other_graph)
+        # each event is (time, is_start, graph no, edge id). At the same time,
+        # edges that end are removed before those that start are added
+        times = []
+        kinds = []
+        sides = []
+        ids = []
+        for side, graph in enumerate(graphs):
+            starts = graph.start_times.astype(numpy.float64)
+            ends = graph.end_times
+            ends = numpy.where(numpy.isnan(ends), numpy.inf, ends)
+            sounding = numpy.flatnonzero(starts < ends)
+            for is_start, points in ((1, starts[sounding]), (0, ends[sounding])):
+                times.append(points)
+                kinds.append(numpy.full(len(sounding), is_start))
+                sides.append(numpy.full(len(sounding), side))
+                ids.append(sounding)
+        order = numpy.lexsort((numpy.concatenate(kinds), numpy.concatenate(times)))
+        kinds_sorted = numpy.concatenate(kinds)[order].tolist()
+        sides_sorted = numpy.concatenate(sides)[order].tolist()
+        ids_sorted = numpy.concatenate(ids)[order].tolist()
+
+        active: Tuple[Dict[int, None], Dict[int, None]] = ({}, {})
+        pairs = []
+        for is_start, side, edge_id in zip(kinds_sorted, sides_sorted, ids_sorted):
+            if not is_start:
+                del active[side][edge_id]
+                continue
+            if side == 0:
+                pairs.extend((edge_id, other_id) for other_id in active[1])
+            else:
+                pairs.extend((self_id, edge_id) for self_id in active[0])
+            active[side][edge_id] = None
+        return [(self._view(self_id), other_graph.get_edge(other_id))
+            for self_id, other_id in pairs]
+
+    @classmethod
+    def merge(cls, *graphs: Graph) -> Graph:
+        """Combine several graphs into a new graph, with the edges
+        in order of start time. Each graph is iterated in time order (which
+        does not re-sort graphs that are already in order), and the graphs
+        are combined with a k-way merge.
+        The vertices within each graph are kept.
+        """
+        merged = cls()
+        def start_time(item):
+            return item[2].start_time
+        def stream(graph_no, graph):
+            for edge in graph:
+                yield graph_no, edge.edge_id, edge
+        streams = [stream(graph_no, graph) for graph_no, graph in enumerate(graphs)]
+        new_ids = [numpy.zeros(len(graph), dtype=numpy.int64) for graph in graphs]
+        pitches = []
+        start_times = []
+        end_times = []
+        src_events = {}
+        merged_edges = heapq.merge(*streams, key=start_time)
+        for new_id, (graph_no, edge_id, edge) in enumerate(merged_edges):
+            new_ids[graph_no][edge_id] = new_id
+            pitches.append(edge.pitch)
+            start_times.append(edge.start_time)
+            end_times.append(edge.end_time)
+            if edge.src_event is not None:
+                src_events[new_id] = edge.src_event
+        merged._add_edges(pitches, start_times, end_times)
+        merged._src_events = src_events
+        for graph_no, graph in enumerate(graphs):
+            indptr, destinations = graph.adjacency
+            origins = numpy.repeat(numpy.arange(len(graph)), numpy.diff(indptr))
+            mapping = new_ids[graph_no]
+            merged._add_vertices(mapping[origins], mapping[destinations])
+        return merged
+
+    @property
+    def interval_index(self) -> IntervalIndex:
+        """An index over the [start_time, end_time) interval of each edge.
+        It is built on first use, and rebuilt after the graph changes.
+        """
+        if self._interval_index is None:
+            self._interval_index = IntervalIndex(self.start_times, self.end_times)
+        return self._interval_index
+
+    def get_edges_at(self, offset: int) -> List[Edge]:
+        """Return the edges sounding at a given offset, in order of edge id.
+        """
+        return [self._view(i) for i in numpy.sort(self.interval_index.at(offset)).tolist()]
+
+    def get_edges_between(self, start_time: int, end_time: int) -> List[Edge]:
+        """Return the edges that sound at any point in the time range
+        [start_time, end_time), in order of edge id.
+        """
+        ids = self.interval_index.overlapping(start_time, end_time)
+        return [self._view(i) for i in numpy.sort(ids).tolist()]
 
     def get_pitches_at(self, offset: int) -> List[int]:
         """Return a list of integers that represents all
         pitches sounding at a given offset, sorted in
         ascending numerical order.
         """
-        def func(edge: Edge) -> bool:
-            if edge.start_time > offset:
-                return False
-            if edge.end_time is None:
-                return True
-            if edge.end_time <= offset:
-                return False
-            return True
+        pitches = self._columns["pitch"]
+        return sorted(pitches[i] for i in self.interval_index.at(offset).tolist())
 
-        chord = list(filter(
-            func,
-            self.edges
-        ))
-        pitches = [edge.pitch for edge in chord]
-        pitches.sort()
-        return pitches
+    def get_verticalities(self) -> Tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray]:
+        """Return the pitches sounding at every distinct start time in the graph,
+        as arrays (onsets, indptr, pitches): the pitches sounding at onsets[i]
+        are pitches[indptr[i]:indptr[i + 1]], in ascending order.
+        """
+        onsets, indptr, ids = self.interval_index.verticalities()
+        pitches = self.pitches[ids] if len(ids) else numpy.array([], dtype=numpy.int64)
+        # sort the pitches within each verticality
+        rows = numpy.repeat(numpy.arange(len(onsets)), numpy.diff(indptr))
+        return onsets, indptr, pitches[numpy.lexsort((pitches, rows))]
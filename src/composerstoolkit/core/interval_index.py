@@ -0,0 +1,114 @@
+"""A static index over time intervals, used to find the
+edges of a Graph that are sounding at a time point, or within a time range.
+"""
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+class _Node:
+    __slots__ = ("center", "left", "right", "by_start", "starts", "by_end", "negated_ends")
+
+    def __init__(self, center, left, right, by_start, starts, by_end, negated_ends):
+        self.center = center
+        self.left = left
+        self.right = right
+        self.by_start = by_start
+        self.starts = starts
+        self.by_end = by_end
+        self.negated_ends = negated_ends
+
+class IntervalIndex:
+    """A centered interval tree over the half-open intervals [start, end).
+    An end of nan is treated as open (never ending). Empty intervals
+    (end <= start) never sound, so are not returned by queries.
+
+    Queries return the indexes of the matching intervals as arrays, in
+    O(log n + k) for k results.
+    """
+
+    def __init__(self, starts, ends):
+        self.starts = np.asarray(starts, dtype=np.float64)
+        ends = np.asarray(ends, dtype=np.float64)
+        self.ends = np.where(np.isnan(ends), np.inf, ends)
+        ids = np.flatnonzero(self.starts < self.ends)
+        self._root = self._build(ids)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def _build(self, ids: np.ndarray) -> Optional[_Node]:
+        if len(ids) == 0:
+            return None
+        starts = self.starts[ids]
+        ends = self.ends[ids]
+        # the median start keeps each subtree to at most half of the intervals
+        center = np.sort(starts)[len(ids) // 2]
+        here = (starts <= center) & (ends > center)
+        node_ids = ids[here]
+        by_start = node_ids[np.argsort(self.starts[node_ids], kind="stable")]
+        by_end = node_ids[np.argsort(-self.ends[node_ids], kind="stable")]
+        return _Node(
+            center = center,
+            left = self._build(ids[ends <= center]),
+            right = self._build(ids[starts > center]),
+            by_start = by_start,
+            starts = self.starts[by_start],
+            by_end = by_end,
+            negated_ends = -self.ends[by_end])
+
+    def at(self, time: float) -> np.ndarray:
+        """Return the indexes of the intervals that contain time
+        (start <= time < end).
+        """
+        found: List[np.ndarray] = []
+        node = self._root
+        while node is not None:
+            if time < node.center:
+                found.append(node.by_start[:np.searchsorted(node.starts, time, side="right")])
+                node = node.left
+            else:
+                found.append(node.by_end[:np.searchsorted(node.negated_ends, -time, side="left")])
+                node = node.right
+        return np.concatenate(found) if found else np.array([], dtype=np.int64)
+
+    def overlapping(self, start: float, end: float) -> np.ndarray:
+        """Return the indexes of the intervals that overlap the time range
+        [start, end) (interval start < end and interval end > start).
+        """
+        if end <= start:
+            return np.array([], dtype=np.int64)
+        found: List[np.ndarray] = []
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            if node is None:
+                continue
+            if end <= node.center:
+                found.append(node.by_start[:np.searchsorted(node.starts, end, side="left")])
+                stack.append(node.left)
+            elif start > node.center:
+                found.append(node.by_end[:np.searchsorted(node.negated_ends, -start, side="left")])
+                stack.append(node.right)
+            else:
+                found.append(node.by_start)
+                stack.append(node.left)
+                stack.append(node.right)
+        return np.concatenate(found) if found else np.array([], dtype=np.int64)
+
+    def verticalities(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Return the intervals sounding at each distinct start time, as arrays
+        (onsets, indptr, ids): the intervals sounding at onsets[i] are
+        ids[indptr[i]:indptr[i + 1]].
+        """
+        onsets = np.unique(self.starts)
+        first = np.searchsorted(onsets, self.starts, side="left")
+        last = np.searchsorted(onsets, self.ends, side="left")
+        counts = np.maximum(last - first, 0)
+        ids = np.repeat(np.arange(len(self.starts)), counts)
+        # the onset that each repeated interval is sounding at
+        steps = np.arange(len(ids)) - np.repeat(np.cumsum(counts) - counts, counts)
+        onset_ids = np.repeat(first, counts) + steps
+        order = np.argsort(onset_ids, kind="stable")
+        indptr = np.zeros(len(onsets) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(onset_ids, minlength=len(onsets)), out=indptr[1:])
+        return onsets, indptr, ids[order]
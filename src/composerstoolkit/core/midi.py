@@ -1,11 +1,16 @@
 import logging
 import os
-from threading import Thread
+from collections import deque
+from queue import Empty
+from threading import Condition, Thread
+from typing import Iterator, Optional, Tuple, List
 
 os.environ['PYGAME_HIDE_SUPPORT_PROMPT'] = "hide"
 import pygame as pg
 import pygame.midi
 
+from . sequence import Event, Sequence
+
 def init_midi():
     pg.init()
     pg.fastevent.init()
@@ -102,6 +107,141 @@ class MidiInputBus:
     def _on_control_change(self, e):
         self.control_data[e.data1] = e.data2
 
+class MidiInputStream:
+    """
+    Event-driven MIDI input, using the callback API of python-rtmidi.
+    Messages are pushed onto a queue as they arrive (along with the timestamp reported by
+    the MIDI driver), so consumers can block until there is new input, rather than polling
+    the device at a fixed interval. The queue is bounded: if nothing is reading from it,
+    the oldest messages are dropped.
+    The stream also tracks active_notes and control_data, so it can be queried by gates and
+    transformers in the same way as MidiInputBus.
+
+    Usage:
+        with MidiInputStream(get_port=lambda ports: ports.index("V61 0")) as midi_in:
+            seq = midi_in.to_sequence()
+    """
+
+    def __init__(self,
+        get_port=lambda all_ports: 0,
+        max_queue: int = 1024,
+        midi_in_factory = None):
+        """
+        get_port - function to return the index of the desired
+        input port, given a list of available port names
+        max_queue - the maximum number of unread messages to keep
+        midi_in_factory - callable returning a new (rtmidi.MidiIn compatible) input.
+        Defaults to rtmidi.MidiIn.
+        """
+        self.get_port = get_port
+        self.midi_in_factory = midi_in_factory
+        self.midi_in = None
+        # active_notes is replaced (rather than mutated) on each change, so that it is
+        # always safe to iterate over from another thread.
+        self.active_notes = frozenset()
+        self.control_data = {}
+        self.timestamp = 0.0
+        self._queue: deque = deque(maxlen=max_queue)
+        self._ready = Condition()
+        self._closed = False
+
+    def _on_message(self, message_and_delta: Tuple[List[int], float], data=None):
+        """Callback for the rtmidi input thread.
+        rtmidi reports the time (in seconds) since the previous message.
+        """
+        message, delta = message_and_delta
+        self.timestamp = self.timestamp + delta
+        status = message[0] & 0xF0
+        if status == 0x90 and message[2] > 0:
+            self.active_notes = self.active_notes.union({message[1]})
+        elif status in (0x80, 0x90):
+            self.active_notes = self.active_notes.difference({message[1]})
+        elif status == 0xB0:
+            self.control_data[message[1]] = message[2]
+        elif status == 0xE0:
+            # pitch wheel, using the coarse value (64 is the neutral position)
+            self.control_data[0xE0] = message[2]
+        with self._ready:
+            self._queue.append((self.timestamp, message))
+            self._ready.notify()
+
+    def get(self, timeout: Optional[float]=None) -> Optional[Tuple[float, List[int]]]:
+        """Block until the next message arrives, and return it as (timestamp, message).
+        Returns None if the stream has been closed.
+        Raises queue.Empty if timeout (seconds) expires first.
+        """
+        with self._ready:
+            if not self._ready.wait_for(lambda: self._queue or self._closed, timeout):
+                raise Empty
+            if not self._queue:
+                return None
+            return self._queue.popleft()
+
+    def events(self, controllers=False) -> Iterator[Event]:
+        """Return a generator that blocks on the input queue and yields
+        each note on/off message as a realtime Event. If controllers is True,
+        controller messages are also yielded (as an Event with meta "cc").
+        The generator ends when the stream is closed.
+        """
+        while True:
+            item = self.get()
+            if item is None:
+                return
+            timestamp, message = item
+            status = message[0] & 0xF0
+            meta = {"timestamp": timestamp, "channel": message[0] & 0x0F}
+            if status == 0x90 and message[2] > 0:
+                meta.update({"realtime": "note_on", "volume": message[2]})
+                yield Event(pitches=[message[1]], meta=meta)
+            elif status in (0x80, 0x90):
+                meta.update({"realtime": "note_off"})
+                yield Event(pitches=[message[1]], meta=meta)
+            elif status == 0xB0 and controllers:
+                meta.update({"cc": [(message[1], message[2])]})
+                yield Event(meta=meta)
+
+    def to_sequence(self, meta=None, controllers=False) -> Sequence:
+        """Return a Sequence that waits on the live input for each new event
+        (see events).
+        """
+        return Sequence.from_generator(self.events(controllers=controllers), meta=meta)
+
+    def open(self):
+        midi_in_factory = self.midi_in_factory
+        if midi_in_factory is None:
+            import rtmidi
+            midi_in_factory = rtmidi.MidiIn
+        # a stream can be reopened after it has been closed, so
+        # discard anything left over from the previous session
+        with self._ready:
+            self._queue.clear()
+            self._closed = False
+        self.active_notes = frozenset()
+        self.timestamp = 0.0
+        self.midi_in = midi_in_factory()
+        port_no = self.get_port(self.midi_in.get_ports())
+        self.midi_in.open_port(port_no)
+        self.midi_in.set_callback(self._on_message)
+        logging.getLogger().debug(f"Opened MIDI input port {port_no}")
+        return self
+
+    def close(self):
+        if self.midi_in is not None:
+            self.midi_in.cancel_callback()
+            self.midi_in.close_port()
+            self.midi_in = None
+        # unblock any consumers waiting on input
+        with self._ready:
+            self._closed = True
+            self._ready.notify_all()
+        logging.getLogger().debug("Closed MIDI input port")
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.close()
+
 def get_midi_device_id(midi_device_name):
     init_midi()
     device = None
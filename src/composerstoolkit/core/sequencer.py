@@ -2,7 +2,7 @@ from __future__ import annotations
 import os
 from contextlib import ExitStack
 from dataclasses import dataclass
-from typing import Optional, List
+from typing import Optional, List, Tuple
 import logging
 import importlib
 import itertools
@@ -10,13 +10,14 @@ import time
 import sys
 
 import abjad
-from midiutil import MIDIFile
+import numpy as np
 
 from . sequence import Sequence, FiniteSequence, Event
 from . scheduler import Scheduler
 from . synth import Playback, DummyPlayback
 from . pitch_tracker import PitchTracker
 from . midicapture import MidiCapture
+from . smf import write_midi_file
 from .. resources.pitches import PitchFactory
 
 
@@ -150,7 +151,10 @@ class Sequencer:
             offset = kwargs["offset"]
         except KeyError:
             offset = 0
-        if offset > 0:
+        if offset > 0 and isinstance(seq, FiniteSequence):
+            # a new list, so the caller's sequence is left untouched
+            seq = seq.extend(events=[Event(duration=offset)] + list(seq.events))
+        elif offset > 0:
             seq = seq.extend(
                 events=itertools.chain([Event(duration=offset)], seq.events))
         try:
@@ -259,27 +263,43 @@ class Sequencer:
         abjad.show(score)
         return self
 
-    def save_as_midi_file(self, filename):
+    def save_as_midi_file(self, filename, n_beats=None):
         """Save the contents of the sequencer as a MIDI file
-        Only FiniteSequences can be written - otherwise an Exception will be raised.
+        filename can be a path, or a binary file object (eg io.BytesIO).
+        Sequence (ie infinite) tracks are written up to a cutoff of n_beats - otherwise an Exception will be raised.
         """
-        midifile = MIDIFile(len(self.sequences), deinterleave=False)
-        midifile.addTempo(0, 0, self.options["bpm"])
+        n_tracks = max([track_no for (track_no, offset, seq) in self.sequences], default=0)
+        # the (notes, controllers) of each track. Sequences on the same track are merged.
+        track_events: List[Tuple[list, list]] = [([], []) for _ in range(n_tracks)]
         for (track_no, offset, seq) in self.sequences:
-            if not isinstance(seq, FiniteSequence):
-                raise Exception("Only FiniteSequence(s) are supported for midi file output")
-            midifile.addTrackName(track_no - 1, offset, "Track {}".format(track_no))
-            count = offset
-            for event in seq.events:
+            if isinstance(seq, FiniteSequence):
+                events = seq.events
+            elif n_beats is not None:
+                events = seq.tap().bake(n_beats=n_beats).events
+            else:
+                raise Exception("n_beats is required to write a Sequence to a midi file")
+            notes, controllers = track_events[track_no - 1]
+            # any offset is already present as an initial rest (see add_sequence)
+            count = 0
+            for event in events:
+                if n_beats is not None and count >= n_beats:
+                    break
+                duration = event.duration
+                if n_beats is not None:
+                    duration = min(duration, n_beats - count)
                 for cc, value in event.meta.get("cc", []):
-                    midifile.addControllerEvent(track_no - 1, 0, count, cc, value)
+                    controllers.append((count, cc, value))
+                dynamic = event.meta.get("dynamic", 100)
                 for pitch in event.pitches:
-                    try:
-                        dynamic = event.meta["dynamic"]
-                    except KeyError:
-                        dynamic = 100
-                    midifile.addNote(track_no - 1, 0, pitch, count, event.duration, dynamic)
+                    notes.append((count, duration, pitch, dynamic))
                 count = count + event.duration
+        tracks = [("Track {}".format(i + 1),
+            np.array(notes, dtype=np.float64).reshape(-1, 4),
+            np.array(controllers, dtype=np.float64).reshape(-1, 3))
+            for i, (notes, controllers) in enumerate(track_events)]
+        if hasattr(filename, "write"):
+            write_midi_file(filename, tracks, bpm=self.options["bpm"])
+            return self
         with open(filename, 'wb') as outf:
-            midifile.writeFile(outf)
+            write_midi_file(outf, tracks, bpm=self.options["bpm"])
         return self
@@ -0,0 +1,241 @@
+"""Reading and writing of Standard MIDI Files (SMF).
+Events are handled as columns of numpy arrays, rather than as one
+python object per message, so that large scores can be encoded quickly.
+"""
+from dataclasses import dataclass
+import struct
+from typing import BinaryIO, Dict, Iterator, Iterable, List, Tuple, Union
+
+import numpy as np
+
+NOTE_OFF = 0x80
+NOTE_ON = 0x90
+CONTROL_CHANGE = 0xB0
+
+def _vlq_lengths(values: np.ndarray) -> np.ndarray:
+    """Return the number of bytes needed to encode each value
+    as a MIDI variable-length quantity.
+    """
+    return 1 + (values >= 1 << 7).astype(np.int64)\
+        + (values >= 1 << 14) + (values >= 1 << 21)
+
+def encode_vlq(values: np.ndarray) -> bytes:
+    """Encode an array of integers as a concatenated string of
+    MIDI variable-length quantities.
+    """
+    values = np.asarray(values, dtype=np.int64)
+    lengths = _vlq_lengths(values)
+    starts = np.cumsum(lengths) - lengths
+    out = np.zeros(int(lengths.sum()), dtype=np.uint8)
+    _write_vlq(out, starts, values, lengths)
+    return out.tobytes()
+
+def _write_vlq(out: np.ndarray, starts: np.ndarray, values: np.ndarray, lengths: np.ndarray):
+    for j in range(4):
+        mask = lengths > j
+        shift = 7 * (lengths[mask] - 1 - j)
+        byte = (values[mask] >> shift) & 0x7F
+        byte = byte | np.where(j < lengths[mask] - 1, 0x80, 0)
+        out[starts[mask] + j] = byte
+
+def _meta_event(meta_type: int, data: bytes) -> bytes:
+    return bytes([0x00, 0xFF, meta_type]) + encode_vlq([len(data)]) + data
+
+def _chunk(chunk_type: bytes, data: bytes) -> bytes:
+    return chunk_type + struct.pack(">I", len(data)) + data
+
+def encode_track(name: str,
+    notes: np.ndarray,
+    controllers: np.ndarray,
+    ticks_per_beat: int = 960,
+    channel: int = 0) -> bytes:
+    """Encode a single MTrk chunk.
+    notes - array of rows (onset, duration, pitch, velocity), with times in beats
+    controllers - array of rows (time, controller number, value), with time in beats
+    """
+    notes = np.asarray(notes, dtype=np.float64).reshape(-1, 4)
+    controllers = np.asarray(controllers, dtype=np.float64).reshape(-1, 3)
+
+    on_ticks = np.rint(notes[:, 0] * ticks_per_beat).astype(np.int64)
+    off_ticks = np.rint((notes[:, 0] + notes[:, 1]) * ticks_per_beat).astype(np.int64)
+    cc_ticks = np.rint(controllers[:, 0] * ticks_per_beat).astype(np.int64)
+    pitches = notes[:, 2].astype(np.int64)
+    velocities = notes[:, 3].astype(np.int64)
+    n_notes = len(notes)
+    n_ccs = len(controllers)
+
+    ticks = np.concatenate((cc_ticks, off_ticks, on_ticks))
+    # at the same tick: controllers, then note offs, then note ons.
+    # A zero length note is closed after it has been opened.
+    order = np.concatenate((
+        np.zeros(n_ccs, dtype=np.int64),
+        np.where(off_ticks == on_ticks, 3, 1),
+        np.full(n_notes, 2, dtype=np.int64)))
+    status = np.concatenate((
+        np.full(n_ccs, CONTROL_CHANGE | channel),
+        np.full(n_notes, NOTE_OFF | channel),
+        np.full(n_notes, NOTE_ON | channel))).astype(np.uint8)
+    data1 = np.concatenate((controllers[:, 1].astype(np.int64), pitches, pitches))
+    data2 = np.concatenate((controllers[:, 2].astype(np.int64), velocities, velocities))
+
+    sort_index = np.lexsort((data2, data1, order, ticks))
+    # drop identical events (eg the same pitch doubled within a chord)
+    keys = np.stack((ticks, order, data1, data2))[:, sort_index]
+    is_unique = np.ones(len(sort_index), dtype=bool)
+    is_unique[1:] = np.any(keys[:, 1:] != keys[:, :-1], axis=0)
+    sort_index = sort_index[is_unique]
+    ticks = ticks[sort_index]
+    deltas = np.diff(ticks, prepend=0)
+
+    lengths = _vlq_lengths(deltas)
+    starts = np.cumsum(lengths + 3) - (lengths + 3)
+    body = np.zeros(int((lengths + 3).sum()), dtype=np.uint8)
+    _write_vlq(body, starts, deltas, lengths)
+    body[starts + lengths] = status[sort_index]
+    body[starts + lengths + 1] = np.clip(data1[sort_index], 0, 127)
+    body[starts + lengths + 2] = np.clip(data2[sort_index], 0, 127)
+
+    data = _meta_event(0x03, name.encode("utf-8"))\
+        + body.tobytes()\
+        + _meta_event(0x2F, b"")
+    return _chunk(b"MTrk", data)
+
+def write_midi_file(outf: BinaryIO,
+    tracks: List[Tuple[str, np.ndarray, np.ndarray]],
+    bpm: float = 120,
+    ticks_per_beat: int = 960):
+    """Stream a format 1 MIDI file to the (binary) file object outf.
+    tracks is a list of (name, notes, controllers) - see encode_track.
+    The first track in the file is a conductor track, containing the tempo.
+    """
+    header = struct.pack(">HHH", 1, len(tracks) + 1, ticks_per_beat)
+    outf.write(_chunk(b"MThd", header))
+    tempo = int(round(60_000_000 / bpm))
+    outf.write(_chunk(b"MTrk",
+        _meta_event(0x51, tempo.to_bytes(3, "big")) + _meta_event(0x2F, b"")))
+    for name, notes, controllers in tracks:
+        outf.write(encode_track(name, notes, controllers, ticks_per_beat))
+
+@dataclass
+class NoteArrays:
+    """Columnar representation of the notes in a single MIDI track.
+    Each note is an index into the arrays, ordered by the position of
+    its note on message in the track.
+    Times are in beats. Notes that are never closed have an offset of nan.
+    length is the time of the last (non-meta) message in the track.
+    """
+    pitch: np.ndarray
+    onset: np.ndarray
+    offset: np.ndarray
+    velocity: np.ndarray
+    channel: np.ndarray
+    length: float = 0
+
+    def __len__(self):
+        return len(self.pitch)
+
+def notes_from_messages(
+    messages: Iterable[Tuple[int, int, int, int]],
+    ticks_per_beat: int = 960) -> NoteArrays:
+    """Pair the note on and note off events from a stream of
+    (tick, status, data1, data2) messages, where tick is
+    the absolute time in ticks.
+    Notes are matched on (channel, pitch). A note off closes all notes
+    that are open on that channel and pitch.
+    """
+    pitches: List[int] = []
+    onsets: List[int] = []
+    offsets: List[float] = []
+    velocities: List[int] = []
+    channels: List[int] = []
+    open_notes: Dict[Tuple[int, int], List[int]] = {}
+    last_tick = 0
+    for tick, status, data1, data2 in messages:
+        last_tick = tick
+        kind = status & 0xF0
+        if kind == NOTE_ON and data2 > 0:
+            key = (status & 0x0F, data1)
+            open_notes.setdefault(key, []).append(len(pitches))
+            pitches.append(data1)
+            onsets.append(tick)
+            offsets.append(np.nan)
+            velocities.append(data2)
+            channels.append(status & 0x0F)
+        elif kind == NOTE_OFF or kind == NOTE_ON:
+            for i in open_notes.pop((status & 0x0F, data1), []):
+                offsets[i] = tick
+    return NoteArrays(
+        pitch = np.array(pitches, dtype=np.int64),
+        onset = np.array(onsets, dtype=np.float64) / ticks_per_beat,
+        offset = np.array(offsets, dtype=np.float64) / ticks_per_beat,
+        velocity = np.array(velocities, dtype=np.int64),
+        channel = np.array(channels, dtype=np.int64),
+        length = last_tick / ticks_per_beat)
+
+def _read_vlq(data: bytes, pos: int) -> Tuple[int, int]:
+    value = 0
+    while True:
+        byte = data[pos]
+        pos = pos + 1
+        value = (value << 7) | (byte & 0x7F)
+        if byte < 0x80:
+            return value, pos
+
+def iter_track_messages(data: bytes) -> Iterator[Tuple[int, int, int, int]]:
+    """Parse the body of an MTrk chunk, yielding (tick, status, data1, data2)
+    for each channel or sysex message (meta messages are skipped).
+    Running status is supported.
+    """
+    pos = 0
+    tick = 0
+    status = 0
+    end = len(data)
+    while pos < end:
+        delta, pos = _read_vlq(data, pos)
+        tick = tick + delta
+        if data[pos] & 0x80:
+            status = data[pos]
+            pos = pos + 1
+        if status == 0xFF:
+            length, pos = _read_vlq(data, pos + 1)
+            pos = pos + length
+            status = 0
+            continue
+        if status in (0xF0, 0xF7):
+            length, pos = _read_vlq(data, pos)
+            pos = pos + length
+            status = 0
+            yield tick, 0xF0, 0, 0
+            continue
+        if status & 0xF0 in (0xC0, 0xD0):
+            yield tick, status, data[pos], 0
+            pos = pos + 1
+            continue
+        yield tick, status, data[pos], data[pos + 1]
+        pos = pos + 2
+
+def read_midi_file(source: Union[str, BinaryIO]) -> List[NoteArrays]:
+    """Read a MIDI file (a path or binary file object), and
+    return the notes of each track as NoteArrays.
+    """
+    if hasattr(source, "read"):
+        data = source.read()
+    else:
+        with open(source, "rb") as inf:
+            data = inf.read()
+    if data[:4] != b"MThd":
+        raise Exception("Not a Standard MIDI File")
+    header_length = struct.unpack(">I", data[4:8])[0]
+    _format, _n_tracks, division = struct.unpack(">HHH", data[8:14])
+    if division & 0x8000:
+        raise Exception("SMPTE time division is not supported")
+    tracks = []
+    pos = 8 + header_length
+    while pos + 8 <= len(data):
+        chunk_type = data[pos:pos + 4]
+        length = struct.unpack(">I", data[pos + 4:pos + 8])[0]
+        body = data[pos + 8:pos + 8 + length]
+        pos = pos + 8 + length
+        if chunk_type == b"MTrk":
+            tracks.append(notes_from_messages(iter_track_messages(body), division))
+    return tracks
@@ -4,7 +4,12 @@ Some intefaces for different playback engines.
 
 from abc import ABC
 import logging
+from queue import SimpleQueue
+from threading import Thread
 import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from . smf import NOTE_ON, NOTE_OFF, CONTROL_CHANGE
 from ..resources import NOTE_MIN, NOTE_MAX
 
 
@@ -89,6 +94,119 @@ class RTPMidi(Playback):
         del self.midiout
         logging.getLogger().debug("Closed connection to RTPMidi port")
 
+class _PortSender(Thread):
+    """Sends the messages queued for a single output port on its own thread.
+    """
+
+    def __init__(self, midiout, port_no: int):
+        super().__init__(daemon=True)
+        self.midiout = midiout
+        self.port_no = port_no
+        self.queue: SimpleQueue = SimpleQueue()
+        self.n_sent = 0
+
+    def run(self):
+        while True:
+            message = self.queue.get()
+            if message is None:
+                return
+            self.midiout.send_message(message)
+            self.n_sent = self.n_sent + 1
+
+class RoutedMidi(Playback):
+    """
+    MIDI playback over several output ports (using rtmidi,
+    package python-rtmidi).
+    Each track is routed to a (port, channel) pair, and each port
+    is written to by its own sender thread, so that a busy port does
+    not hold up the others.
+    """
+
+    def __init__(self,
+        get_ports: Callable[[List[str]], List[int]] = lambda all_ports: [0],
+        routes: Optional[Dict[int, Tuple[int, int]]] = None,
+        midi_out_factory = None):
+        """
+        get_ports - function to return the indexes of the desired
+        midi ports, given a list of available port names
+        routes - dict of track: (port, channel), where port is an index into the
+        list returned by get_ports, and channel is zero-based.
+        Tracks without a route are spread across the ports, 16 tracks per port
+        (ie tracks 1-16 go to channels 0-15 of the first port, 17-32 to the second...)
+        Messages for tracks beyond the last port are logged and dropped.
+        midi_out_factory - callable returning a new (rtmidi.MidiOut compatible) output.
+        Defaults to rtmidi.MidiOut
+        """
+        if midi_out_factory is None:
+            import rtmidi
+            midi_out_factory = rtmidi.MidiOut
+        self.midi_out_factory = midi_out_factory
+        # the output used to list the ports is reused for the first port
+        self._midiout = midi_out_factory()
+        self.port_nos = get_ports(self._midiout.get_ports())
+        self.routes = {} if routes is None else dict(routes)
+        for track, (port, channel) in self.routes.items():
+            if not 0 <= port < len(self.port_nos) or not 0 <= channel < 16:
+                raise Exception(f"RoutedMidi: invalid route {(port, channel)} for track {track}")
+        self._senders: List[_PortSender] = []
+
+    def route(self, track: int) -> Tuple[int, int]:
+        """Return the (port, channel) that track is sent to.
+        """
+        try:
+            return self.routes[track]
+        except KeyError:
+            pass
+        port, channel = divmod(track - 1, 16)
+        if not 0 <= port < len(self.port_nos):
+            raise Exception(f"RoutedMidi: no output port available for track {track}")
+        self.routes[track] = (port, channel)
+        return port, channel
+
+    def _send(self, track: int, status: int, data1: int, data2: int):
+        if not self._senders:
+            return
+        try:
+            port, channel = self.route(track)
+        except Exception as e:
+            # this is called from the sequencer's playback thread, so don't raise
+            logging.getLogger().warning(f"{e} (message dropped)")
+            return
+        self._senders[port].queue.put([status | channel, data1, data2])
+
+    def noteon(self, track: int, pitch: int, velocity: int):
+        if pitch > NOTE_MAX or pitch < NOTE_MIN:
+            return
+        self._send(track, NOTE_ON, pitch, velocity)
+
+    def noteoff(self, track: int, pitch: int):
+        if pitch > NOTE_MAX or pitch < NOTE_MIN:
+            return
+        self._send(track, NOTE_OFF, pitch, 0)
+
+    def control_change(self, track: int, cc: int, value: int):
+        self._send(track, CONTROL_CHANGE, cc, value)
+
+    def __enter__(self):
+        for i, port_no in enumerate(self.port_nos):
+            midiout = self._midiout if i == 0 else self.midi_out_factory()
+            midiout.open_port(port_no)
+            sender = _PortSender(midiout, port_no)
+            sender.start()
+            self._senders.append(sender)
+        logging.getLogger().debug(f"Opened connection to MIDI ports {self.port_nos}")
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        senders = self._senders
+        self._senders = []
+        for sender in senders:
+            sender.queue.put(None)
+        for sender in senders:
+            sender.join()
+            sender.midiout.close_port()
+        logging.getLogger().debug(f"Closed connection to MIDI ports {self.port_nos}")
+
 class FluidsynthPlayback(Playback):
     """
     Wrapper for fluidsynth
@@ -1,6 +1,11 @@
 import unittest
+import itertools
+import random
+import time
+from unittest.mock import patch
 
 from composerstoolkit import *
+from composerstoolkit.analysis import mining
 
 def _build_lexicon(chords: List[Event]):
     lexicon = []
@@ -17,6 +22,12 @@ def _build_lexicon(chords: List[Event]):
 PitchFactory = pitches.PitchFactory
 pf = PitchFactory()
 
+def _slow_mine_shard(shard, depth, min_support):
+    # a stand in for mining._mine_shard, where one shard takes a long time
+    if [9] in shard:
+        time.sleep(5)
+    return mining.PrefixSpan(shard).topk(depth)
+
 class TestChordalAnalysis(unittest.TestCase):
 
     def test_it_identifies_simple_triad(self):
@@ -135,6 +146,24 @@ class TestChordalAnalysis(unittest.TestCase):
         # C maj 7 is the largest match
         assert found_chords == [{0,4,7,11}]
 
+    def test_ambiguous_chords_are_resolved_by_voice_leading(self):
+        lexicon = [{0,4,7}, {9,0,4}, {2,7,11}]
+        source = FiniteSequence(events=[
+            Event([pf("B3")], duration=1),
+            Event([pf("D4")], duration=1),
+            Event([pf("G4")], duration=1),
+            Event([pf("E4")], duration=1),
+            Event([pf("C5")], duration=1),
+            Event([pf("C4")], duration=1)
+        ])
+        found_chords = chordal_analysis(
+            source,
+            window_size_beats=3,
+            overlap_threshold=1,
+            chord_lexicon=lexicon)
+        # C-E fits both C major and A minor. A minor is closer to G major
+        assert found_chords == [{2,7,11}, {9,0,4}]
+
 class TestCommonSubsequences(unittest.TestCase):
 
     def test_common_subsequences(self):
@@ -150,6 +179,20 @@ class TestCommonSubsequences(unittest.TestCase):
            (2, [3,1,2])
         ]
 
+    def test_common_subsequences_of_vectors(self):
+        dataset = [(2, 1), (2, 1), (-4, 2)] * 3 + [(1, 1)] * 10
+        results = common_subsequences(
+            dataset = dataset,
+            min_match_len = 2,
+            max_match_len = 4
+        )
+        assert results[:4] == [
+           (8, [(1, 1), (1, 1)]),
+           (6, [(1, 1), (1, 1), (1, 1)]),
+           (3, [(2, 1), (-4, 2)]),
+           (3, [(2, 1), (2, 1)])
+        ]
+
     def test_it_raises_an_exc_if_dataset_too_short(self):
         dataset = [1,2,3,1,2,3,1,2,3]
         with self.assertRaises(Exception) as e:
@@ -172,6 +215,61 @@ class TestHiddenSubsequences(unittest.TestCase):
         )
         assert [1,2,3,1,2,3] in [r for count,r in results]
 
+    def test_sharded_hidden_subsequences_have_exact_counts(self):
+        dataset = [[1,0,2,0,3,0,1,0,2,3],
+                   [0,1,2,0,3,1,0,2,3],
+                   [1,2,3],
+                   [3,2,1]]
+        results = hidden_subsequences(
+            dataset = dataset,
+            n_shards = 2,
+            n_workers = 2,
+            min_support = 3
+        )
+        assert (3, [1,2,3]) in results
+        assert (4, [1]) in results
+        assert (2, [1,2,3,1,2,3]) not in results
+        progress = []
+        results = hidden_subsequences(
+            dataset = dataset,
+            depth = 1,
+            n_shards = 2,
+            n_workers = 2,
+            progress = lambda done, total: progress.append((done, total))
+        )
+        assert results[0][0] == 4
+        assert progress[-1] == (8, 8)
+
+    def test_stopping_early_does_not_wait_for_running_shards(self):
+        dataset = [[1,2,3], [1,2], [9], [9]]
+        progress = []
+        def stop(done, total):
+            progress.append(done)
+            return False
+        started = time.perf_counter()
+        with patch.object(mining, "_mine_shard", _slow_mine_shard):
+            results = hidden_subsequences(
+                dataset = dataset,
+                depth = 1,
+                n_shards = 2,
+                n_workers = 2,
+                progress = stop
+            )
+        assert time.perf_counter() - started < 4
+        assert progress == [1]
+        assert results == [(2, [1])]
+
+    def test_sharded_low_support_matches_single_process(self):
+        # almost every item is unique, so the top patterns have a support of 1 or 2
+        rng = random.Random(4)
+        dataset = [[rng.randrange(1000) for _ in range(16)] for _ in range(16)]
+        started = time.perf_counter()
+        results = hidden_subsequences(dataset, depth=10, n_shards=4, n_workers=2)
+        assert time.perf_counter() - started < 5
+        assert results == hidden_subsequences(dataset, depth=10)
+        assert hidden_subsequences(dataset, n_shards=4, n_workers=2, min_support=2)\
+            == hidden_subsequences(dataset, min_support=2)
+
 class TestStatisticsTools(unittest.TestCase):
 
     def test_pitch_range(self):
@@ -214,5 +312,137 @@ class TestStatisticsTools(unittest.TestCase):
         dcs = duration_classes(seq)
         assert dcs == {1,2,5,9}
 
+    def test_monitor_accumulates_an_infinite_sequence(self):
+        pitches = itertools.cycle([60, 64, 67, 72])
+        seq = Sequence(events=(Event([next(pitches)], duration=1) for _ in itertools.count()))
+        range_ = PitchRange()
+        durations = DurationHistogram()
+        intervals = IntervalHistogram()
+        pitch_classes = PitchClassDistribution()
+        seq = seq.transform(monitor(range_, durations, intervals, pitch_classes))
+        baked = seq.bake(n_events=5)
+        assert len(baked.events) == 5
+        assert range_.range == (60, 72)
+        assert durations.total == 5
+        assert durations.classes() == {1}
+        assert intervals.counts == {4: 1, 3: 1, 5: 1, -12: 1}
+        assert pitch_classes.counts[0] == 3
+        assert pitch_classes.distribution()[4] == 0.2
+
+    def test_statistics_observer(self):
+        now = [0.0]
+        range_ = PitchRange()
+        durations = DurationHistogram()
+        observer = StatisticsObserver(range_, durations, bpm=60, clock=lambda: now[0])
+        observer.noteon(1, 62, 100)
+        observer.noteon(2, 50, 100)
+        now[0] = 2.0
+        observer.noteoff(1, 62)
+        observer.noteoff(2, 50)
+        assert range_.range == (50, 62)
+        # the notes started together, so they are counted as one chord
+        assert durations.counts == {2.0: 1}
+        # notes that were never started are ignored
+        observer.noteoff(1, 70)
+        assert range_.highest == 62
+
+    def test_statistics_observer_groups_notes_by_onset(self):
+        now = [0.0]
+        intervals = IntervalHistogram()
+        durations = DurationHistogram()
+        observer = StatisticsObserver(intervals, durations, bpm=60, clock=lambda: now[0])
+        for pitch in (60, 64, 67):
+            observer.noteon(1, pitch, 100)
+        now[0] = 1.0
+        observer.noteon(2, 48, 100)
+        observer.noteoff(1, 67)
+        observer.noteoff(1, 60)
+        now[0] = 2.0
+        observer.noteon(1, 72, 100)
+        now[0] = 2.5
+        observer.noteoff(1, 64)
+        now[0] = 3.0
+        observer.noteoff(1, 72)
+        # the bass note is still held, so the melody note is not presented yet
+        assert intervals.counts == {}
+        assert durations.counts == {2.5: 1}
+        now[0] = 4.0
+        observer.noteoff(2, 48)
+        # 67 -> 48 -> 72, in order of onset
+        assert intervals.counts == {-19: 1, 24: 1}
+        assert durations.counts == {2.5: 1, 3.0: 1, 1.0: 1}
+
+    def test_vectorized_graph_statistics(self):
+        graph = FiniteSequence(events=[
+            Event([60], duration=1),
+            Event([64, 67], duration=2),
+            Event([72], duration=1)
+        ]).to_graph()
+        edges = list(graph)
+        for left, right in zip(edges, edges[1:]):
+            graph.add_vertex(left, right)
+        histogram = pitch_class_histogram(graph)
+        assert histogram[0] == 2 and histogram[4] == 1 and histogram[7] == 1
+        assert pitch_class_histogram([graph, graph], weighted=True)[4] == 4
+        intervals, counts = interval_distribution(graph)
+        assert dict(zip(intervals.tolist(), counts.tolist())) == {3: 1, 4: 1, 5: 1}
+        times, counts = density(graph)
+        assert times.tolist() == [0, 1, 2, 3, 4]
+        assert counts.tolist() == [1, 2, 2, 1, 0]
+
+class TestMarkovTables(unittest.TestCase):
+
+    def _melody_graph(self):
+        # C D E C D F
+        return FiniteSequence(events=[
+            Event([p], duration=1) for p in [60, 62, 64, 60, 62, 65]
+        ]).to_graph()
+
+    def _link_graph(self, graph):
+        edges = list(graph)
+        for left, right in zip(edges, edges[1:]):
+            graph.add_vertex(left, right)
+        return graph
+
+    def test_first_order_pitch_class_table(self):
+        graph = self._link_graph(self._melody_graph())
+        table = build_markov_table([graph, graph])
+        dense = table.to_dense()
+        assert dense.shape == (12, 12)
+        assert dense[0][2] == 4
+        assert dense[2][4] == 2
+        assert dense[2][5] == 2
+        probabilities = table.to_dense(probabilities=True)
+        assert probabilities[2][4] == 0.5
+
+    def test_second_order_interval_table(self):
+        graph = self._link_graph(self._melody_graph())
+        table = build_markov_table([graph], order=2, alphabet="interval")
+        contexts = table.contexts() - 127
+        symbols = table.symbols() - 127
+        transitions = {(tuple(c), s): n for c, s, n in\
+            zip(contexts.tolist(), symbols.tolist(), table.counts.tolist())}
+        assert transitions == {
+            ((2, 2), -4): 1,
+            ((2, -4), 2): 1,
+            ((-4, 2), 3): 1}
+
+    def test_high_order_codes_do_not_overflow(self):
+        # G C D E C D F E D C - 9 intervals, so two order 7 interval
+        # transitions (255 ** 8 codes do not fit in int64)
+        graph = self._link_graph(FiniteSequence(events=[
+            Event([p], duration=1) for p in [55, 60, 62, 64, 60, 62, 65, 64, 62, 60]
+        ]).to_graph())
+        table = build_markov_table([graph], order=7, alphabet="interval")
+        transitions = {(tuple(c), s): n for c, s, n in zip(
+            (table.contexts() - 127).tolist(),
+            (table.symbols() - 127).tolist(),
+            table.counts.tolist())}
+        assert transitions == {
+            ((5, 2, 2, -4, 2, 3, -1), -2): 1,
+            ((2, 2, -4, 2, 3, -1, -2), -2): 1}
+        assert (table + table).counts.tolist() == [2, 2]
+        assert table.probabilities().tolist() == [1.0, 1.0]
+
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
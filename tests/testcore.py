@@ -1,5 +1,7 @@
 from dataclasses import dataclass
+import io
 import os
+import queue
 import types
 import unittest
 from unittest.mock import patch
@@ -138,6 +140,140 @@ class TestGraph(unittest.TestCase):
         assert arr[(-4,0)] == [[pitch3, pitch4]]
         assert arr[(-6,0)] == [[pitch1, pitch2]]
 
+    def test_vertices_are_stored_as_csr_arrays(self):
+        graph = Graph()
+        pitch1 = Edge(pitch=65, start_time=0, end_time=1)
+        pitch2 = Edge(pitch=59, start_time=0, end_time=1)
+        pitch3 = Edge(pitch=64, start_time=1, end_time=2)
+        graph.add_edge(pitch1)
+        graph.add_edge(pitch2)
+        graph.add_edge(pitch3)
+        graph.add_vertex(pitch2, pitch3)
+        graph.add_vertex(pitch1, pitch3)
+        graph.add_vertex(pitch1, pitch2)
+        indptr, indices = graph.adjacency
+        assert indptr.tolist() == [0, 2, 3, 3]
+        assert indices.tolist() == [2, 1, 2]
+        assert pitch1.vertices == [pitch3, pitch2]
+        origins, destinations, pitch_deltas, time_deltas = graph.get_vector_arrays()
+        assert origins.tolist() == [0, 0, 1]
+        assert pitch_deltas.tolist() == [-1, -6, 5]
+        assert time_deltas.tolist() == [1, 0, 1]
+
+    def test_edges_write_through_to_the_graph(self):
+        graph = Graph()
+        pitch_c = Edge(pitch=60, start_time=0, end_time=None)
+        graph.add_edge(pitch_c)
+        assert graph.pitches.tolist() == [60]
+        pitch_c.pitch = 61
+        assert graph.pitches.tolist() == [61]
+        assert graph.get_pitches_at(4) == [61]
+        pitch_d = Edge(pitch=62, start_time=1, end_time=2)
+        graph.add_vertex(pitch_c, pitch_d)
+        assert graph.pitches.tolist() == [61, 62]
+        assert pitch_c.vertices == [pitch_d]
+        with self.assertRaises(ValueError):
+            graph.add_vertex(Edge(pitch=64, start_time=2, end_time=3), pitch_c)
+
+    def test_edge_vertices_write_through_to_the_graph(self):
+        graph = Graph()
+        pitch_c = Edge(pitch=60, start_time=0, end_time=1)
+        pitch_d = Edge(pitch=62, start_time=1, end_time=2)
+        graph.add_edge(pitch_c)
+        graph.add_edge(pitch_d)
+        pitch_c.vertices.append(pitch_d)
+        assert pitch_c.vertices == [pitch_d]
+        assert len(graph.get_vector_list()) == 1
+        pitch_e = Edge(pitch=64, start_time=2, end_time=3)
+        pitch_c.vertices.append(pitch_e)
+        assert graph.pitches.tolist() == [60, 62, 64]
+        pitch_c.vertices.remove(pitch_d)
+        assert pitch_c.vertices == [pitch_e]
+        assert graph.adjacency[1].tolist() == [2]
+
+    def test_an_edge_can_only_belong_to_one_graph(self):
+        graph1 = Graph()
+        pitch_c = Edge(pitch=60, start_time=0, end_time=1)
+        graph1.add_edge(pitch_c)
+        graph2 = Graph()
+        with self.assertRaises(ValueError):
+            graph2.add_edge(pitch_c)
+        with self.assertRaises(ValueError):
+            graph2.add_edge(Edge(pitch=62, start_time=1, end_time=2, vertices=[pitch_c]))
+        assert len(graph2) == 0
+        assert pitch_c.graph is graph1
+        assert pitch_c.edge_id == 0
+
+    def test_we_can_query_edges_in_a_time_range(self):
+        graph = Graph()
+        graph.add_edge(Edge(pitch=65, start_time=0, end_time=1))
+        graph.add_edge(Edge(pitch=59, start_time=0, end_time=4))
+        graph.add_edge(Edge(pitch=64, start_time=1, end_time=2))
+        graph.add_edge(Edge(pitch=60, start_time=3, end_time=None))
+        assert [e.pitch for e in graph.get_edges_between(1, 3)] == [59, 64]
+        assert [e.pitch for e in graph.get_edges_between(2.5, 10)] == [59, 60]
+        assert [e.pitch for e in graph.get_edges_at(3)] == [59, 60]
+
+    def test_verticalities_are_returned_as_arrays(self):
+        graph = Graph()
+        graph.add_edge(Edge(pitch=65, start_time=0, end_time=1))
+        graph.add_edge(Edge(pitch=59, start_time=0, end_time=2))
+        graph.add_edge(Edge(pitch=64, start_time=1, end_time=2))
+        onsets, indptr, pitches = graph.get_verticalities()
+        assert onsets.tolist() == [0, 1]
+        assert indptr.tolist() == [0, 2, 4]
+        assert pitches.tolist() == [59, 65, 59, 64]
+        graph.add_edge(Edge(pitch=67, start_time=1, end_time=2))
+        assert graph.get_pitches_at(1) == [59, 64, 67]
+
+    def test_intersections_between_graphs(self):
+        upper = Graph()
+        upper.add_edge(Edge(pitch=72, start_time=0, end_time=2))
+        upper.add_edge(Edge(pitch=71, start_time=2, end_time=3))
+        lower = Graph()
+        lower.add_edge(Edge(pitch=48, start_time=1, end_time=2))
+        lower.add_edge(Edge(pitch=55, start_time=2, end_time=4))
+        pairs = upper.intersections(lower)
+        assert [(e1.pitch, e2.pitch) for e1, e2 in pairs] == [(72, 48), (71, 55)]
+
+    def test_graphs_can_be_merged_in_time_order(self):
+        graph1 = Graph()
+        pitch_c = Edge(pitch=60, start_time=0, end_time=1)
+        pitch_d = Edge(pitch=62, start_time=2, end_time=3)
+        graph1.add_edge(pitch_c)
+        graph1.add_edge(pitch_d)
+        graph1.add_vertex(pitch_c, pitch_d)
+        graph2 = Graph()
+        graph2.add_edge(Edge(pitch=48, start_time=1, end_time=2))
+        merged = Graph.merge(graph1, graph2)
+        assert [e.pitch for e in merged] == [60, 48, 62]
+        assert merged.edges[0].vertices == [merged.edges[2]]
+
+    def test_graph_is_only_sorted_after_it_changes(self):
+        graph = Graph()
+        graph.add_edge(Edge(pitch=64, start_time=1, end_time=2))
+        graph.add_edge(Edge(pitch=60, start_time=0, end_time=1))
+        assert [e.pitch for e in graph] == [60, 64]
+        graph.edges.sort(key=lambda e: e.pitch, reverse=True)
+        assert [e.pitch for e in graph] == [60, 64]
+        graph.edges[0].start_time = 3
+        assert [e.pitch for e in graph] == [64, 60]
+
+    def test_columnar_export(self):
+        graph = Graph()
+        pitch_c = Edge(pitch=60, start_time=0, end_time=1)
+        pitch_e = Edge(pitch=64, start_time=1, end_time=3)
+        graph.add_edge(pitch_c)
+        graph.add_edge(pitch_e)
+        graph.add_vertex(pitch_c, pitch_e)
+        dataframe = graph.to_pandas_dataframe()
+        assert list(dataframe["pitch"]) == [60, 64]
+        assert list(dataframe["time"]) == [0, 1]
+        assert list(dataframe["end_time"]) == [1, 3]
+        assert list(dataframe["duration"]) == [1, 2]
+        vertices = graph.to_vertices_dataframe()
+        assert vertices.values.tolist() == [[0, 1, 4, 1]]
+
 class TestMIDIParser(unittest.TestCase):
 
     def test_vertically_coincident_notes_linked_by_vertices(self):
@@ -183,6 +319,23 @@ class TestMIDIParser(unittest.TestCase):
         assert graph.edges[1].vertices == []
         assert graph.edges[2].vertices == []
 
+    def test_byte_level_reader_returns_columnar_notes(self):
+        filename = os.path.join("tests", "iv_i_suspension.MID")
+        notes = read_midi_file(filename)[0]
+        assert list(notes.pitch) == [60, 65, 64]
+        assert list(notes.onset) == [0, 0, 1]
+        assert list(notes.offset) == [2, 1, 2]
+
+    def test_graph_from_midi_file_matches_mido_parser(self):
+        filename = os.path.join("tests", "simple_i-iv.MID")
+        graph1 = Graph.from_midi_track(MidiFile(filename).tracks[0])
+        graph2 = Graph.from_midi_file(filename)
+        def summary(graph):
+            index = {id(e): i for i, e in enumerate(graph.edges)}
+            return [(e.pitch, e.start_time, e.end_time,
+                [index[id(v)] for v in e.vertices]) for e in graph.edges]
+        assert summary(graph1) == summary(graph2)
+
 class EventTests(unittest.TestCase):
 
     def test_we_can_convert_an_event_to_set_of_edges(self):
@@ -605,6 +758,56 @@ class SequencerTests(unittest.TestCase):
         assert graph.edges[1].start_time == 1
         assert graph.edges[1].end_time == 2
 
+    def test_sequences_on_the_same_track_are_saved_together(self):
+        s = Sequencer(bpm=100, playback_rate=1)
+        s.add_sequence(FiniteSequence([Event(pitches=[60], duration=2)]), track_no=1)
+        s.add_sequence(FiniteSequence([Event(pitches=[64], duration=1)]), track_no=1, offset=1)
+        outf = io.BytesIO()
+        s.save_as_midi_file(outf)
+        outf.seek(0)
+        midi_file = MidiFile(file=outf)
+        assert len(midi_file.tracks) == 2
+        graph = Graph.from_midi_track(midi_file.tracks[1])
+        assert [(e.pitch, e.start_time, e.end_time) for e in graph] == [
+            (60, 0, 2), (64, 1, 2)]
+
+    def test_saving_leaves_the_added_sequences_untouched(self):
+        s = Sequencer(bpm=100, playback_rate=1)
+        events = (Event(pitches=[60], duration=1), Event(pitches=[62], duration=1))
+        seq = FiniteSequence(events)
+        s.add_sequence(seq)
+        s.add_sequence(FiniteSequence(list(events)), offset=1)
+        first, second = io.BytesIO(), io.BytesIO()
+        s.save_as_midi_file(first)
+        s.save_as_midi_file(second)
+        assert first.getvalue() == second.getvalue()
+        assert seq.events is events
+        assert [e.pitches for e in seq.events] == [[60], [62]]
+
+    def test_can_save_an_infinite_sequence_up_to_n_beats(self):
+        s = Sequencer(bpm=100, playback_rate=1)
+        seq = Sequence(events=[
+            Event(pitches=[60], duration=1),
+            Event(pitches=[62], duration=2)]).transform(loop())
+        s.add_sequence(seq)
+        outf = io.BytesIO()
+        s.save_as_midi_file(outf, n_beats=4)
+        outf.seek(0)
+        midi_file = MidiFile(file=outf)
+        graph = Graph.from_midi_track(midi_file.tracks[1])
+        assert [(e.pitch, e.start_time, e.end_time) for e in graph] == [
+            (60, 0, 1), (62, 1, 3), (60, 3, 4)]
+
+    def test_an_infinite_sequence_requires_n_beats(self):
+        s = Sequencer(bpm=100, playback_rate=1)
+        s.add_sequence(Sequence(events=[Event(pitches=[60], duration=1)]))
+        with self.assertRaises(Exception):
+            s.save_as_midi_file(io.BytesIO())
+
+    def test_variable_length_quantities(self):
+        assert encode_vlq([0, 0x7F, 0x80, 0x3FFF, 0x4000, 0x0FFFFFFF]) == bytes([
+            0x00, 0x7F, 0x81, 0x00, 0xFF, 0x7F, 0x81, 0x80, 0x00, 0xFF, 0xFF, 0xFF, 0x7F])
+
     def test_can_playback(self):
         s = Sequencer(synth=DummyPlayback(), debug=False)
         seq = FiniteSequence([
@@ -734,5 +937,183 @@ class GateTests(unittest.TestCase):
 
 
 
+class FakeMidiIn:
+
+    def __init__(self):
+        self.port_no = None
+        self.callback = None
+        self.is_open = False
+
+    def get_ports(self):
+        return ["port a", "port b"]
+
+    def open_port(self, port_no):
+        self.port_no = port_no
+        self.is_open = True
+
+    def set_callback(self, callback, data=None):
+        self.callback = callback
+
+    def cancel_callback(self):
+        self.callback = None
+
+    def close_port(self):
+        self.is_open = False
+
+    def receive(self, message, delta):
+        self.callback((message, delta), None)
+
+class MidiInputStreamTests(unittest.TestCase):
+
+    def setUp(self):
+        self.inputs = []
+
+    def midi_in_factory(self):
+        midi_in = FakeMidiIn()
+        self.inputs.append(midi_in)
+        return midi_in
+
+    def open_stream(self, **kwargs):
+        midi_in = MidiInputStream(midi_in_factory=self.midi_in_factory, **kwargs)
+        return midi_in.open(), self.inputs[-1]
+
+    def test_the_chosen_port_is_opened_and_closed(self):
+        midi_in = MidiInputStream(
+            get_port=lambda ports: ports.index("port b"),
+            midi_in_factory=self.midi_in_factory)
+        with midi_in:
+            device = self.inputs[0]
+            assert device.port_no == 1
+            assert device.is_open
+            assert device.callback is not None
+        assert not device.is_open
+        assert device.callback is None
+
+    def test_messages_are_yielded_as_realtime_events(self):
+        midi_in, device = self.open_stream()
+        device.receive([0x90, 60, 100], 0.0)
+        device.receive([0xB0, 48, 127], 0.25)
+        device.receive([0x80, 60, 0], 0.5)
+        midi_in.close()
+        events = list(midi_in.to_sequence(controllers=True).events)
+        assert events[0].pitches == [60]
+        assert events[0].meta["realtime"] == "note_on"
+        assert events[0].meta["volume"] == 100
+        assert events[1].meta["cc"] == [(48, 127)]
+        assert events[2].pitches == [60]
+        assert events[2].meta["realtime"] == "note_off"
+        assert events[2].meta["timestamp"] == 0.75
+
+    def test_controller_messages_are_only_yielded_if_requested(self):
+        midi_in, device = self.open_stream()
+        device.receive([0xB0, 48, 127], 0.0)
+        device.receive([0x90, 60, 100], 0.0)
+        midi_in.close()
+        events = list(midi_in.to_sequence().events)
+        assert [e.pitches for e in events] == [[60]]
+        assert midi_in.control_data[48] == 127
+
+    def test_unread_messages_are_bounded(self):
+        midi_in, device = self.open_stream(max_queue=2)
+        for pitch in (60, 62, 64):
+            device.receive([0x90, pitch, 100], 0.0)
+        assert midi_in.get()[1] == [0x90, 62, 100]
+        assert midi_in.get()[1] == [0x90, 64, 100]
+        with self.assertRaises(queue.Empty):
+            midi_in.get(timeout=0)
+        midi_in.close()
+        assert midi_in.get() is None
+
+    def test_it_tracks_active_notes_and_control_data(self):
+        midi_in, device = self.open_stream()
+        device.receive([0x90, 60, 100], 0.0)
+        device.receive([0x90, 64, 100], 0.0)
+        device.receive([0x90, 60, 0], 0.1)
+        device.receive([0xE0, 0, 70], 0.1)
+        assert midi_in.active_notes == {64}
+        assert midi_in.control_data[224] == 70
+        midi_in.close()
+
+    def test_a_closed_stream_can_be_reopened(self):
+        midi_in, device = self.open_stream()
+        device.receive([0x90, 60, 100], 0.5)
+        midi_in.close()
+        midi_in.open()
+        device = self.inputs[-1]
+        with self.assertRaises(queue.Empty):
+            midi_in.get(timeout=0)
+        assert midi_in.active_notes == frozenset()
+        device.receive([0x90, 62, 100], 0.25)
+        assert midi_in.get() == (0.25, [0x90, 62, 100])
+        midi_in.close()
+        assert midi_in.get() is None
+
+
+class FakeMidiOut:
+
+    def __init__(self):
+        self.port_no = None
+        self.sent = []
+        self.is_open = False
+
+    def get_ports(self):
+        return ["port a", "port b"]
+
+    def open_port(self, port_no):
+        self.port_no = port_no
+        self.is_open = True
+
+    def send_message(self, message):
+        self.sent.append(message)
+
+    def close_port(self):
+        self.is_open = False
+
+class RoutedMidiTests(unittest.TestCase):
+
+    def setUp(self):
+        self.outputs = []
+
+    def midi_out_factory(self):
+        output = FakeMidiOut()
+        self.outputs.append(output)
+        return output
+
+    def sent(self):
+        return {output.port_no: output.sent for output in self.outputs}
+
+    def test_tracks_are_spread_across_ports(self):
+        synth = RoutedMidi(
+            get_ports=lambda all_ports: [0, 1],
+            midi_out_factory=self.midi_out_factory)
+        with synth:
+            synth.noteon(1, 60, 100)
+            synth.noteon(18, 62, 90)
+            synth.noteoff(1, 60)
+        assert self.sent() == {
+            0: [[0x90, 60, 100], [0x80, 60, 0]],
+            1: [[0x91, 62, 90]]}
+        # one output per port, all closed
+        assert len(self.outputs) == 2
+        assert not any(output.is_open for output in self.outputs)
+
+    def test_tracks_can_be_routed_explicitly(self):
+        synth = RoutedMidi(
+            get_ports=lambda all_ports: [0, 1],
+            routes={1: (1, 9)},
+            midi_out_factory=self.midi_out_factory)
+        with synth:
+            synth.control_change(1, 7, 64)
+            with self.assertLogs(level="WARNING"):
+                synth.noteon(33, 60, 100)
+        assert self.sent() == {0: [], 1: [[0xB9, 7, 64]]}
+
+    def test_invalid_routes_are_rejected_up_front(self):
+        with self.assertRaises(Exception):
+            RoutedMidi(
+                get_ports=lambda all_ports: [0, 1],
+                routes={1: (2, 0)},
+                midi_out_factory=self.midi_out_factory)
+
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
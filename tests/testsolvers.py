@@ -1,3 +1,8 @@
+import itertools
+import os
+import pickle
+import random
+import tempfile
 import unittest
 
 from composerstoolkit import *
@@ -136,6 +141,612 @@ class TestCLPSolver(unittest.TestCase):
         # )
         # assert len(solution.voices) == 1
         # assert solution.voices[0].duration == 16
+class TestCorpus(unittest.TestCase):
+
+    def _melody_graph(self, pitches):
+        graph = FiniteSequence(events=[
+            Event([p], duration=1) for p in pitches
+        ]).to_graph()
+        edges = list(graph)
+        for left, right in zip(edges, edges[1:]):
+            graph.add_vertex(left, right)
+        return graph
+
+    def test_matches_follow_connected_vectors(self):
+        corpus = Corpus(case_base=[
+            self._melody_graph([60, 62, 64, 60, 62, 65]),
+            self._melody_graph([67, 69, 71])
+        ])
+        matches = corpus.find_matches([(2, 1), (2, 1)])
+        assert [[e.pitch for e in match] for match in matches] == [
+            [60, 62, 64], [67, 69, 71]]
+        matches = corpus.find_matches([(2, 1), (3, 1)])
+        assert [[e.pitch for e in match] for match in matches] == [[60, 62, 65]]
+        assert corpus.find_matches([(2, 1), (4, 1)]) == []
+        assert len(corpus.find_matches([(2, 1)])) == 5
+
+    def test_longest_suffix_and_its_continuations(self):
+        corpus = Corpus(case_base=[
+            self._melody_graph([60, 62, 64, 60, 62, 65]),
+            self._melody_graph([67, 69, 71])
+        ])
+        n_matched, continuations = corpus.continuations([(5, 1), (-4, 1), (2, 1)])
+        assert n_matched == 2
+        assert continuations == {3: {1: 1}}
+        n_matched, continuations = corpus.continuations([(2, 1)])
+        assert n_matched == 1
+        assert continuations == {2: {1: 2}, -4: {1: 1}, 3: {1: 1}}
+        assert corpus.continuations([(7, 1)]) == (0, {})
+
+    def test_case_based_solver_extends_the_source(self):
+        corpus = Corpus(case_base=[self._melody_graph([60, 62, 64, 65, 67, 69])])
+        solver = CaseBasedSolver(
+            source=FiniteSequence([Event([50], 1), Event([52], 1)]),
+            corpus=corpus,
+            target_duration_beats=4)
+        solution, _ = next(solver)
+        assert solution.pitches[:5] == [50, 52, 54, 55, 57]
+
+    def test_case_based_solver_breaks_ties_by_ascending_delta(self):
+        corpus = Corpus(case_base=[
+            self._melody_graph([60, 62, 64, 64, 64, 64]),
+            self._melody_graph([60, 62, 60, 60, 60, 60])
+        ])
+        solver = CaseBasedSolver(
+            source=FiniteSequence([Event([50], 1), Event([52], 1)]),
+            corpus=corpus,
+            target_duration_beats=4)
+        solution, _ = next(solver)
+        assert solution.pitches == [50, 52, 50, 50, 50]
+
+    def test_case_based_solver_budget(self):
+        corpus = Corpus(case_base=[self._melody_graph([60, 62, 64, 65, 67, 69])])
+        statistics = SearchStatistics()
+        solver = CaseBasedSolver(
+            source=FiniteSequence([Event([50], 1), Event([52], 1)]),
+            corpus=corpus,
+            target_duration_beats=4,
+            max_nodes=1,
+            statistics=statistics)
+        solution, _ = next(solver)
+        assert solution.pitches == [50, 52, 54]
+        assert statistics.budget_exhausted
+        assert statistics.nodes == 1
+
+    def test_corpus_can_be_extended_and_saved(self):
+        corpus = Corpus()
+        corpus.add_graph(self._melody_graph([60, 62, 64]))
+        assert len(corpus.find_matches([(2, 1)])) == 2
+        corpus.add_graph(self._melody_graph([50, 52]))
+        graph_ids, origins, destinations = corpus.postings((2, 1))
+        assert graph_ids.tolist() == [0, 0, 1]
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filename = os.path.join(tmp_dir, "corpus.pickle")
+            corpus.save(filename)
+            loaded = Corpus.load(filename)
+        matches = loaded.find_matches([(2, 1)])
+        assert [[e.pitch for e in match] for match in matches] == [
+            [60, 62], [62, 64], [50, 52]]
+
+
+class TestIncrementalConstraints(unittest.TestCase):
+
+    def test_adjacent_pitch_constraints_check_every_pair(self):
+        seq = FiniteSequence([Event([60], 1), Event([62], 1), Event([62], 1)])
+        assert not constraint_no_repeated_adjacent_notes()(seq)
+        chords = FiniteSequence([Event([60, 64], 1), Event([60, 65], 1), Event([59, 62], 1)])
+        assert not constraint_enforce_shared_pitches(min_shared=1)(chords)
+        assert constraint_limit_shared_pitches(max_shared=1)(chords)
+
+    def test_incremental_check_matches_the_constraint(self):
+        constraint = constraint_no_leaps_more_than(2)
+        checker = constraint.incremental()
+        state = checker.init([Event([60], 1)])
+        assert checker.check_append(state, Event([62], 1))
+        assert not checker.check_append(state, Event([65], 1))
+        assert not constraint(FiniteSequence(state.events + [Event([65], 1)]))
+        checker.undo(state)
+        assert state.events == [Event([60], 1)]
+        assert state.duration == 1
+
+    def test_constraints_without_incremental_implementations(self):
+        @Constraint
+        def no_high_notes(seq: FiniteSequence):
+            return max(seq.pitches) < 70
+        assert no_high_notes().incremental() is None
+
+        @no_high_notes.incremental
+        class _NoHighNotes(IncrementalConstraint):
+            def check(self, state, event):
+                return all(pitch < 70 for pitch in event.pitches)
+        checker = no_high_notes().incremental()
+        assert checker.check_append(checker.init(), Event([60], 1))
+
+    def test_backtracking_solver_uses_incremental_constraints(self):
+        seq = backtracking_solver(
+            Event([60], 1),
+            constraints=[
+                constraint_range(minimum=55, maximum=67),
+                constraint_no_leaps_more_than(3),
+                constraint_no_repeated_adjacent_notes(),
+                # no incremental implementation
+                lambda context: len(context.events) < 33
+            ],
+            n_events=32)
+        assert len(seq.events) == 32
+        pitches = seq.pitches
+        assert min(pitches) >= 55 and max(pitches) <= 67
+        assert all(0 < abs(b - a) <= 3 for a, b in zip(pitches, pitches[1:]))
+
+    def test_backtracking_solver_jumps_back_to_the_conflict(self):
+        statistics = SearchStatistics()
+        seq = backtracking_solver(
+            Event([60], 1),
+            constraints=[
+                constraint_no_leaps_more_than(2),
+                constraint_notes_are(12, [76])
+            ],
+            n_events=14,
+            statistics=statistics)
+        pitches = seq.pitches
+        assert pitches[11] == 76
+        assert all(abs(b - a) <= 2 for a, b in zip(pitches, pitches[1:]))
+        assert statistics.nogoods > 0
+        assert statistics.nodes > len(pitches)
+
+    def test_backtracking_solver_exhausts_unsolvable_constraints(self):
+        statistics = SearchStatistics()
+        with self.assertRaises(AllRoutesExhausted):
+            backtracking_solver(
+                Event([60], 1),
+                constraints=[
+                    constraint_no_leaps_more_than(2),
+                    constraint_notes_are(3, [200])
+                ],
+                n_events=4,
+                statistics=statistics)
+        # no earlier pitch is implicated, so the search ends at the first dead-end
+        assert statistics.backtracks == 1
+        assert statistics.nodes < 2 * (NOTE_MAX - NOTE_MIN)
+
+    def test_constraints_publish_pitch_domains(self):
+        assert pitch_range_mask(60, 62) == pitch_mask([60, 61, 62])
+        checker = constraint_no_leaps_more_than(2).incremental()
+        state = checker.init([Event([60], 1)])
+        assert checker.domain(state) == pitch_mask(range(58, 63))
+        checker = constraint_in_set({60, 64, 200}).incremental()
+        assert checker.domain(checker.init()) == pitch_mask([60, 64])
+        statistics = SearchStatistics()
+        seq = backtracking_solver(
+            Event([60], 1),
+            constraints=[
+                constraint_in_set(scales.mode("C", scales.MAJOR)),
+                constraint_no_leaps_more_than(2),
+                constraint_range(minimum=55, maximum=72)
+            ],
+            n_events=16,
+            statistics=statistics)
+        assert set(seq.pitches).issubset(scales.mode("C", scales.MAJOR))
+        # impossible pitches are never generated
+        assert statistics.nodes == 15
+        assert statistics.domain_prunes > 0
+
+class TestHeuristics(unittest.TestCase):
+
+    def test_sine_shape_weights_pitches_within_its_amplitude(self):
+        heuristic = heuristic_sine_shape(axis_pitch=60, amplitude=10, length=4)
+        # the target pitch of the first tick is 70
+        weights = heuristic(0, [69, 70, 71, 80], [1.0, 1.0, 1.0, 1.0])
+        assert weights[1] == 101
+        assert 1 < weights[0] < 101
+        assert weights[2] == 1
+        assert weights[3] == 1
+
+    def test_weight_tables_combine_heuristics(self):
+        heuristics = [heuristic_trend_upwards(60, 2), heuristic_single_pitch(60, 10)]
+        table = weight_table(heuristics, 8)
+        assert table.shape == (8, 128)
+        assert table[3][61] == 1 + 2 + 90
+        assert table[3][59] == 1 + 90
+        assert table[3][100] == 3
+
+    def test_solver_accepts_heuristic_functions(self):
+        def only_high_notes(tick, choices, weights):
+            return [w if pitch > 70 else 0 for pitch, w in zip(choices, weights)]
+        seq = backtracking_solver(
+            Event([60], 1),
+            constraints=[constraint_no_leaps_more_than(12)],
+            heuristics=[heuristic_trend_upwards(60, 2), only_high_notes],
+            n_events=8)
+        assert all(pitch > 70 for pitch in seq.pitches[1:])
+
+class TestPortfolio(unittest.TestCase):
+
+    def test_constraints_can_be_pickled(self):
+        constraint = constraint_in_set({60, 62}, lookback_n_beats=2)
+        copied = pickle.loads(pickle.dumps(constraint))
+        assert repr(copied) == repr(constraint)
+        assert copied(FiniteSequence([Event([60], 1)]))
+        assert copied.incremental() is not None
+
+    def test_portfolio_finds_distinct_solutions(self):
+        result = run_portfolio(
+            backtracking_solver,
+            Event([60], 1),
+            constraints=[
+                constraint_range(minimum=55, maximum=67),
+                constraint_no_leaps_more_than(3)
+            ],
+            n_events=8,
+            n_instances=4,
+            n_workers=2,
+            n_solutions=2,
+            seed=1)
+        assert len(result.solutions) == 2
+        assert result.solutions[0].pitches != result.solutions[1].pitches
+        assert len(result.reports) == 4
+        solved = [report for report in result.reports if report.status == "solved"]
+        assert len(solved) == 2
+        assert solved[0].statistics.nodes >= 7
+
+    def test_portfolio_reports_failures(self):
+        result = run_portfolio(
+            backtracking_solver,
+            Event([60], 1),
+            constraints=[constraint_notes_are(3, [200])],
+            n_events=4,
+            n_instances=2)
+        assert result.solution is None
+        assert [report.status for report in result.reports] == ["failed", "failed"]
+
+class TestSolutionEnumeration(unittest.TestCase):
+
+    def test_solutions_are_distinct(self):
+        solutions = backtracking_solutions(
+            Event([60], 1),
+            constraints=[
+                constraint_range(minimum=55, maximum=67),
+                constraint_no_leaps_more_than(3)
+            ],
+            n_events=6)
+        found = list(itertools.islice(solutions, 20))
+        assert len(found) == 20
+        assert len({tuple(solution.pitches) for solution in found}) == 20
+        for solution in found:
+            assert len(solution.events) == 6
+            assert solution.events[0].pitches == [60]
+
+    def test_solutions_are_exhausted(self):
+        found = list(backtracking_solutions(
+            Event([60], 1),
+            constraints=[constraint_range(minimum=60, maximum=61)],
+            n_events=3))
+        assert sorted(tuple(s.pitches) for s in found) == [
+            (60, 60, 60), (60, 60, 61), (60, 61, 60), (60, 61, 61)]
+
+    def test_solver_returns_first_solution(self):
+        random.seed(3)
+        first = next(backtracking_solutions(
+            Event([60], 1),
+            constraints=[constraint_range(minimum=55, maximum=67)],
+            n_events=4))
+        random.seed(3)
+        solution = backtracking_solver(
+            Event([60], 1),
+            constraints=[constraint_range(minimum=55, maximum=67)],
+            n_events=4)
+        assert solution.pitches == first.pitches
+
+    def test_markov_solutions_are_distinct(self):
+        table = {pc: {i: 1 for i in range(12)} for pc in range(12)}
+        found = list(itertools.islice(backtracking_markov_solutions(
+            Event([60], 1),
+            table,
+            constraints=[constraint_range(minimum=55, maximum=67)],
+            n_events=3), 10))
+        assert len(found) == 10
+        assert len({tuple(s.pitches) for s in found}) == 10
+
+    def test_markov_solutions_skip_dead_paths(self):
+        table = {pc: {i: 1 for i in range(12)} for pc in range(12)}
+        statistics = SearchStatistics()
+        found = list(itertools.islice(backtracking_markov_solutions(
+            Event([60], 1),
+            table,
+            constraints=[constraint_range(minimum=59, maximum=61)],
+            n_events=3,
+            statistics=statistics), 20))
+        # the explored paths are recorded as nogoods, and never re-yielded
+        assert len({tuple(s.pitches) for s in found}) == len(found)
+        assert statistics.nogoods > 0
+        assert statistics.nogood_prunes > 0
+
+    def test_prefetch(self):
+        solutions = backtracking_solutions(
+            Event([60], 1),
+            constraints=[constraint_range(minimum=60, maximum=61)],
+            n_events=3)
+        assert len(list(prefetch(solutions, n_ahead=2))) == 4
+
+    def test_prefetch_raises_solver_errors(self):
+        solutions = backtracking_solutions(
+            Event([50], 1),
+            constraints=[constraint_range(minimum=60, maximum=61)],
+            n_events=3)
+        with self.assertRaises(InputViolatesConstraints):
+            list(prefetch(solutions))
+
+class TestBeamDevelop(unittest.TestCase):
+
+    def setUp(self):
+        self.seed = FiniteSequence([Event([60], 1), Event([62], 1), Event([64], 1)])
+        self.mutators = [transpose(2), transpose(-2), invert(), retrograde(3)]
+        self.constraints = [constraint_range(minimum=48, maximum=72)]
+
+    def test_beam_develop(self):
+        statistics = BeamStatistics()
+        result = beam_develop(
+            self.seed,
+            mutators=self.mutators,
+            constraints=self.constraints,
+            fitness=lambda seq: max(seq.pitches),
+            min_beats=12,
+            beam_width=3,
+            statistics=statistics)
+        assert sum(event.duration for event in result.events) >= 12
+        assert result.events[:3] == self.seed.events
+        assert all(constraint(result) for constraint in self.constraints)
+        # the fitness function favours climbing to the top of the range
+        assert max(result.pitches) == 70
+        assert statistics.steps == 3
+        assert statistics.candidates == 4 + 3 * 4 * 2
+        assert statistics.throughput > 0
+
+    def test_beam_develop_in_parallel(self):
+        kwargs = dict(
+            mutators=self.mutators,
+            constraints=self.constraints,
+            fitness=lambda seq: -abs(sum(seq.pitches) / len(seq.pitches) - 60),
+            min_beats=12)
+        expected = beam_develop(self.seed, **kwargs)
+        result = beam_develop(self.seed, n_workers=2, **kwargs)
+        assert result.events == expected.events
+
+    def test_nested_beam_develop(self):
+        kwargs = dict(
+            mutators=self.mutators,
+            constraints=self.constraints,
+            min_beats=12)
+        expected = beam_develop(self.seed, fitness=lambda seq: max(seq.pitches), **kwargs)
+
+        def fitness(seq):
+            # a nested search, with other options
+            beam_develop(
+                self.seed,
+                mutators=[transpose(-1)],
+                fitness=lambda inner: 0,
+                min_beats=6)
+            return max(seq.pitches)
+
+        result = beam_develop(self.seed, fitness=fitness, **kwargs)
+        assert result.events == expected.events
+
+    def test_beam_develop_dead_end(self):
+        with self.assertRaises(DeadEndReached):
+            beam_develop(
+                self.seed,
+                mutators=[transpose(24)],
+                constraints=self.constraints,
+                fitness=lambda seq: 0,
+                min_beats=12)
+
+    def test_beam_develop_requires_fitness(self):
+        with self.assertRaises(Exception):
+            beam_develop(self.seed, mutators=self.mutators, min_beats=12)
+
+class TestCanons(unittest.TestCase):
+
+    def setUp(self):
+        self.phrase = FiniteSequence([Event([60], 1), Event([62], 1), Event([64], 1)])
+
+    def test_iter_canons(self):
+        canons = list(iter_canons(self.phrase))
+        # 12 intervals * (no displacement, 1 and 2 beats) * (canon, retrograde)
+        assert len(canons) == 72
+        keys = {tuple((tuple(e.pitches), e.duration) for e in c.events) for c in canons}
+        assert len(keys) == 72
+        canon = canons[17]
+        assert canon.meta["canon"] == "retrograde canon at 2 semitones, 2 beats"
+        assert canon.events[0] == Event(duration=2)
+        assert canon.pitches == [66, 64, 62]
+
+    def test_palindromes_are_not_repeated(self):
+        phrase = FiniteSequence([Event([60], 1), Event([62], 1), Event([60], 1)])
+        assert len(list(iter_canons(phrase))) == 36
+
+    def test_canons_obey_constraints(self):
+        constraints = [constraint_in_set({60, 62, 64, 65, 67, 69, 71})]
+        canons = iter_canons(self.phrase, constraints)
+        first = next(canons)
+        assert first.meta["canon"] == "canon at 0 semitones"
+        found = [first] + list(canons)
+        assert all(constraints[0](canon) for canon in found)
+        assert [c.meta["canon"] for c in canon_finder(self.phrase, constraints)]\
+            == [c.meta["canon"] for c in found]
+
+    def test_iter_canons_in_parallel(self):
+        constraints = [constraint_range(minimum=60, maximum=68)]
+        expected = [c.events for c in iter_canons(self.phrase, constraints)]
+        found = [c.events for c in iter_canons(
+            self.phrase, constraints, n_workers=2, chunksize=4)]
+        assert found == expected
+
+    def test_parallel_canon_searches_can_be_interleaved(self):
+        other_phrase = FiniteSequence([Event([67], 1), Event([65], 2)])
+        constraints = [constraint_range(minimum=60, maximum=68)]
+        expected = [c.events for c in iter_canons(self.phrase, constraints)]
+        other_expected = [c.events for c in iter_canons(other_phrase, constraints)]
+        found = []
+        other_found = []
+        for canon, other_canon in itertools.zip_longest(
+            iter_canons(self.phrase, constraints, n_workers=2, chunksize=4),
+            iter_canons(other_phrase, constraints, n_workers=2, chunksize=4)):
+            if canon is not None:
+                found.append(canon.events)
+            if other_canon is not None:
+                other_found.append(other_canon.events)
+        assert found == expected
+        assert other_found == other_expected
+
+class TestSearchBudgets(unittest.TestCase):
+
+    def setUp(self):
+        self.constraints = [
+            constraint_range(minimum=48, maximum=72),
+            constraint_no_leaps_more_than(4)
+        ]
+
+    def test_node_budget_returns_a_partial_solution(self):
+        statistics = SearchStatistics()
+        solution = backtracking_solver(
+            Event([60], 1),
+            constraints=self.constraints,
+            n_events=32,
+            max_nodes=10,
+            statistics=statistics)
+        assert statistics.budget_exhausted
+        assert statistics.nodes == 10
+        assert 1 < len(solution.events) <= 11
+        assert all(constraint(solution) for constraint in self.constraints)
+        assert statistics.checks > 0
+        assert statistics.nodes_per_second > 0
+
+    def test_timeout(self):
+        statistics = SearchStatistics()
+        solution = backtracking_solver(
+            Event([60], 1),
+            constraints=[constraint_notes_are(3, [200])],
+            n_events=6,
+            timeout=0,
+            statistics=statistics)
+        assert statistics.budget_exhausted
+        assert solution.events == [Event([60], 1)]
+
+    def test_unspent_budget(self):
+        statistics = SearchStatistics()
+        solution = backtracking_solver(
+            Event([60], 1),
+            constraints=self.constraints,
+            n_events=8,
+            max_nodes=1000,
+            statistics=statistics)
+        assert not statistics.budget_exhausted
+        assert len(solution.events) == 8
+        with self.assertRaises(AllRoutesExhausted):
+            backtracking_solver(
+                Event([60], 1),
+                constraints=[constraint_notes_are(3, [200])],
+                n_events=6,
+                max_nodes=10000)
+
+    def test_progress(self):
+        reports = []
+        backtracking_solver(
+            Event([60], 1),
+            constraints=self.constraints,
+            n_events=8,
+            progress=lambda statistics: reports.append(statistics.nodes),
+            progress_interval=0)
+        assert len(reports) >= 7
+        assert reports == sorted(reports)
+
+    def test_markov_solver_budget(self):
+        table = {pc: {i: 1 for i in range(12)} for pc in range(12)}
+        statistics = SearchStatistics()
+        solution = backtracking_markov_solver(
+            Event([60], 1),
+            table,
+            constraints=self.constraints,
+            n_events=32,
+            max_nodes=5,
+            statistics=statistics)
+        assert statistics.budget_exhausted
+        assert statistics.nodes == 5
+        assert len(solution.events) <= 6
+
+    def test_develop_budget(self):
+        statistics = SearchStatistics()
+        seed = FiniteSequence([Event([60], 1), Event([62], 1), Event([64], 1)])
+        result = develop(
+            seed,
+            mutators=[transpose(2)],
+            min_beats=100,
+            max_nodes=2,
+            statistics=statistics)
+        assert result.pitches == [60, 62, 64, 62, 64, 66, 64, 66, 68]
+        assert statistics.budget_exhausted
+
+@Constraint
+def _no_three_steps_in_one_direction(sequence):
+    events = sequence.events
+    for a, b, c in zip(events, events[1:], events[2:]):
+        if (b.pitches[-1] - a.pitches[-1]) * (c.pitches[-1] - b.pitches[-1]) > 0:
+            return False
+    return True
+
+@_no_three_steps_in_one_direction.lookback
+def _no_three_steps_lookback():
+    return Lookback(n_events=3)
+
+class TestConstraintCache(unittest.TestCase):
+
+    def test_lookback_declarations(self):
+        assert constraint_no_leaps_more_than(2).lookback() == Lookback(n_events=2)
+        assert constraint_in_set({60}).lookback() == Lookback(n_events=1)
+        assert constraint_in_set({60}, lookback_n_beats=2).lookback() == Lookback(n_beats=2)
+        assert constraint_notes_are(3, [60]).lookback() is None
+        # a window can hold only rests
+        assert constraint_range(minimum=60, maximum=64)(FiniteSequence([Event([], 1)]))
+
+    def test_windows(self):
+        events = [Event([60], 1), Event([62], 2), Event([64], 0), Event([65], 1)]
+        assert Lookback(n_events=2).window(events) == events[2:]
+        assert Lookback(n_events=2).window(events, end=1) == events[:1]
+        assert Lookback(n_beats=1).window(events) == events[2:]
+        assert Lookback(n_beats=2).window(events) == events[1:]
+        assert Lookback(n_beats=10).window(events) == events
+
+    def test_cached_results_match_the_constraints(self):
+        random.seed(2)
+        constraints = [
+            constraint_in_set({60, 62, 64}, lookback_n_beats=2),
+            constraint_no_repeated_adjacent_notes(),
+            constraint_no_leaps_more_than(2),
+            constraint_range(minimum=60, maximum=64)
+        ]
+        cache = ConstraintCache()
+        for _ in range(500):
+            events = [Event([random.choice([60, 62, 64, 65])], random.choice([0.5, 1, 2]))
+                for _ in range(random.randint(1, 6))]
+            for constraint in constraints:
+                if constraint(FiniteSequence(events[:-1])):
+                    assert cache.check(constraint, events) == constraint(FiniteSequence(events))
+        assert cache.hits > 0
+
+    def test_solver_uses_the_cache(self):
+        cache = ConstraintCache()
+        constraints = [
+            constraint_range(minimum=55, maximum=67),
+            constraint_no_leaps_more_than(2),
+            _no_three_steps_in_one_direction()
+        ]
+        solution = backtracking_solver(
+            Event([60], 1),
+            constraints=constraints,
+            n_events=64,
+            cache=cache)
+        assert all(constraint(solution) for constraint in constraints)
+        assert cache.hits > 0
 
 if __name__ == "__main__":
     unittest.main()